@@ -1,9 +1,57 @@
 # app.py
-from flask import Flask, request, jsonify, render_template
-from chatbot_llm import generate_response
+import json
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from chatbot_llm import generate_response, generate_response_stream, llm_flight, llm_backend_stats, StreamError
+from models import init_db, remove_session, pool_stats
+from db_context import context_cache, context_flight
+from llm_cache import llm_cache
+from memory import memory_store
+from chat_writer import chat_history_writer
+from concurrency import llm_admission
+from telemetry import start_request, finish_request, render_metrics
+from warmup import warm_up, warm_up_enabled
+from batch import parse_request_body, run_batch
+from transcript_search import get_transcript_search
+from hr_summary import summary_table_enabled, rebuild_department_summary
+from employee_digest import digest_table_enabled, rebuild_employee_digests
 
 app = Flask(__name__)
 
+# Return the request's database session to the pool when the request ends.
+app.teardown_appcontext(remove_session)
+
+@app.before_request
+def start_trace():
+    g.trace = start_request(f"{request.method} {request.path}")
+
+@app.after_request
+def finish_trace(response):
+    # For /chat/stream this covers the request up to the first byte of the stream.
+    if "trace" in g:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        finish_request(g.pop("trace"), endpoint, request.method, response.status_code)
+    return response
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create the database tables."""
+    init_db()
+    if summary_table_enabled():
+        rebuild_department_summary()
+    if digest_table_enabled():
+        rebuild_employee_digests()
+    print("Database tables created.")
+
+@app.cli.command("rebuild-employee-digests")
+def rebuild_employee_digests_command():
+    """Recompute every employee's digest (EMPLOYEE_DIGEST_TABLE=1)."""
+    print(f"Rebuilt digests for {rebuild_employee_digests()} employees.")
+
+@app.cli.command("warm-up")
+def warm_up_command():
+    """Open database connections and build the in-process indexes and caches."""
+    print(json.dumps(warm_up()))
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -13,6 +61,7 @@ def chat():
     role = request.form.get("role", "").lower()
     query = request.form.get("query", "")
     user_name = request.form.get("name", "") if role in ["employee", "hr"] else None
+    session_id = request.form.get("session_id") or None
 
     if not query:
         return jsonify({"response": "Please provide a valid query."}), 400
@@ -20,8 +69,83 @@ def chat():
     if role == "employee" and not user_name:
         return jsonify({"response": "Please provide your name to retrieve employee data."}), 400
 
-    response = generate_response(query, role, user_name)
+    response = generate_response(query, role, user_name, session_id=session_id)
     return jsonify({"response": response})
 
+def _sse(data: dict, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Same inputs as /chat; the answer is pushed as Server-Sent Events:
+    one {"delta": ...} event per streamed chunk, then a "done" event with the full response,
+    or an "error" event ({"error": message}) if the answer could not be finished.
+    """
+    role = request.form.get("role", "").lower()
+    query = request.form.get("query", "")
+    user_name = request.form.get("name", "") if role in ["employee", "hr"] else None
+    session_id = request.form.get("session_id") or None
+
+    if not query:
+        return jsonify({"response": "Please provide a valid query."}), 400
+
+    if role == "employee" and not user_name:
+        return jsonify({"response": "Please provide your name to retrieve employee data."}), 400
+
+    def events():
+        parts = []
+        try:
+            for delta in generate_response_stream(query, role, user_name, session_id=session_id):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except StreamError as e:
+            yield _sse({"error": str(e)}, event="error")
+            return
+        yield _sse({"response": "".join(parts).strip()}, event="done")
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """
+    Answer many items at once. The body is JSON ({"items": [...]}) or JSONL, one
+    {"role", "name", "query", "id"} item per line; ?concurrency=N sets how many run at once.
+    Results are streamed back as JSONL in the order they complete (see batch.py).
+    """
+    try:
+        items = parse_request_body(request.get_data(as_text=True), request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    concurrency = request.args.get("concurrency", type=int)
+
+    def results():
+        for result in run_batch(items, concurrency):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(results()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no"})
+
+@app.route("/stats")
+def stats():
+    return jsonify({"db_pool": pool_stats(), "context_cache": context_cache.stats(),
+                    "llm_cache": llm_cache.stats(), "memory": memory_store.stats(),
+                    "transcript_search": get_transcript_search().stats(),
+                    "chat_history_writer": chat_history_writer.stats(),
+                    "llm_admission": llm_admission.stats(), "llm_backends": llm_backend_stats(),
+                    "coalescing": {"llm": llm_flight.stats(), "context": context_flight.stats()}})
+
+@app.route("/metrics")
+def metrics():
+    """Request, span and SQL latency histograms in the Prometheus text format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# With CHATBOT_WARM_UP=1, each worker warms up when it loads the app, before serving traffic.
+if warm_up_enabled():
+    warm_up()
+
 if __name__ == "__main__":
+    init_db()
     app.run(debug=True)
@@ -0,0 +1,126 @@
+# asgi.py
+# ASGI version of the chatbot app. Serve it with an ASGI server, e.g.:
+#   hypercorn asgi:app --workers 2
+# Database context parts are fetched concurrently on the async driver and LLM calls are
+# awaited, so each worker overlaps many in-flight chats instead of using a thread per request.
+import asyncio
+import json
+from quart import Quart, Response, g, request, jsonify, render_template
+from chatbot_llm import agenerate_response, agenerate_response_stream, allm_flight, llm_backend_stats, StreamError
+from models import pool_stats
+from db_context import context_cache
+from async_context import acontext_flight
+from llm_cache import llm_cache
+from memory import memory_store
+from chat_writer import chat_history_writer
+from concurrency import llm_admission
+from telemetry import start_request, finish_request, render_metrics
+from warmup import warm_up, warm_up_enabled
+from batch import parse_request_body, arun_batch
+from transcript_search import get_transcript_search
+
+app = Quart(__name__)
+
+@app.before_request
+async def start_trace():
+    g.trace = start_request(f"{request.method} {request.path}")
+
+@app.after_request
+async def finish_trace(response):
+    if "trace" in g:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        finish_request(g.pop("trace"), endpoint, request.method, response.status_code)
+    return response
+
+@app.before_serving
+async def warm_up_worker():
+    """With CHATBOT_WARM_UP=1, warm up before accepting requests."""
+    if warm_up_enabled():
+        await asyncio.to_thread(warm_up)
+
+@app.after_serving
+async def flush_chat_history():
+    """Write any queued chat turns before the worker exits."""
+    chat_history_writer.close()
+
+async def _chat_params():
+    form = await request.form
+    role = form.get("role", "").lower()
+    query = form.get("query", "")
+    user_name = form.get("name", "") if role in ["employee", "hr"] else None
+    session_id = form.get("session_id") or None
+
+    if not query:
+        return None, (jsonify({"response": "Please provide a valid query."}), 400)
+
+    if role == "employee" and not user_name:
+        return None, (jsonify({"response": "Please provide your name to retrieve employee data."}), 400)
+
+    return (query, role, user_name, session_id), None
+
+def _sse(data: dict, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.route("/")
+async def index():
+    return await render_template("index.html")
+
+@app.route("/chat", methods=["POST"])
+async def chat():
+    params, error = await _chat_params()
+    if error:
+        return error
+    query, role, user_name, session_id = params
+    response = await agenerate_response(query, role, user_name, session_id=session_id)
+    return jsonify({"response": response})
+
+@app.route("/chat/stream", methods=["POST"])
+async def chat_stream():
+    params, error = await _chat_params()
+    if error:
+        return error
+
+    query, role, user_name, session_id = params
+
+    async def events():
+        parts = []
+        try:
+            async for delta in agenerate_response_stream(query, role, user_name, session_id=session_id):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except StreamError as e:
+            yield _sse({"error": str(e)}, event="error")
+            return
+        yield _sse({"response": "".join(parts).strip()}, event="done")
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/chat/batch", methods=["POST"])
+async def chat_batch():
+    """Same as the Flask app's /chat/batch: JSON or JSONL items in, JSONL results out as they complete."""
+    try:
+        items = parse_request_body(await request.get_data(as_text=True), request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    concurrency = request.args.get("concurrency", type=int)
+
+    async def results():
+        async for result in arun_batch(items, concurrency):
+            yield json.dumps(result) + "\n"
+
+    return Response(results(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.route("/stats")
+async def stats():
+    return jsonify({"db_pool": pool_stats(), "context_cache": context_cache.stats(),
+                    "llm_cache": llm_cache.stats(), "memory": memory_store.stats(),
+                    "transcript_search": get_transcript_search().stats(),
+                    "chat_history_writer": chat_history_writer.stats(),
+                    "llm_admission": llm_admission.stats(), "llm_backends": llm_backend_stats(),
+                    "coalescing": {"llm": allm_flight.stats(), "context": acontext_flight.stats()}})
+
+@app.route("/metrics")
+async def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,69 @@
+# async_context.py
+import asyncio
+import logging
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from models import get_async_engine
+from db_context import context_parts, context_cache, _context_key
+from user_index import resolve_user, user_index
+from telemetry import traced
+from concurrency import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+_async_session_factory = None
+# Async counterpart of db_context.context_flight.
+acontext_flight = AsyncSingleFlight("context")
+
+def get_async_sessionmaker():
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(get_async_engine(), expire_on_commit=False)
+    return _async_session_factory
+
+async def run_with_session(fn, *args, **kwargs):
+    """
+    Run a sync function taking a Session (e.g. a db_tool function or a context part) on the
+    async driver, without blocking the event loop or using a thread. Each call gets its own
+    AsyncSession, so several calls can run concurrently.
+    """
+    async with get_async_sessionmaker()() as session:
+        return await session.run_sync(fn, *args, **kwargs)
+
+def _resolve_fresh(user_name: str = None):
+    user_index.ensure_fresh()
+    return resolve_user(user_name) if user_name else None
+
+async def aresolve_user(user_name: str = None):
+    """
+    resolve_user on a worker thread, since refreshing the user name index is a blocking
+    query. Also refreshes the index when no name is given, so that intent classification
+    (which looks names up in it) does not refresh it on the event loop.
+    """
+    return await asyncio.to_thread(_resolve_fresh, user_name)
+
+async def _evaluate_part(part) -> str:
+    if isinstance(part, str):
+        return part
+    return await run_with_session(part)
+
+@traced("retrieve_db_context")
+async def aretrieve_db_context(role: str, user_identifier: str = None, user=None) -> str:
+    """
+    Async counterpart of retrieve_db_context: the independent context parts (profile,
+    performance records, transcript excerpts, ...) are fetched concurrently.
+    Shares context_cache with the sync path; concurrent misses for the same context share one build.
+    """
+    if user is None and user_identifier and (role.lower() in ("employee", "hr")):
+        user = await aresolve_user(user_identifier.strip())
+    key = _context_key(role, user_identifier, user)
+    info = context_cache.get(key)
+    if info is None:
+        info = await acontext_flight.do(key, lambda: _abuild_and_cache(key, role, user_identifier, user))
+    return info
+
+async def _abuild_and_cache(key, role: str, user_identifier: str = None, user=None) -> str:
+    generation = context_cache.generation
+    parts = context_parts(role, user_identifier, user)
+    info = "".join(await asyncio.gather(*[_evaluate_part(part) for part in parts]))
+    context_cache.set(key, info, generation=generation)
+    return info
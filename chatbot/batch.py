@@ -0,0 +1,280 @@
+# batch.py
+# Batch chat: answer many (role, name, query) items in one call, e.g. HR's weekly per-employee
+# narratives. Employee contexts are built for the whole batch with a few bulk queries (see
+# employee_digest.py), LLM calls run with bounded concurrency, and results are yielded in the
+# order items complete. Each result carries the item's "id" (its index by default).
+# Items go to the LLM: batches are mostly free-form requests ("Write a short weekly performance
+# narrative.") that the intent classifier would otherwise answer with a canned lookup. Set
+# "lookup": true on an item to answer it from a db_tool lookup when the query is one.
+#
+# Served as POST /chat/batch, or from the command line:
+#   python batch.py --input items.jsonl [--output results.jsonl] [--concurrency 8]
+#   python batch.py --all-employees --query "Write a short weekly performance narrative." [--department Sales]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import select
+# chatbot_llm loads the .env file, so it is imported before the modules that read settings.
+from chatbot_llm import answer_with_tool, chain_inputs_with_context, call_llm, acall_llm
+from db_context import retrieve_db_context
+from employee_digest import load_digests, format_digest
+from llm_cache import is_cacheable, make_cache_key
+from chat_writer import chat_history_writer, chat_history_enabled
+from concurrency import AdmissionTimeout
+from models import get_engine, remove_session, UserInfo
+from user_index import resolve_user
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("employee", "manager", "hr")
+MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# How often an item retries when every LLM call slot stays busy for LLM_QUEUE_TIMEOUT.
+ADMISSION_RETRIES = 3
+
+def parse_items(items) -> list:
+    """
+    Validate a list of {"role", "query", "name"?, "id"?, "lookup"?} dicts. Returns normalized items;
+    raises ValueError describing the first invalid one.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("Provide a non-empty list of items.")
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"A batch may contain at most {MAX_ITEMS} items.")
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"Item {index} is not an object.")
+        role = str(item.get("role", "")).lower()
+        query = str(item.get("query") or "").strip()
+        name = str(item.get("name") or "").strip() if role in ("employee", "hr") else ""
+        if role not in ROLES:
+            raise ValueError(f"Item {index}: role must be one of {', '.join(ROLES)}.")
+        if not query:
+            raise ValueError(f"Item {index}: please provide a valid query.")
+        if role == "employee" and not name:
+            raise ValueError(f"Item {index}: employee items need a name.")
+        parsed.append({"id": item.get("id", index), "role": role, "name": name or None, "query": query,
+                       "lookup": item.get("lookup") is True})
+    return parsed
+
+def parse_request_body(body: str, mimetype: str = None) -> list:
+    """Items from a JSON body ({"items": [...]} or a list) or a JSONL body (one item per line)."""
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        try:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSONL: {e}")
+    else:
+        try:
+            items = json.loads(body or "null")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(items, dict):
+            items = items.get("items")
+    return parse_items(items)
+
+def prepare_contexts(items: list) -> dict:
+    """
+    Resolve every named user from the in-memory user index and build the database context of
+    each distinct (role, user) in the batch: employee contexts come from the stored digests,
+    or are computed for the whole batch at once; role-wide contexts come from
+    retrieve_db_context (and its cache). Returns {("person", user id) or (role, None): context}
+    and sets item["user"].
+    """
+    users = {}
+    for item in items:
+        item["user"] = resolve_user(item["name"]) if item["name"] else None
+        if item["user"]:
+            users[item["user"].id] = item["user"]
+
+    contexts = {}
+    if users:
+        with get_engine().connect() as connection:
+            digests = load_digests(connection, {user_id: user.name for user_id, user in users.items()})
+        for user_id, user in users.items():
+            contexts[("person", user_id)] = (
+                f"Employee Profile: {user.name}, Email: {user.email}, "
+                f"Department: {user.department}, Role: {user.role}.\n" + format_digest(user, digests[user_id]))
+    for role in {item["role"] for item in items if not item["name"]}:
+        contexts[(role, None)] = retrieve_db_context(role)
+    return contexts
+
+def _concurrency(concurrency: int = None) -> int:
+    return min(max(1, concurrency or DEFAULT_CONCURRENCY), MAX_CONCURRENCY)
+
+def _item_context(item: dict, contexts: dict):
+    if item["name"]:
+        return contexts.get(("person", item["user"].id)) if item["user"] else None
+    return contexts[(item["role"], None)]
+
+def _result(item: dict, started: float, response: str = None, error: str = None) -> dict:
+    result = {"id": item["id"], "role": item["role"], "name": item["name"], "query": item["query"]}
+    if error is not None:
+        result["error"] = error
+    else:
+        result["response"] = response
+    result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+def _llm_inputs(item: dict, context: str, session=None):
+    inputs = chain_inputs_with_context(item["query"], item["role"], context, item["name"], item["user"],
+                                       session=session)
+    cache_key = make_cache_key(item["query"], item["role"], inputs["context"]) \
+        if is_cacheable(item["query"], item["role"]) else None
+    return inputs, cache_key
+
+def _record(batch_id: str, item: dict, response: str) -> None:
+    if chat_history_enabled():
+        chat_history_writer.record(batch_id, item["user"].id if item["user"] else None, item["query"], response)
+
+def _answer(item: dict, contexts: dict, batch_id: str) -> dict:
+    started = time.perf_counter()
+    try:
+        if item["name"] and not item["user"]:
+            return _result(item, started, error=f"No record found for employee '{item['name']}'.")
+        response = answer_with_tool(item["query"], item["role"], item["name"], item["user"]) \
+            if item["lookup"] else None
+        if response is None:
+            inputs, cache_key = _llm_inputs(item, _item_context(item, contexts))
+            for attempt in range(ADMISSION_RETRIES + 1):
+                try:
+                    response = call_llm(inputs, cache_key)
+                    break
+                except AdmissionTimeout:
+                    if attempt == ADMISSION_RETRIES:
+                        raise
+        _record(batch_id, item, response)
+        return _result(item, started, response)
+    except Exception as e:
+        logger.error(f"Error answering batch item {item['id']}: {e}")
+        return _result(item, started, error=str(e) or e.__class__.__name__)
+    finally:
+        remove_session()
+
+def run_batch(items: list, concurrency: int = None):
+    """
+    Answer parsed items (see parse_items) on up to `concurrency` threads (at most
+    BATCH_MAX_CONCURRENCY; LLM calls are also subject to llm_admission), yielding one result
+    dict per item as it completes: {"id", "role", "name", "query", "response" or "error", "ms"}.
+    """
+    batch_id = f"batch-{uuid.uuid4().hex[:12]}"
+    concurrency = _concurrency(concurrency)
+    started = time.perf_counter()
+    contexts = prepare_contexts(items)
+    logger.info(f"Batch {batch_id}: {len(items)} items, contexts ready in "
+                f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat-batch") as executor:
+        futures = [executor.submit(_answer, item, contexts, batch_id) for item in items]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Stop queued items if the caller stops reading (e.g. the client disconnected).
+            for future in futures:
+                future.cancel()
+
+async def _aanswer(item: dict, contexts: dict, batch_id: str, semaphore) -> dict:
+    # Imported here so the sync app does not need the asyncio database drivers.
+    from async_context import run_with_session
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            if item["name"] and not item["user"]:
+                return _result(item, started, error=f"No record found for employee '{item['name']}'.")
+            response = None
+            if item["lookup"]:
+                response = await run_with_session(
+                    lambda session: answer_with_tool(item["query"], item["role"], item["name"], item["user"],
+                                                     session=session))
+            if response is None:
+                inputs, cache_key = await run_with_session(
+                    lambda session: _llm_inputs(item, _item_context(item, contexts), session=session))
+                for attempt in range(ADMISSION_RETRIES + 1):
+                    try:
+                        response = await acall_llm(inputs, cache_key)
+                        break
+                    except AdmissionTimeout:
+                        if attempt == ADMISSION_RETRIES:
+                            raise
+            # The chat history writer may block when its queue is full.
+            await asyncio.to_thread(_record, batch_id, item, response)
+            return _result(item, started, response)
+        except Exception as e:
+            logger.error(f"Error answering batch item {item['id']}: {e}")
+            return _result(item, started, error=str(e) or e.__class__.__name__)
+
+async def arun_batch(items: list, concurrency: int = None):
+    """
+    Async counterpart of run_batch for the ASGI app. Contexts are prepared on a worker thread;
+    up to `concurrency` items are answered at once on the event loop.
+    """
+    batch_id = f"batch-{uuid.uuid4().hex[:12]}"
+    semaphore = asyncio.Semaphore(_concurrency(concurrency))
+    contexts = await asyncio.to_thread(prepare_contexts, items)
+    tasks = [asyncio.ensure_future(_aanswer(item, contexts, batch_id, semaphore)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def employee_items(role: str, query: str, department: str = None) -> list:
+    """One item per employee (optionally in one department), for report generation."""
+    statement = select(UserInfo.id, UserInfo.name).order_by(UserInfo.id)
+    if department:
+        statement = statement.where(UserInfo.department == department)
+    with get_engine().connect() as connection:
+        return [{"id": row.id, "role": role, "name": row.name, "query": query}
+                for row in connection.execute(statement)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a batch of chatbot queries and write JSONL results")
+    parser.add_argument("--input", help="JSONL file of items ({\"role\", \"name\", \"query\", \"id\", \"lookup\"}); - for stdin")
+    parser.add_argument("--all-employees", action="store_true", help="One item per employee instead of --input")
+    parser.add_argument("--role", default="hr", help="Role for --all-employees items")
+    parser.add_argument("--query", help="Query for --all-employees items")
+    parser.add_argument("--department", help="Only employees of this department (--all-employees)")
+    parser.add_argument("--output", default="-", help="Where to write JSONL results; - for stdout")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Items answered at once")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL environment variable is not set.")
+    if args.all_employees:
+        if not args.query:
+            sys.exit("--all-employees needs --query")
+        raw_items = employee_items(args.role, args.query, args.department)
+    elif args.input:
+        source = sys.stdin if args.input == "-" else open(args.input)
+        with source:
+            raw_items = [json.loads(line) for line in source if line.strip()]
+    else:
+        sys.exit("Provide --input or --all-employees")
+    try:
+        items = parse_items(raw_items)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    start = time.perf_counter()
+    errors = 0
+    with output:
+        for result in run_batch(items, args.concurrency):
+            errors += "error" in result
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    chat_history_writer.close()
+    print(f"{len(items)} items in {time.perf_counter() - start:.1f}s, {errors} errors", file=sys.stderr)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,90 @@
+"""
+Boot-time benchmark for the chatbot worker.
+
+Runs `python -X importtime -c "import app"` a few times, reports wall time and the slowest
+imports, and exits non-zero if loading the app pulls in a heavy module (LLM client libraries,
+numpy, ...) or exceeds the time budget. With --warm-up it also times warmup.warm_up()
+against DATABASE_URL, step by step.
+Usage:
+    python bench_boot.py [--runs 5] [--budget-ms 1200] [--top 10] [--warm-up]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Modules that must not be imported just to load the app; they load on first use.
+FORBIDDEN_MODULES = ("langchain", "langchain_core", "langchain_groq", "groq", "numpy", "quart")
+
+CHATBOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The `-X importtime` parser is shared with the transcription CLI's startup benchmark.
+sys.path.insert(0, os.path.join(os.path.dirname(CHATBOT_DIR), "transcription_app"))
+from bench_startup import parse_importtime
+
+
+def run_once(code, env):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=CHATBOT_DIR,
+                          capture_output=True, text=True, env=env)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        sys.exit(f"FAIL: worker failed to start (exit code {proc.returncode})")
+    return elapsed_ms, parse_importtime(proc.stderr), proc.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chatbot worker boot time")
+    parser.add_argument("--runs", type=int, default=5, help="Number of app imports to time")
+    parser.add_argument("--budget-ms", type=float, default=1200.0, help="Maximum allowed median boot time")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to report")
+    parser.add_argument("--warm-up", action="store_true", help="Also time warmup.warm_up() against DATABASE_URL")
+    args = parser.parse_args()
+
+    # Loading the app must not need credentials or a reachable database.
+    env = dict(os.environ, CHATBOT_WARM_UP="0")
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    env.pop("GROQ_API_KEY", None)
+
+    timings = []
+    imports = []
+    for _ in range(args.runs):
+        elapsed_ms, imports, _ = run_once("import app", env)
+        timings.append(elapsed_ms)
+    timings.sort()
+    median_ms = timings[len(timings) // 2]
+
+    print(f"Boot time over {args.runs} runs: median {median_ms:.1f} ms, "
+          f"min {timings[0]:.1f} ms, max {timings[-1]:.1f} ms")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda i: i[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:16.2f} {self_us / 1000:10.2f}  {name}")
+
+    if args.warm_up:
+        warm_env = dict(os.environ, CHATBOT_WARM_UP="0")
+        _, _, stdout = run_once("import json, app, warmup; print(json.dumps(warmup.warm_up()))", warm_env)
+        steps = json.loads(stdout.strip().splitlines()[-1])
+        print(f"Warm-up: {sum(steps.values()):.1f} ms")
+        for name, ms in steps.items():
+            print(f"{ms:16.1f}  {name}")
+
+    failures = []
+    imported = {name for name, _, _ in imports}
+    heavy = sorted(m for m in imported if m.split(".")[0] in FORBIDDEN_MODULES)
+    if heavy:
+        failures.append(f"heavy modules imported at boot: {', '.join(heavy)}")
+    if median_ms > args.budget_ms:
+        failures.append(f"median boot {median_ms:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: boot is within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# chat_writer.py
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from models import get_engine, has_column, ChatHistory
+
+logger = logging.getLogger(__name__)
+
+def chat_history_enabled() -> bool:
+    return os.getenv("CHAT_HISTORY_PERSIST", "1").lower() not in ("0", "false", "no")
+
+class ChatHistoryWriter:
+    """
+    Writes chat turns to the chat_history table from a background thread, so requests
+    normally never wait on the INSERT. Rows are queued and inserted in batches of up to
+    `batch_size`, at least every `flush_interval` seconds.
+
+    The queue holds at most `max_queue` turns. When the database falls behind and the queue
+    stays full for `put_timeout` seconds, record() writes the turn itself, which slows that
+    request down instead of losing the turn. Turns recorded after close() are also written
+    directly. Queued rows are flushed when the process exits. If chat_history predates the
+    session_id column, turns are saved without it until `flask --app app init-db` has added it.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None, max_queue: int = None,
+                 put_timeout: float = None, database_url: str = None):
+        self.batch_size = batch_size or int(os.getenv("CHAT_WRITER_BATCH_SIZE", "100"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("CHAT_WRITER_FLUSH_INTERVAL", "1"))
+        self.put_timeout = put_timeout if put_timeout is not None else float(os.getenv("CHAT_WRITER_PUT_TIMEOUT", "0.5"))
+        self.database_url = database_url
+        self._queue = queue.Queue(maxsize=max_queue or int(os.getenv("CHAT_WRITER_MAX_QUEUE", "10000")))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.written = 0
+        self.failed = 0
+        self.inline = 0
+        self._warned_schema = False
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def record(self, session_id: str, user_id: int, query: str, response: str) -> None:
+        """
+        Queue one chat turn (the user's message and the bot's reply). Blocks for up to
+        put_timeout while the queue is full, then writes the turn directly.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {"session_id": session_id, "user_id": user_id, "message_type": "user", "message": query, "created_at": now},
+            {"session_id": session_id, "user_id": user_id, "message_type": "bot", "message": response, "created_at": now},
+        ]
+        if not self._stopping.is_set():
+            self._ensure_started()
+            try:
+                # Both rows of a turn go in as one item so a batch never splits a turn.
+                self._queue.put(rows, timeout=self.put_timeout)
+                return
+            except queue.Full:
+                logger.warning("Chat history queue is full; writing the turn directly")
+        self.inline += 1
+        self._write_batch(rows)
+
+    def _rows_for_schema(self, rows: list) -> list:
+        # Tables created before chat sessions were added have no session_id column.
+        if has_column("chat_history", "session_id", self.database_url):
+            return rows
+        if not self._warned_schema:
+            self._warned_schema = True
+            logger.error("chat_history has no session_id column; chat history is saved without sessions. "
+                         "Run `flask --app app init-db` to upgrade the table.")
+        return [{k: v for k, v in row.items() if k != "session_id"} for row in rows]
+
+    def _insert(self, rows: list) -> bool:
+        try:
+            rows = self._rows_for_schema(rows)
+            with get_engine(self.database_url).begin() as connection:
+                connection.execute(insert(ChatHistory), rows)
+            self.written += len(rows)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving chat history: {e}")
+            return False
+
+    def _write_batch(self, rows: list) -> None:
+        for attempt in range(3):
+            if self._insert(rows):
+                return
+            time.sleep(0.5 * 2 ** attempt)
+        self.failed += len(rows)
+        logger.error(f"Dropped {len(rows)} chat history rows after repeated errors")
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                turns = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Collect more turns until the batch is full or flush_interval has passed.
+            deadline = time.monotonic() + self.flush_interval
+            while len(turns) * 2 < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping.is_set() and self._queue.empty():
+                    break
+                try:
+                    turns.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch([row for turn in turns for row in turn])
+            for _ in turns:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Wait until every turn queued so far has been written (or timeout)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop the writer after flushing the queue."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Chat history writer did not finish; {self._queue.qsize()} turns still queued")
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "failed": self.failed,
+                "inline": self.inline}
+
+chat_history_writer = ChatHistoryWriter()
@@ -1,30 +1,30 @@
 # chatbot_llm.py
+import asyncio
 import logging
 import re
-import os
+import threading
 from dotenv import load_dotenv
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from langchain.schema import HumanMessage, AIMessage
+
+# Load environment variables before the modules below read their settings.
+load_dotenv()
+
 from db_context import retrieve_db_context
 from db_tool import (
-    get_user_id_by_name, 
-    get_employee_performance_by_name, 
+    get_user_id, 
+    get_employee_performance_by_id, 
     get_recent_meeting_transcripts, 
     get_department_roster, 
     get_meeting_participants, 
-    get_skill_recommendations_by_name
+    get_skill_recommendations_by_id
 )
-
-# Load environment variables
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable is not set. Please check your .env file.")
-
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set.")
+from user_index import resolve_user, user_index
+from intent import classify
+from transcript_search import relevant_transcript_context
+from llm_cache import llm_cache, is_cacheable, make_cache_key
+from memory import memory_store
+from chat_writer import chat_history_writer, chat_history_enabled
+from telemetry import span
+from concurrency import SingleFlight, AsyncSingleFlight, AdmissionTimeout, llm_admission
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,103 +36,443 @@ def truncate_to_last_sentence(text: str) -> str:
         return match.group(1).strip()
     return text.strip()
 
-# Initialize ChatGroq
-llm = ChatGroq(
-    temperature=0.7,
-    model_name="llama-3.3-70b-versatile",  # Use a supported model.
-    groq_api_key=GROQ_API_KEY
-)
+_chat_prompt = None
+chain = None  # built on first use by get_chain(), or replaced with set_chain()
+_router = None
+_chain_lock = threading.Lock()
 
-# Build a ChatPromptTemplate with clear instructions.
-chat_prompt = ChatPromptTemplate.from_messages([
-    ("system", "{context}"),
-    ("system", "Previous Conversation:\n{chat_history}"),
-    ("human", "User Query: {query}\nPlease answer ONLY using the provided database information. Do not add extra details or assumptions.")
-])
+def get_chat_prompt():
+    """The ChatPromptTemplate with clear instructions, built on first use."""
+    global _chat_prompt
+    if _chat_prompt is None:
+        from langchain_core.prompts import ChatPromptTemplate
+        _chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", "{context}"),
+            ("system", "Previous Conversation:\n{chat_history}"),
+            ("human", "User Query: {query}\nPlease answer ONLY using the provided database information. Do not add extra details or assumptions.")
+        ])
+    return _chat_prompt
 
-# Simple in-memory chat message history.
-class SimpleInMemoryChatMessageHistory:
-    def __init__(self):
-        self.messages = []
-    def add_user_message(self, message: str) -> None:
-        self.messages.append(HumanMessage(content=message))
-    def add_ai_message(self, message: str) -> None:
-        self.messages.append(AIMessage(content=message))
-    def clear(self) -> None:
-        self.messages = []
+def get_chain():
+    """
+    Return the prompt | LLM chain, building the backend router (llm_backends.py) on first use.
+    The router spreads calls over LLM_BACKENDS with timeouts, hedging and circuit breakers.
+    Raises ValueError if a configured provider is unknown.
+    """
+    global chain, _router
+    if chain is None:
+        with _chain_lock:
+            if chain is None:
+                # Imported here so that loading the app does not load LangChain.
+                from llm_backends import build_router
+                _router = build_router()
+                # Compose the chain using the runnable syntax.
+                chain = get_chat_prompt() | _router
+    return chain
+
+def warm_up_llm() -> None:
+    """Build the chain and every backend's LLM client (used by warmup.py)."""
+    get_chain()
+    if _router is not None:
+        _router.build_clients()
+
+def llm_backend_stats() -> dict:
+    """Router and per-backend state for /stats; empty until the chain is built."""
+    return _router.stats() if _router is not None else {}
+
+def set_chain(new_chain) -> None:
+    """Replace the chain, e.g. with a stub LLM for tests or load tests."""
+    global chain
+    chain = new_chain
 
-memory = SimpleInMemoryChatMessageHistory()
+# Concurrent cacheable requests with the same cache key wait for one LLM call (see _cache_key).
+llm_flight = SingleFlight("llm")
+allm_flight = AsyncSingleFlight("llm")
 
-# Compose the chain using the runnable syntax.
-chain = chat_prompt | llm
+BUSY_MESSAGE = "The assistant is busy right now. Please try again in a moment."
+ERROR_MESSAGE = "I'm sorry, I encountered an error while processing your request."
 
-def generate_response(query: str, role: str, user_name: str = None) -> str:
+class StreamError(Exception):
     """
-    Generate a chatbot response based on the user query.
-    Prioritizes using db_tools functions for specific data retrieval before querying LLM.
+    Raised by the response streams when the answer cannot be finished (LLM error or no free
+    LLM call slot), possibly after part of it was yielded. str() is the message for the user.
     """
-    query_lower = query.lower()
 
-    # If a specific tool can handle the request, use it directly.
-    if "employee id" in query_lower or "user id" in query_lower:
-        return get_user_id_by_name(user_name) if user_name else "Please provide an employee name."
-    elif "performance" in query_lower and ("detail" in query_lower or "records" in query_lower):
-        return get_employee_performance_by_name(user_name) if user_name else "Please provide an employee name."
-    elif "recommended skills" in query_lower:
-        return get_skill_recommendations_by_name(user_name) if user_name else "Please provide an employee name."
-    elif "meeting transcript" in query_lower and "recent" in query_lower:
-        return get_recent_meeting_transcripts(meeting_id=1)  # Example meeting ID
-    elif "department roster" in query_lower:
-        return get_department_roster(department="Engineering")  # Example department
-    elif "meeting participants" in query_lower:
-        return get_meeting_participants(meeting_id=1)  # Example meeting ID
-    
-    # Otherwise, build context for a general query.
+# Used when a tool query does not name a meeting or department.
+DEFAULT_MEETING_ID = 1
+DEFAULT_DEPARTMENT = "Engineering"
+
+def answer_with_tool(query: str, role: str, user_name: str = None, user=None, session=None):
+    """
+    Answer directly from a db_tool function when the local intent classifier (intent.py)
+    maps the query to one of the supported lookups with enough confidence.
+    Returns None when the query needs the LLM.
+    Employees only ever get their own records, whoever the query names.
+    """
+    with span("intent"):
+        intent = classify(query, user_index)
+    if intent.name is None:
+        return None
+
+    # For HR and managers, an employee named in the query takes precedence over the one given
+    # with the request.
+    if intent.params.get("user") and role.lower() != "employee":
+        user, user_name = intent.params["user"], intent.params["user"].name
+    not_found = f"No record found for employee '{user_name.strip()}'." if user_name else None
+
+    if intent.name == "user_id":
+        if not user_name:
+            return "Please provide an employee name."
+        return get_user_id(user) if user else not_found
+    elif intent.name == "performance":
+        if not user_name:
+            return "Please provide an employee name."
+        return get_employee_performance_by_id(user.id, user.name, session=session) if user else not_found
+    elif intent.name == "skills":
+        if not user_name:
+            return "Please provide an employee name."
+        return get_skill_recommendations_by_id(user.id, user.name, session=session) if user else not_found
+    elif intent.name == "meeting_transcripts":
+        return get_recent_meeting_transcripts(meeting_id=intent.params.get("meeting_id") or DEFAULT_MEETING_ID,
+                                              session=session)
+    elif intent.name == "department_roster":
+        department = intent.params.get("department") or (user.department if user else None) or DEFAULT_DEPARTMENT
+        return get_department_roster(department=department, session=session)
+    elif intent.name == "meeting_participants":
+        return get_meeting_participants(meeting_id=intent.params.get("meeting_id") or DEFAULT_MEETING_ID,
+                                        session=session)
+    return None
+
+def role_instructions(role: str, user_name: str = None) -> str:
+    """
+    System instructions for the given role.
+    """
     if role.lower() == "employee":
-        context = (
+        return (
             f"You are an assistant for employees. The employee's name is {user_name}. "
             "Provide only information available from the database context. If no record is found, say so."
         )
     elif role.lower() == "manager":
-        context = (
+        return (
             "You are an assistant for managers. Provide insights solely from the database context about meeting transcripts or performance."
         )
     elif role.lower() == "hr":
         if user_name:
-            context = (
+            return (
                 f"You are an HR assistant. The query is regarding employee {user_name}. "
                 "Provide only the available data from the database for this employee."
             )
         else:
-            context = (
+            return (
                 "You are an HR assistant. Provide comprehensive details solely from the database context about employee performance and roster."
             )
     else:
-        context = "You are a helpful assistant. Provide only the available database information."
-    
-    db_context = retrieve_db_context(role, user_name)
+        return "You are a helpful assistant. Provide only the available database information."
+
+def _chain_inputs(query: str, context: str, db_context: str, memory=None) -> dict:
     full_context = f"{context}\nDatabase Info:\n{db_context}"
     
-    logger.info(f"Received query for role '{role}': {query}")
-    chat_history_text = "\n".join([msg.content for msg in memory.messages])
+    # Bounded by the session memory's ring buffer and token budget (see memory.py).
+    chat_history_text = memory.history_text() if memory is not None else ""
     
-    inputs = {
+    return {
         "context": full_context,
         "chat_history": chat_history_text,
         "query": query
     }
+
+def _relevant_passages(query: str, role: str, user=None, session=None) -> str:
+    # Employees only see passages they spoke themselves.
+    if role.lower() == "employee":
+        if not user:
+            return ""
+        return relevant_transcript_context(query, speaker=user.name, session=session)
+    return relevant_transcript_context(query, session=session)
+
+def build_chain_inputs(query: str, role: str, user_name: str = None, user=None, memory=None) -> dict:
+    """
+    Build the prompt inputs (role instructions + database context + chat history) for a general query.
+    """
+    return chain_inputs_with_context(query, role, retrieve_db_context(role, user_name, user=user),
+                                     user_name, user, memory)
+
+def chain_inputs_with_context(query: str, role: str, db_context: str, user_name: str = None, user=None,
+                              memory=None, session=None) -> dict:
+    """
+    Like build_chain_inputs, for a database context the caller already has (e.g. batch.py's
+    bulk-built contexts). Relevant transcript passages are still looked up for the query.
+    """
+    db_context += _relevant_passages(query, role, user, session=session)
+    return _chain_inputs(query, role_instructions(role, user_name), db_context, memory)
+
+def _cache_key(query: str, role: str, inputs: dict, memory):
+    # Identical non-personal questions over the same context and recent history reuse the cached answer.
+    if not is_cacheable(query, role):
+        return None
+    return make_cache_key(query, role, inputs["context"], memory.messages)
+
+def _remember(session_id: str, memory, query: str, response: str, user=None) -> None:
+    memory_store.append(session_id, memory, query, response)
+    # Durable history for audits, written in batches off the request path.
+    if chat_history_enabled():
+        chat_history_writer.record(session_id, user.id if user else None, query, response)
+
+def _response_text(response) -> str:
+    response_text = response.content if hasattr(response, "content") else str(response)
+    return truncate_to_last_sentence(response_text)
+
+def _invoke_llm(inputs: dict, cache_key: str = None) -> str:
+    """Call the LLM within the admission limit and cache the trimmed answer under cache_key."""
+    with llm_admission.slot(), span("llm.invoke"):
+        final_response = _response_text(get_chain().invoke(inputs))
+    if cache_key:
+        llm_cache.set(cache_key, final_response)
+    return final_response
+
+async def _ainvoke_llm(inputs: dict, cache_key: str = None) -> str:
+    async with llm_admission.aslot():
+        with span("llm.invoke"):
+            final_response = _response_text(await get_chain().ainvoke(inputs))
+    if cache_key:
+        await llm_cache.aset(cache_key, final_response)
+    return final_response
+
+def call_llm(inputs: dict, cache_key: str = None) -> str:
+    """
+    Answer prompt inputs with the LLM and return the trimmed text. With a cache_key, the answer
+    is cached and concurrent calls with the same key share one LLM call. Raises AdmissionTimeout
+    when no LLM call slot frees up in time.
+    """
+    if cache_key:
+        return llm_flight.do(cache_key, lambda: _invoke_llm(inputs, cache_key))
+    return _invoke_llm(inputs)
+
+async def acall_llm(inputs: dict, cache_key: str = None) -> str:
+    """Async counterpart of call_llm."""
+    if cache_key:
+        return await allm_flight.do(cache_key, lambda: _ainvoke_llm(inputs, cache_key))
+    return await _ainvoke_llm(inputs)
+
+def generate_response(query: str, role: str, user_name: str = None, session_id: str = None) -> str:
+    """
+    Generate a chatbot response based on the user query.
+    Prioritizes using db_tools functions for specific data retrieval before querying LLM.
+    Chat history is kept per session_id; without one, the query is answered without history.
+    Identical cacheable queries arriving together share one LLM call, and LLM calls are
+    limited by llm_admission (concurrency.py).
+    """
+    memory = memory_store.get(session_id)
+    # Resolve the named employee once; every tool and the context below reuse it.
+    user = resolve_user(user_name) if user_name else None
+
+    # If a specific tool can handle the request, use it directly.
+    tool_response = answer_with_tool(query, role, user_name, user)
+    if tool_response is not None:
+        _remember(session_id, memory, query, tool_response, user)
+        return tool_response
+    
+    # Otherwise, build context for a general query.
+    inputs = build_chain_inputs(query, role, user_name, user, memory)
+    logger.info(f"Received query for role '{role}': {query}")
+
+    cache_key = _cache_key(query, role, inputs, memory)
+    if cache_key:
+        cached_response = llm_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("Serving response from LLM cache")
+            _remember(session_id, memory, query, cached_response, user)
+            return cached_response
     
     try:
-        response = chain.invoke(inputs)
-        response_text = response.content if hasattr(response, "content") else str(response)
-        final_response = truncate_to_last_sentence(response_text)
+        final_response = call_llm(inputs, cache_key)
         logger.info(f"Generated response: {final_response}")
-        memory.add_user_message(query)
-        memory.add_ai_message(final_response)
+        _remember(session_id, memory, query, final_response, user)
         return final_response
+    except AdmissionTimeout:
+        return BUSY_MESSAGE
     except Exception as e:
         logger.error(f"Error generating response: {e}")
-        return "I'm sorry, I encountered an error while processing your request."
+        return ERROR_MESSAGE
+
+class SentenceTrimmer:
+    """
+    Incremental counterpart of truncate_to_last_sentence for streamed output, so /chat and
+    /chat/stream give the same text (they share LLM cache entries).
+    truncate_to_last_sentence of the text so far is always a prefix of its result for the
+    full text: a sentence end whose remainder already holds more than one word can never be
+    chosen later. feed() therefore returns what that prefix has gained since the last call,
+    and finish() returns the rest of the final trim.
+    """
+
+    def __init__(self):
+        self.received = ""
+        self.emitted = ""
+
+    def _advance(self) -> str:
+        safe = truncate_to_last_sentence(self.received)
+        ready, self.emitted = safe[len(self.emitted):], safe
+        return ready
+
+    def feed(self, text: str) -> str:
+        self.received += text
+        return self._advance()
+
+    def finish(self) -> str:
+        return self._advance()
+
+    @property
+    def text(self) -> str:
+        return self.emitted
+
+def generate_response_stream(query: str, role: str, user_name: str = None, llm_chain=None, session_id: str = None):
+    """
+    Streaming variant of generate_response: yields the answer as text chunks while the LLM
+    generates it, trimmed incrementally by SentenceTrimmer. Tool answers and cache hits are
+    yielded in one chunk. Raises StreamError if the answer cannot be finished, so the caller
+    can report it apart from the chunks already sent.
+    Pass llm_chain to stream from a different runnable (e.g. a fake LLM in tests).
+    """
+    memory = memory_store.get(session_id)
+    user = resolve_user(user_name) if user_name else None
+
+    tool_response = answer_with_tool(query, role, user_name, user)
+    if tool_response is not None:
+        _remember(session_id, memory, query, tool_response, user)
+        yield tool_response
+        return
+
+    inputs = build_chain_inputs(query, role, user_name, user, memory)
+    logger.info(f"Received streaming query for role '{role}': {query}")
+
+    cache_key = _cache_key(query, role, inputs, memory)
+    if cache_key:
+        cached_response = llm_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("Serving response from LLM cache")
+            _remember(session_id, memory, query, cached_response, user)
+            yield cached_response
+            return
+
+    trimmer = SentenceTrimmer()
+    try:
+        with llm_admission.slot(), span("llm.stream"):
+            for chunk in (llm_chain or get_chain()).stream(inputs):
+                ready = trimmer.feed(chunk.content if hasattr(chunk, "content") else str(chunk))
+                if ready:
+                    yield ready
+        tail = trimmer.finish()
+        if tail:
+            yield tail
+    except AdmissionTimeout:
+        raise StreamError(BUSY_MESSAGE) from None
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        raise StreamError(ERROR_MESSAGE) from e
+
+    final_response = trimmer.text
+    logger.info(f"Generated response: {final_response}")
+    if cache_key:
+        llm_cache.set(cache_key, final_response)
+    _remember(session_id, memory, query, final_response, user)
+
+async def abuild_chain_inputs(query: str, role: str, user_name: str = None, user=None, memory=None) -> dict:
+    """
+    Async counterpart of build_chain_inputs; the context parts are fetched concurrently.
+    """
+    # Imported here so the sync app does not need the asyncio database drivers.
+    from async_context import aretrieve_db_context
+    # Passage search embeds and scores on the CPU, so it runs on a worker thread (with its own
+    # session) rather than on the event loop.
+    db_context, passages = await asyncio.gather(
+        aretrieve_db_context(role, user_name, user=user),
+        asyncio.to_thread(_relevant_passages, query, role, user))
+    db_context += passages
+    return _chain_inputs(query, role_instructions(role, user_name), db_context, memory)
+
+async def agenerate_response(query: str, role: str, user_name: str = None, session_id: str = None) -> str:
+    """
+    Async counterpart of generate_response for the ASGI app (asgi.py). Database work runs on the
+    async driver and the LLM call is awaited, so one worker can serve many chats at once.
+    """
+    from async_context import run_with_session, aresolve_user
+    memory = await asyncio.to_thread(memory_store.get, session_id)
+    user = await aresolve_user(user_name)
+
+    tool_response = await run_with_session(lambda session: answer_with_tool(query, role, user_name, user, session=session))
+    if tool_response is not None:
+        await asyncio.to_thread(_remember, session_id, memory, query, tool_response, user)
+        return tool_response
+
+    inputs = await abuild_chain_inputs(query, role, user_name, user, memory)
+    logger.info(f"Received query for role '{role}': {query}")
+
+    cache_key = _cache_key(query, role, inputs, memory)
+    if cache_key:
+        cached_response = await llm_cache.aget(cache_key)
+        if cached_response is not None:
+            logger.info("Serving response from LLM cache")
+            await asyncio.to_thread(_remember, session_id, memory, query, cached_response, user)
+            return cached_response
+
+    try:
+        final_response = await acall_llm(inputs, cache_key)
+        logger.info(f"Generated response: {final_response}")
+        await asyncio.to_thread(_remember, session_id, memory, query, final_response, user)
+        return final_response
+    except AdmissionTimeout:
+        return BUSY_MESSAGE
+    except Exception as e:
+        logger.error(f"Error generating response: {e}")
+        return ERROR_MESSAGE
+
+async def agenerate_response_stream(query: str, role: str, user_name: str = None, llm_chain=None, session_id: str = None):
+    """
+    Async counterpart of generate_response_stream.
+    """
+    from async_context import run_with_session, aresolve_user
+    memory = await asyncio.to_thread(memory_store.get, session_id)
+    user = await aresolve_user(user_name)
+
+    tool_response = await run_with_session(lambda session: answer_with_tool(query, role, user_name, user, session=session))
+    if tool_response is not None:
+        await asyncio.to_thread(_remember, session_id, memory, query, tool_response, user)
+        yield tool_response
+        return
+
+    inputs = await abuild_chain_inputs(query, role, user_name, user, memory)
+    logger.info(f"Received streaming query for role '{role}': {query}")
+
+    cache_key = _cache_key(query, role, inputs, memory)
+    if cache_key:
+        cached_response = await llm_cache.aget(cache_key)
+        if cached_response is not None:
+            logger.info("Serving response from LLM cache")
+            await asyncio.to_thread(_remember, session_id, memory, query, cached_response, user)
+            yield cached_response
+            return
+
+    trimmer = SentenceTrimmer()
+    try:
+        async with llm_admission.aslot():
+            with span("llm.stream"):
+                async for chunk in (llm_chain or get_chain()).astream(inputs):
+                    ready = trimmer.feed(chunk.content if hasattr(chunk, "content") else str(chunk))
+                    if ready:
+                        yield ready
+        tail = trimmer.finish()
+        if tail:
+            yield tail
+    except AdmissionTimeout:
+        raise StreamError(BUSY_MESSAGE) from None
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        raise StreamError(ERROR_MESSAGE) from e
+
+    final_response = trimmer.text
+    logger.info(f"Generated response: {final_response}")
+    if cache_key:
+        await llm_cache.aset(cache_key, final_response)
+    await asyncio.to_thread(_remember, session_id, memory, query, final_response, user)
 
 # if __name__ == "__main__":
 #     sample_query = "How is Alice performaing?"
@@ -0,0 +1,184 @@
+# concurrency.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from telemetry import Gauge, METRICS, span
+
+logger = logging.getLogger(__name__)
+
+coalesced_requests = Gauge("chatbot_coalesced_requests_total",
+                           "Requests that waited on an identical in-flight computation instead of running their own.",
+                           ("flight",), kind="counter")
+llm_queue_depth = Gauge("chatbot_llm_queue_depth", "Requests waiting for an LLM call slot.")
+llm_in_flight = Gauge("chatbot_llm_in_flight", "LLM calls currently running.")
+llm_admission_timeouts = Gauge("chatbot_llm_admission_timeouts_total",
+                               "Requests turned away after waiting too long for an LLM call slot.", kind="counter")
+METRICS.extend([coalesced_requests, llm_queue_depth, llm_in_flight, llm_admission_timeouts])
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key (for threads): the first caller runs the
+    function, callers arriving while it runs wait for it and get the same result or exception.
+    Nothing is remembered once the call finishes; caching is left to the caller.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}  # key -> _Call
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            coalesced_requests.inc(1, self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+class AsyncSingleFlight:
+    """
+    Async counterpart of SingleFlight for one event loop. The first caller's coroutine runs as
+    a task that every caller awaits, so a caller that is cancelled (e.g. the client went away)
+    does not cancel the computation for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}  # key -> asyncio.Task
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            coalesced_requests.inc(1, self.name)
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller was cancelled
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+class AdmissionTimeout(Exception):
+    """Raised when no LLM call slot became free within the admission timeout."""
+
+class AdmissionLimiter:
+    """
+    Caps the number of concurrent LLM calls at `max_concurrency` (LLM_MAX_CONCURRENCY; 0 means
+    no limit). Further calls queue for up to `timeout` seconds (LLM_QUEUE_TIMEOUT) and then
+    fail with AdmissionTimeout, which keeps both the provider's rate limit and the queueing
+    delay bounded. slot() is for threads, aslot() for the event loop.
+    """
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None):
+        self.max_concurrency = max_concurrency if max_concurrency is not None else int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency) if self.max_concurrency else None
+        self._async_semaphore = None  # created on first use, inside the running loop
+        self.admitted = 0
+        self.timeouts = 0
+
+    def _admitted(self) -> None:
+        self.admitted += 1
+        llm_in_flight.inc()
+
+    def _timed_out(self, waited: float):
+        self.timeouts += 1
+        llm_admission_timeouts.inc()
+        logger.warning(f"No LLM call slot free after {waited:.1f}s "
+                       f"({self.max_concurrency} running, {llm_queue_depth.value():.0f} waiting)")
+        return AdmissionTimeout(f"LLM concurrency limit ({self.max_concurrency}) reached")
+
+    @contextmanager
+    def slot(self):
+        if self._semaphore is None:
+            yield
+            return
+        start = time.monotonic()
+        llm_queue_depth.inc()
+        try:
+            with span("llm.admission"):
+                acquired = self._semaphore.acquire(timeout=self.timeout)
+        finally:
+            llm_queue_depth.dec()
+        if not acquired:
+            raise self._timed_out(time.monotonic() - start)
+        self._admitted()
+        try:
+            yield
+        finally:
+            llm_in_flight.dec()
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        if not self.max_concurrency:
+            yield
+            return
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.monotonic()
+        llm_queue_depth.inc()
+        try:
+            with span("llm.admission"):
+                await asyncio.wait_for(self._async_semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(time.monotonic() - start)
+        finally:
+            llm_queue_depth.dec()
+        self._admitted()
+        try:
+            yield
+        finally:
+            llm_in_flight.dec()
+            self._async_semaphore.release()
+
+    def stats(self) -> dict:
+        return {"max_concurrency": self.max_concurrency, "timeout": self.timeout,
+                "in_flight": llm_in_flight.value(), "queue_depth": llm_queue_depth.value(),
+                "admitted": self.admitted, "timeouts": self.timeouts}
+
+llm_admission = AdmissionLimiter()
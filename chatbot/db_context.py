@@ -1,73 +1,153 @@
 # db_context.py
 import logging
-from sqlalchemy import desc
-from models import get_session, UserInfo, LearningTranscript, UserPerformance
-from db_tool import get_employee_performance_by_name  # Reuse tool for detailed performance
+import os
+from sqlalchemy import desc, event, func
+from sqlalchemy.orm import Session as OrmSession
+from models import (session_scope, UserInfo, LearningTranscript, UserPerformance, MeetingParticipant, Skills,
+                    UserSkillRecommendation)
+from db_tool import get_employee_performance_by_id  # Reuse tool for detailed performance
+from user_index import resolve_user, normalize_name
+from cache import TTLCache
+from hr_summary import build_hr_overview
+# Imported before the cache listeners below are registered, so digests are refreshed before
+# the cached contexts built from them are invalidated.
+from employee_digest import digest_table_enabled, employee_digest_context
+from telemetry import traced
+from concurrency import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-def retrieve_db_context(role: str, user_identifier: str = None) -> str:
+# Context strings keyed by (role, user id or normalized name). Entries expire after
+# CONTEXT_CACHE_TTL seconds and are invalidated when the data behind them is written.
+context_cache = TTLCache(maxsize=int(os.getenv("CONTEXT_CACHE_SIZE", "1024")),
+                         ttl=float(os.getenv("CONTEXT_CACHE_TTL", "60")))
+# Concurrent misses on the same key build the context once.
+context_flight = SingleFlight("context")
+
+def _context_key(role: str, user_identifier: str = None, user=None):
+    if user is not None:
+        return (role.lower(), user.id)
+    return (role.lower(), normalize_name(user_identifier) or None)
+
+@traced("retrieve_db_context")
+def retrieve_db_context(role: str, user_identifier: str = None, user=None) -> str:
     """
     Retrieve context from the database based on the user's role and name.
+    Results are served from context_cache when possible, and concurrent misses for the
+    same context share one build.
+    Pass the request's already resolved user (see user_index.resolve_user) as `user`
+    to avoid resolving the name again.
+    """
+    if user is None and user_identifier and (role.lower() in ("employee", "hr")):
+        user = resolve_user(user_identifier.strip())
+    key = _context_key(role, user_identifier, user)
+    info = context_cache.get(key)
+    if info is None:
+        info = context_flight.do(key, lambda: _build_and_cache(key, role, user_identifier, user))
+    return info
+
+def _build_and_cache(key, role: str, user_identifier: str = None, user=None) -> str:
+    # Not cached if a commit invalidated the cache while the context was being built.
+    generation = context_cache.generation
+    info = _build_db_context(role, user_identifier, user)
+    context_cache.set(key, info, generation=generation)
+    return info
+
+def _employee_transcript_excerpts(session, user) -> str:
+    transcripts = session.query(func.substr(LearningTranscript.transcript, 1, 50)).filter(
+        LearningTranscript.speaker_label.ilike(f"%{user.name}%")
+    ).order_by(desc(LearningTranscript.created_at)).limit(3).all()
+    if transcripts:
+        excerpts = " | ".join([t[0] for t in transcripts])
+        return f"Recent Transcript Excerpts: {excerpts}.\n"
+    return "No transcript excerpts found for this employee.\n"
+
+def _live_employee_context(session, user) -> str:
+    # Used for employees without a digest yet.
+    return (get_employee_performance_by_id(user.id, user.name, session=session) + "\n"
+            + _employee_transcript_excerpts(session, user))
+
+def _recent_meeting_excerpts(session) -> str:
+    transcripts = session.query(func.substr(LearningTranscript.transcript, 1, 50))\
+                         .order_by(desc(LearningTranscript.created_at)).limit(3).all()
+    if transcripts:
+        excerpts = " | ".join([t[0] for t in transcripts])
+        return f"Recent Meeting Transcript Excerpts: {excerpts}.\n"
+    return "No recent transcripts available.\n"
+
+def context_parts(role: str, user_identifier: str = None, user=None) -> list:
+    """
+    Describe the context for a role as an ordered list of parts. Each part is either a
+    string or a function taking a session and returning a string. The parts are independent,
+    so the async path (async_context.py) can fetch them concurrently.
     
     For employees (or if HR specifies an employee name):
-      - Fetch the user's basic profile (including email, department, role).
-      - Append detailed performance records using the tool from db_tools.py.
-      - Retrieve recent transcript excerpts.
+      - The user's basic profile (including email, department, role).
+      - Detailed performance records using the tool from db_tools.py.
+      - Recent transcript excerpts.
+      With EMPLOYEE_DIGEST_TABLE=1, everything but the profile comes from the employee's
+      precomputed digest instead (see employee_digest.py): score statistics and trend, the
+      latest scores and excerpts, recommended skills and meeting count, in one primary-key lookup.
     
     For managers:
-      - Retrieve recent meeting transcript excerpts.
+      - Recent meeting transcript excerpts.
     
     For HR without a specified employee name:
-      - Return the overall employee roster and overall average performance score.
+      - Headcount, a capped employee roster, the overall average performance score
+        and a per-department rollup, all from aggregate queries (see hr_summary.py).
     """
-    session = get_session()
-    info = ""
-    
     if (role.lower() == "employee" or (role.lower() == "hr" and user_identifier)) and user_identifier:
         user_identifier = user_identifier.strip()
-        # Retrieve the user record.
-        user = session.query(UserInfo).filter(UserInfo.name.ilike(f'%{user_identifier}%')).first()
-        if user:
-            logger.info(f"Found user: {user.name}")
-            info += (f"Employee Profile: {user.name}, Email: {user.email}, "
-                     f"Department: {user.department}, Role: {user.role}.\n")
+        if not user:
+            return [f"No record found for employee '{user_identifier}'.\n"]
+        logger.info(f"Found user: {user.name}")
+        if digest_table_enabled():
+            return [
+                (f"Employee Profile: {user.name}, Email: {user.email}, "
+                 f"Department: {user.department}, Role: {user.role}.\n"),
+                lambda session: employee_digest_context(session, user) or _live_employee_context(session, user),
+            ]
+        return [
+            (f"Employee Profile: {user.name}, Email: {user.email}, "
+             f"Department: {user.department}, Role: {user.role}.\n"),
             # Delegate performance details to the DB tool.
-            performance_details = get_employee_performance_by_name(user_identifier)
-            info += performance_details + "\n"
-            # Retrieve recent transcript excerpts.
-            transcripts = session.query(LearningTranscript).filter(
-                LearningTranscript.speaker_label.ilike(f"%{user.name}%")
-            ).order_by(desc(LearningTranscript.created_at)).limit(3).all()
-            if transcripts:
-                excerpts = " | ".join([t.transcript[:50] for t in transcripts])
-                info += f"Recent Transcript Excerpts: {excerpts}.\n"
-            else:
-                info += "No transcript excerpts found for this employee.\n"
-        else:
-            info += f"No record found for employee '{user_identifier}'.\n"
+            lambda session: get_employee_performance_by_id(user.id, user.name, session=session) + "\n",
+            lambda session: _employee_transcript_excerpts(session, user),
+        ]
     elif role.lower() == "manager":
-        transcripts = session.query(LearningTranscript).order_by(desc(LearningTranscript.created_at)).limit(3).all()
-        if transcripts:
-            excerpts = " | ".join([t.transcript[:50] for t in transcripts])
-            info += f"Recent Meeting Transcript Excerpts: {excerpts}.\n"
-        else:
-            info += "No recent transcripts available.\n"
+        return [_recent_meeting_excerpts]
     elif role.lower() == "hr" and not user_identifier:
-        users = session.query(UserInfo).all()
-        if users:
-            roster = " | ".join([f"{u.name} ({u.role})" for u in users])
-            info += f"Employee Roster: {roster}.\n"
-        else:
-            info += "No user records available.\n"
-        performances = session.query(UserPerformance).all()
-        if performances:
-            avg_score = sum([p.performance_score for p in performances]) / len(performances)
-            info += f"Overall Average Performance Score: {avg_score:.2f}.\n"
-        else:
-            info += "No performance data available.\n"
+        return [build_hr_overview]
+    return ["No role-specific context available.\n"]
+
+def _build_db_context(role: str, user_identifier: str = None, user=None) -> str:
+    """
+    Build the context string for retrieve_db_context by evaluating its parts on one session.
+    """
+    with session_scope() as session:
+        return "".join(part if isinstance(part, str) else part(session)
+                       for part in context_parts(role, user_identifier, user))
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_context_writes(session, flush_context):
+    """Record which cached contexts this session's writes affect; applied on commit."""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (LearningTranscript, UserInfo, Skills)):
+            session.info.setdefault("context_cache_touched", set()).add("*")
+        elif isinstance(obj, (UserPerformance, UserSkillRecommendation, MeetingParticipant)):
+            session.info.setdefault("context_cache_touched", set()).add(obj.user_id)
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_context_cache(session):
+    touched = session.info.pop("context_cache_touched", None)
+    if not touched:
+        return
+    if "*" in touched:
+        context_cache.clear()
     else:
-        info += "No role-specific context available.\n"
-    
-    session.close()
-    return info
+        # These rows change that user's context (and performance rows the HR-wide averages).
+        context_cache.invalidate(lambda key: key[1] in touched or key[1] is None)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_context_writes(session):
+    session.info.pop("context_cache_touched", None)
@@ -17,115 +17,125 @@
 
 # db_tools.py
 import logging
-from sqlalchemy import desc
-from models import get_session, UserInfo, UserPerformance, LearningTranscript, MeetingParticipant, UserSkillRecommendation, Skills
+from sqlalchemy import desc, func
+from models import session_scope, UserInfo, UserPerformance, LearningTranscript, MeetingParticipant, UserSkillRecommendation, Skills
+from user_index import resolve_user
+from telemetry import traced
 
 logger = logging.getLogger(__name__)
 
+# Functions that query the database accept an optional `session`; without one they use
+# (and close) the current request's session.
+
+def get_user_id(user) -> str:
+    """
+    Report the user ID for an already resolved user.
+    """
+    return f"Employee ID for {user.name} is {user.id}."
+
 def get_user_id_by_name(user_name: str) -> str:
     """
-    Retrieve the user ID for the given user name using case-insensitive partial matching.
+    Retrieve the user ID for the given user name using the in-memory name index.
     """
-    session = get_session()
     user_name = user_name.strip()
-    user = session.query(UserInfo).filter(UserInfo.name.ilike(f'%{user_name}%')).first()
-    session.close()
+    user = resolve_user(user_name)
     if user:
-        return f"Employee ID for {user.name} is {user.id}."
+        return get_user_id(user)
     else:
         return f"No record found for employee '{user_name}'."
 
+@traced("db_tool.get_employee_performance_by_id")
+def get_employee_performance_by_id(user_id: int, user_name: str, session=None) -> str:
+    """
+    Retrieve detailed performance data for an employee given their user id.
+    Returns a summary of performance scores and dates.
+    """
+    with session_scope(session) as session:
+        performances = session.query(UserPerformance.performance_score, UserPerformance.performance_date)\
+                              .filter(UserPerformance.user_id == user_id)\
+                              .order_by(UserPerformance.performance_date).all()
+    if performances:
+        details = "\n".join([f"Score: {p.performance_score}, Date: {p.performance_date}" for p in performances])
+        return f"Performance records for {user_name}:\n{details}"
+    return f"No performance records found for {user_name}."
+
 def get_employee_performance_by_name(user_name: str) -> str:
     """
     Retrieve detailed performance data for an employee given their name.
     Returns a summary of performance scores and dates.
     """
-    session = get_session()
     user_name = user_name.strip()
-    user = session.query(UserInfo).filter(UserInfo.name.ilike(f'%{user_name}%')).first()
-    response = ""
-    if user:
-        performances = session.query(UserPerformance).filter(UserPerformance.user_id == user.id).all()
-        if performances:
-            details = "\n".join([f"Score: {p.performance_score}, Date: {p.performance_date}" for p in performances])
-            response = f"Performance records for {user.name}:\n{details}"
-        else:
-            response = f"No performance records found for {user.name}."
-    else:
-        response = f"No record found for employee '{user_name}'."
-    session.close()
-    return response
+    user = resolve_user(user_name)
+    if not user:
+        return f"No record found for employee '{user_name}'."
+    return get_employee_performance_by_id(user.id, user.name)
 
-def get_recent_meeting_transcripts(meeting_id: int, limit: int = 3) -> str:
+@traced("db_tool.get_recent_meeting_transcripts")
+def get_recent_meeting_transcripts(meeting_id: int, limit: int = 3, session=None) -> str:
     """
     Retrieve transcript excerpts for a specific meeting.
+    Only the first 50 characters of each transcript are fetched from the database.
     """
-    session = get_session()
-    transcripts = session.query(LearningTranscript).filter(LearningTranscript.meeting_id == meeting_id)\
-                  .order_by(desc(LearningTranscript.created_at)).limit(limit).all()
-    session.close()
-    if transcripts:
-        excerpts = " | ".join([t.transcript[:50] for t in transcripts])
-        return f"Recent Transcript Excerpts: {excerpts}"
+    with session_scope(session) as session:
+        excerpts = session.query(func.substr(LearningTranscript.transcript, 1, 50))\
+                          .filter(LearningTranscript.meeting_id == meeting_id)\
+                          .order_by(desc(LearningTranscript.created_at)).limit(limit).all()
+    if excerpts:
+        return "Recent Transcript Excerpts: " + " | ".join([e[0] for e in excerpts])
     else:
         return "No transcript data available for this meeting."
 
-def get_department_roster(department: str) -> str:
+@traced("db_tool.get_department_roster")
+def get_department_roster(department: str, session=None) -> str:
     """
     Retrieve a list of employees in a given department.
     """
-    session = get_session()
-    department = department.strip()
-    users = session.query(UserInfo).filter(UserInfo.department.ilike(f'%{department}%')).all()
-    session.close()
+    with session_scope(session) as session:
+        department = department.strip()
+        users = session.query(UserInfo.name, UserInfo.role).filter(UserInfo.department.ilike(f'%{department}%')).all()
     if users:
         roster = " | ".join([f"{u.name} ({u.role})" for u in users])
         return f"Department Roster for {department}: {roster}"
     else:
         return f"No employees found in department '{department}'."
 
-def get_meeting_participants(meeting_id: int) -> str:
+@traced("db_tool.get_meeting_participants")
+def get_meeting_participants(meeting_id: int, session=None) -> str:
     """
     Retrieve a list of names of all participants in a specific meeting.
+    Participants and their names are fetched with one join.
     """
-    from models import MeetingParticipant  # Imported here for clarity
-    session = get_session()
-    participants = session.query(MeetingParticipant).filter(MeetingParticipant.meeting_id == meeting_id).all()
-    session.close()
-    if participants:
-        # For each participant, fetch the user record to get the name.
-        names = []
-        session = get_session()
-        for part in participants:
-            user = session.query(UserInfo).filter(UserInfo.id == part.user_id).first()
-            if user:
-                names.append(user.name)
-        session.close()
-        return f"Participants in meeting {meeting_id}: " + ", ".join(names)
+    with session_scope(session) as session:
+        names = session.query(UserInfo.name)\
+                       .join(MeetingParticipant, MeetingParticipant.user_id == UserInfo.id)\
+                       .filter(MeetingParticipant.meeting_id == meeting_id)\
+                       .order_by(MeetingParticipant.id).all()
+    if names:
+        return f"Participants in meeting {meeting_id}: " + ", ".join([n.name for n in names])
     else:
         return f"No participants found for meeting ID {meeting_id}."
 
+@traced("db_tool.get_skill_recommendations_by_id")
+def get_skill_recommendations_by_id(user_id: int, user_name: str, session=None) -> str:
+    """
+    Retrieve recommended skills for an employee by their user id.
+    Recommendations and skill names are fetched with one join.
+    """
+    with session_scope(session) as session:
+        skills = session.query(Skills.skill_name)\
+                        .join(UserSkillRecommendation, UserSkillRecommendation.skill_id == Skills.id)\
+                        .filter(UserSkillRecommendation.user_id == user_id)\
+                        .order_by(UserSkillRecommendation.id).all()
+    if skills:
+        return f"Recommended skills for {user_name}: " + ", ".join([s.skill_name for s in skills])
+    return f"No skill recommendations found for {user_name}."
+
 def get_skill_recommendations_by_name(user_name: str) -> str:
     """
     Retrieve recommended skills for an employee by their name.
     """
-    session = get_session()
     user_name = user_name.strip()
-    user = session.query(UserInfo).filter(UserInfo.name.ilike(f'%{user_name}%')).first()
-    response = ""
-    if user:
-        recommendations = session.query(UserSkillRecommendation).filter(UserSkillRecommendation.user_id == user.id).all()
-        if recommendations:
-            # For each recommendation, get the skill name.
-            skill_names = []
-            for rec in recommendations:
-                skill = session.query(Skills).filter(Skills.id == rec.skill_id).first()
-                if skill:
-                    skill_names.append(skill.skill_name)
-            response = f"Recommended skills for {user.name}: " + ", ".join(skill_names)
-        else:
-            response = f"No skill recommendations found for {user.name}."
-    else:
-        response = f"No record found for employee '{user_name}'."
-    session.close()
-    return response
+    user = resolve_user(user_name)
+    if not user:
+        return f"No record found for employee '{user_name}'."
+    return get_skill_recommendations_by_id(user.id, user.name)
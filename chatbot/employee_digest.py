@@ -0,0 +1,260 @@
+# employee_digest.py
+import json
+import logging
+import os
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import func, distinct, event, inspect, delete, insert, or_, select
+from sqlalchemy.orm import Session as OrmSession
+from models import (get_engine, UserInfo, UserPerformance, LearningTranscript, MeetingParticipant, Skills,
+                    UserSkillRecommendation, EmployeeDigest)
+from user_index import normalize_name, label_name_windows, user_index
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent performance scores and transcript excerpts kept per employee.
+RECENT_SCORES = int(os.getenv("EMPLOYEE_DIGEST_SCORES", "5"))
+EXCERPTS = int(os.getenv("EMPLOYEE_DIGEST_EXCERPTS", "3"))
+EXCERPT_LENGTH = 50
+# Users refreshed per round of queries.
+BATCH_SIZE = 500
+# Up to this many users, only the speaker labels containing their names are read; for more,
+# every distinct label is.
+LABEL_FILTER_USERS = 50
+
+def digest_table_enabled() -> bool:
+    return os.getenv("EMPLOYEE_DIGEST_TABLE", "0").lower() in ("1", "true", "yes")
+
+def _speaker_labels(connection, names=None) -> list:
+    """
+    Distinct speaker labels that may name any of `names`: a case-insensitive substring match
+    on each name as written and without accents, narrowed by the caller with the label's
+    windows. Without names, or for many of them, simply every distinct label.
+    """
+    statement = select(LearningTranscript.speaker_label).distinct()
+    if names is not None and len(names) <= LABEL_FILTER_USERS:
+        patterns = {name.strip() for name in names} | {normalize_name(name) for name in names}
+        patterns.discard("")
+        if not patterns:
+            return []
+        statement = statement.where(or_(*(LearningTranscript.speaker_label.icontains(pattern, autoescape=True)
+                                          for pattern in sorted(patterns))))
+    return connection.execute(statement).scalars().all()
+
+def _excerpts_by_user(connection, users: dict, labels: list) -> dict:
+    """
+    Latest EXCERPTS transcript excerpts per user, from the speaker labels naming them in full.
+    One windowed query covers every matching label.
+    """
+    ids_by_name = {}
+    for user_id, name in users.items():
+        ids_by_name.setdefault(normalize_name(name), []).append(user_id)
+    users_by_label = {}
+    for label in labels:
+        matched = [user_id for window in label_name_windows(label) for user_id in ids_by_name.get(window, ())]
+        if matched:
+            users_by_label[label] = matched
+    if not users_by_label:
+        return {}
+    rank = func.row_number().over(partition_by=LearningTranscript.speaker_label,
+                                  order_by=(LearningTranscript.created_at.desc(), LearningTranscript.id.desc()))
+    latest = select(LearningTranscript.speaker_label,
+                    func.substr(LearningTranscript.transcript, 1, EXCERPT_LENGTH).label("excerpt"),
+                    LearningTranscript.created_at, rank.label("rank"))\
+        .where(LearningTranscript.speaker_label.in_(list(users_by_label))).subquery()
+    rows = connection.execute(select(latest.c.speaker_label, latest.c.excerpt, latest.c.created_at)
+                              .where(latest.c.rank <= EXCERPTS)).all()
+    excerpts = {}
+    for row in rows:
+        for user_id in users_by_label[row.speaker_label]:
+            excerpts.setdefault(user_id, []).append((row.created_at or datetime.min, row.excerpt))
+    return {user_id: [excerpt for _, excerpt in sorted(found, key=lambda e: e[0], reverse=True)[:EXCERPTS]]
+            for user_id, found in excerpts.items()}
+
+def _digest_rows(connection, users: dict, labels: list) -> list:
+    """Compute digest rows for {user_id: name} with one grouped or windowed query per field."""
+    user_ids = list(users)
+    stats = {r.user_id: r for r in connection.execute(
+        select(UserPerformance.user_id, func.count(UserPerformance.id).label("count"),
+               func.min(UserPerformance.performance_score).label("min"),
+               func.max(UserPerformance.performance_score).label("max"),
+               func.avg(UserPerformance.performance_score).label("avg"))
+        .where(UserPerformance.user_id.in_(user_ids)).group_by(UserPerformance.user_id))}
+
+    rank = func.row_number().over(partition_by=UserPerformance.user_id,
+                                  order_by=(UserPerformance.performance_date.desc(), UserPerformance.id.desc()))
+    latest = select(UserPerformance.user_id, UserPerformance.performance_score, UserPerformance.performance_date,
+                    rank.label("rank")).where(UserPerformance.user_id.in_(user_ids)).subquery()
+    recent = {}
+    for r in connection.execute(select(latest).where(latest.c.rank <= RECENT_SCORES).order_by(latest.c.rank.desc())):
+        recent.setdefault(r.user_id, []).append(
+            [r.performance_score, r.performance_date.date().isoformat() if r.performance_date else None])
+
+    skills = {}
+    for r in connection.execute(select(UserSkillRecommendation.user_id, Skills.skill_name)
+                                .join(Skills, UserSkillRecommendation.skill_id == Skills.id)
+                                .where(UserSkillRecommendation.user_id.in_(user_ids))
+                                .order_by(UserSkillRecommendation.id)):
+        skills.setdefault(r.user_id, []).append(r.skill_name)
+
+    meetings = dict(connection.execute(
+        select(MeetingParticipant.user_id, func.count(distinct(MeetingParticipant.meeting_id)))
+        .where(MeetingParticipant.user_id.in_(user_ids)).group_by(MeetingParticipant.user_id)).all())
+
+    excerpts = _excerpts_by_user(connection, users, labels)
+    now = datetime.utcnow()
+    rows = []
+    for user_id in user_ids:
+        s = stats.get(user_id)
+        scores = recent.get(user_id, [])
+        rows.append({
+            "user_id": user_id,
+            "performance_count": s.count if s else 0,
+            "score_min": s.min if s else None,
+            "score_max": s.max if s else None,
+            "score_avg": float(s.avg) if s else None,
+            "score_trend": scores[-1][0] - scores[-2][0] if len(scores) > 1 else None,
+            "recent_scores": json.dumps(scores),
+            "excerpts": json.dumps(excerpts.get(user_id, [])),
+            "skills": json.dumps(skills.get(user_id, [])),
+            "meeting_count": meetings.get(user_id, 0),
+            "updated_at": now,
+        })
+    return rows
+
+def refresh_employee_digests(connection, user_ids=None) -> int:
+    """
+    Recompute the digests of the given users (all users if None); digests of users that no
+    longer exist are removed. Returns the number of digests written.
+    """
+    if user_ids is None:
+        connection.execute(delete(EmployeeDigest))
+        user_ids = connection.execute(select(UserInfo.id).order_by(UserInfo.id)).scalars().all()
+    else:
+        user_ids = sorted(user_ids)
+        connection.execute(delete(EmployeeDigest).where(EmployeeDigest.user_id.in_(user_ids)))
+    if not user_ids:
+        return 0
+    all_labels = _speaker_labels(connection) if len(user_ids) > LABEL_FILTER_USERS else None
+    written = 0
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        users = dict(connection.execute(select(UserInfo.id, UserInfo.name).where(UserInfo.id.in_(batch))).all())
+        if users:
+            labels = all_labels if all_labels is not None else _speaker_labels(connection, list(users.values()))
+            rows = _digest_rows(connection, users, labels)
+            connection.execute(insert(EmployeeDigest), rows)
+            written += len(rows)
+    return written
+
+def load_digests(connection, users: dict) -> dict:
+    """
+    Digests for {user_id: name}: stored rows when the table is enabled, with any missing ones
+    (or all of them, when it is not) computed in batches without being stored.
+    """
+    digests = {}
+    user_ids = list(users)
+    if digest_table_enabled():
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            digests.update((d.user_id, d) for d in connection.execute(
+                select(EmployeeDigest).where(EmployeeDigest.user_id.in_(batch))))
+    missing = [user_id for user_id in user_ids if user_id not in digests]
+    if missing:
+        labels = _speaker_labels(connection, [users[user_id] for user_id in missing])
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = {user_id: users[user_id] for user_id in missing[start:start + BATCH_SIZE]}
+            digests.update((row["user_id"], SimpleNamespace(**row)) for row in _digest_rows(connection, batch, labels))
+    return digests
+
+def rebuild_employee_digests(database_url=None) -> int:
+    """Rebuild the whole digest table, e.g. after enabling it on an existing database."""
+    with get_engine(database_url).begin() as connection:
+        written = refresh_employee_digests(connection)
+    logger.info(f"Employee digest table rebuilt ({written} employees)")
+    return written
+
+def format_digest(user, digest) -> str:
+    """The performance, transcript, skill and meeting part of an employee's context."""
+    info = ""
+    scores = json.loads(digest.recent_scores)
+    if digest.performance_count:
+        latest_score, latest_date = scores[-1]
+        info += (f"Performance Summary for {user.name}: {digest.performance_count} reviews, "
+                 f"average score {digest.score_avg:.2f} (lowest {digest.score_min}, highest {digest.score_max}), "
+                 f"latest {latest_score}" + (f" on {latest_date}" if latest_date else ""))
+        if digest.score_trend is not None:
+            info += f" ({digest.score_trend:+.2f} since the previous review)"
+        info += ".\n"
+        info += "Recent Scores: " + " | ".join(f"{score} ({date})" for score, date in scores) + ".\n"
+    else:
+        info += f"No performance records found for {user.name}.\n"
+
+    excerpts = json.loads(digest.excerpts)
+    if excerpts:
+        info += f"Recent Transcript Excerpts: {' | '.join(excerpts)}.\n"
+    else:
+        info += "No transcript excerpts found for this employee.\n"
+
+    skills = json.loads(digest.skills)
+    if skills:
+        info += f"Recommended Skills: {', '.join(skills)}.\n"
+    info += f"Meetings Attended: {digest.meeting_count}.\n"
+    return info
+
+def employee_digest_context(session, user):
+    """The employee's context part from their digest (one primary-key lookup), or None if there is none yet."""
+    digest = session.get(EmployeeDigest, user.id)
+    return format_digest(user, digest) if digest is not None else None
+
+# --- Incremental maintenance of the digest table ---
+
+def _history_values(obj, attribute: str) -> list:
+    history = inspect(obj).attrs[attribute].history
+    return list(history.added) + list(history.deleted) + [getattr(obj, attribute)]
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_digest_writes(session, flush_context):
+    if not digest_table_enabled():
+        return
+    user_ids = session.info.setdefault("employee_digest_user_ids", set())
+    labels = session.info.setdefault("employee_digest_labels", set())
+    skill_ids = session.info.setdefault("employee_digest_skill_ids", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (UserPerformance, UserSkillRecommendation, MeetingParticipant)):
+            user_ids.update(_history_values(obj, "user_id"))
+        elif isinstance(obj, UserInfo):
+            user_ids.add(obj.id)
+        elif isinstance(obj, LearningTranscript):
+            labels.update(_history_values(obj, "speaker_label"))
+        elif isinstance(obj, Skills):
+            skill_ids.add(obj.id)
+
+@event.listens_for(OrmSession, "after_commit")
+def _refresh_digests(session):
+    user_ids = session.info.pop("employee_digest_user_ids", None) or set()
+    labels = session.info.pop("employee_digest_labels", None) or set()
+    skill_ids = session.info.pop("employee_digest_skill_ids", None) or set()
+    if not user_ids and not labels and not skill_ids:
+        return
+    try:
+        # Users named in full by a changed speaker label, matched on normalized names (accents
+        # stripped) like _excerpts_by_user does.
+        windows = set().union(*(label_name_windows(label) for label in labels if label))
+        if windows:
+            user_ids.update(user_index.ids_named(windows))
+        with session.get_bind().begin() as connection:
+            if skill_ids:
+                user_ids.update(connection.execute(
+                    select(UserSkillRecommendation.user_id).where(UserSkillRecommendation.skill_id.in_(list(skill_ids))))
+                    .scalars())
+            user_ids.discard(None)
+            refresh_employee_digests(connection, user_ids)
+    except Exception as e:
+        logger.error(f"Error refreshing employee digests: {e}")
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_digest_writes(session):
+    session.info.pop("employee_digest_user_ids", None)
+    session.info.pop("employee_digest_labels", None)
+    session.info.pop("employee_digest_skill_ids", None)
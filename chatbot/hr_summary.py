@@ -0,0 +1,140 @@
+# hr_summary.py
+import logging
+import os
+from datetime import datetime
+from sqlalchemy import func, distinct, event, inspect, delete, insert, select
+from sqlalchemy.orm import Session as OrmSession
+from models import get_engine, UserInfo, UserPerformance, DepartmentSummary
+
+logger = logging.getLogger(__name__)
+
+UNASSIGNED = "Unassigned"
+
+# Number of employees listed by name in the HR context; the rest are summarised by counts.
+ROSTER_LIMIT = int(os.getenv("HR_ROSTER_LIMIT", "25"))
+# Number of departments listed in the per-department rollup.
+DEPARTMENT_LIMIT = int(os.getenv("HR_DEPARTMENT_LIMIT", "20"))
+
+def summary_table_enabled() -> bool:
+    return os.getenv("HR_SUMMARY_TABLE", "0").lower() in ("1", "true", "yes")
+
+def _department_rollup_query(departments=None):
+    """
+    SELECT department, headcount, performance count and performance sum, grouped by department.
+    """
+    department = func.coalesce(UserInfo.department, UNASSIGNED)
+    query = select(
+        department.label("department"),
+        func.count(distinct(UserInfo.id)).label("headcount"),
+        func.count(UserPerformance.id).label("performance_count"),
+        func.coalesce(func.sum(UserPerformance.performance_score), 0.0).label("performance_sum"),
+    ).select_from(UserInfo).outerjoin(UserPerformance, UserPerformance.user_id == UserInfo.id)\
+     .group_by(department)
+    if departments is not None:
+        query = query.where(department.in_(list(departments)))
+    return query
+
+def department_rollup(session):
+    """
+    Return per-department rows (department, headcount, performance_count, performance_sum),
+    read from the summary table when it is enabled and computed with one GROUP BY otherwise.
+    """
+    if summary_table_enabled():
+        return session.query(DepartmentSummary.department, DepartmentSummary.headcount,
+                             DepartmentSummary.performance_count, DepartmentSummary.performance_sum).all()
+    return session.execute(_department_rollup_query()).all()
+
+def refresh_department_summary(connection, departments=None) -> None:
+    """
+    Recompute summary rows for the given departments (all departments if None).
+    """
+    rows = connection.execute(_department_rollup_query(departments)).all()
+    stale = delete(DepartmentSummary)
+    if departments is not None:
+        stale = stale.where(DepartmentSummary.department.in_(list(departments)))
+    connection.execute(stale)
+    if rows:
+        now = datetime.utcnow()
+        connection.execute(insert(DepartmentSummary), [
+            {"department": r.department, "headcount": r.headcount, "performance_count": r.performance_count,
+             "performance_sum": float(r.performance_sum), "updated_at": now}
+            for r in rows
+        ])
+
+def rebuild_department_summary(database_url=None) -> None:
+    """Rebuild the whole summary table, e.g. after enabling it on an existing database."""
+    with get_engine(database_url).begin() as connection:
+        refresh_department_summary(connection)
+    logger.info("Department summary table rebuilt")
+
+def build_hr_overview(session) -> str:
+    """
+    HR context without a specific employee: headcount, overall average score and a
+    per-department rollup from aggregate queries, plus a roster capped at ROSTER_LIMIT names.
+    The output size does not grow with headcount.
+    """
+    info = ""
+    rollup = sorted(department_rollup(session), key=lambda r: (-r.headcount, r.department))
+    headcount = sum(r.headcount for r in rollup)
+    if headcount:
+        roster = session.query(UserInfo.name, UserInfo.role).order_by(UserInfo.name).limit(ROSTER_LIMIT).all()
+        names = " | ".join([f"{u.name} ({u.role})" for u in roster])
+        if headcount > len(roster):
+            info += f"Employee Roster (first {len(roster)} of {headcount} employees): {names}.\n"
+        else:
+            info += f"Employee Roster: {names}.\n"
+        info += f"Total Employees: {headcount}.\n"
+    else:
+        info += "No user records available.\n"
+
+    performance_count = sum(r.performance_count for r in rollup)
+    if performance_count:
+        avg_score = sum(r.performance_sum for r in rollup) / performance_count
+        info += f"Overall Average Performance Score: {avg_score:.2f}.\n"
+        departments = []
+        for r in rollup[:DEPARTMENT_LIMIT]:
+            avg = f"{r.performance_sum / r.performance_count:.2f}" if r.performance_count else "n/a"
+            departments.append(f"{r.department}: {r.headcount} employees, average score {avg}")
+        if len(rollup) > DEPARTMENT_LIMIT:
+            departments.append(f"{len(rollup) - DEPARTMENT_LIMIT} more departments")
+        info += f"Department Summary: {' | '.join(departments)}.\n"
+    else:
+        info += "No performance data available.\n"
+    return info
+
+# --- Incremental maintenance of the summary table ---
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_summary_writes(session, flush_context):
+    if not summary_table_enabled():
+        return
+    departments = session.info.setdefault("hr_summary_departments", set())
+    user_ids = session.info.setdefault("hr_summary_user_ids", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, UserInfo):
+            history = inspect(obj).attrs.department.history
+            for department in list(history.added) + list(history.deleted) + [obj.department]:
+                departments.add(department or UNASSIGNED)
+        elif isinstance(obj, UserPerformance):
+            user_ids.add(obj.user_id)
+
+@event.listens_for(OrmSession, "after_commit")
+def _refresh_summary(session):
+    departments = session.info.pop("hr_summary_departments", None) or set()
+    user_ids = session.info.pop("hr_summary_user_ids", None) or set()
+    if not departments and not user_ids:
+        return
+    try:
+        with session.get_bind().begin() as connection:
+            if user_ids:
+                rows = connection.execute(select(func.coalesce(UserInfo.department, UNASSIGNED))
+                                          .where(UserInfo.id.in_(list(user_ids)))).all()
+                departments.update(r[0] for r in rows)
+            refresh_department_summary(connection, departments)
+    except Exception as e:
+        logger.error(f"Error refreshing department summary: {e}")
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_summary_writes(session):
+    session.info.pop("hr_summary_departments", None)
+    session.info.pop("hr_summary_user_ids", None)
@@ -0,0 +1,192 @@
+# intent.py
+import logging
+import math
+import os
+import re
+from collections import Counter, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# name is None when the query should go to the LLM.
+Intent = namedtuple("Intent", ["name", "confidence", "params"])
+
+CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.35"))
+MIN_MARGIN = float(os.getenv("INTENT_MARGIN", "0.05"))
+
+# Example utterances per tool. "general" collects questions that need the LLM; it competes
+# with the tools so that open-ended questions are not forced onto the nearest tool.
+TRAINING_EXAMPLES = {
+    "user_id": [
+        "what is my employee id",
+        "employee id",
+        "user id",
+        "what is the user id of this employee",
+        "tell me his employee number",
+        "what's her staff id",
+        "give me the id of this employee",
+        "which id does this user have",
+        "look up the employee id",
+    ],
+    "performance": [
+        "show performance details",
+        "performance records",
+        "list the performance records",
+        "give me the performance details of this employee",
+        "show me all performance scores and records",
+        "what are the performance scores",
+        "performance history",
+        "show the evaluation records",
+        "list performance scores per meeting",
+    ],
+    "skills": [
+        "recommended skills",
+        "what skills are recommended for me",
+        "which skills should this employee learn",
+        "skill recommendations",
+        "what should i learn next",
+        "suggested skills to improve",
+        "list the recommended skills for this employee",
+        "what training do you recommend",
+    ],
+    "meeting_transcripts": [
+        "recent meeting transcript",
+        "show the recent meeting transcripts",
+        "what was said in the latest meeting",
+        "transcript of the last meeting",
+        "show meeting transcript excerpts",
+        "give me the transcript of meeting 2",
+        "latest transcripts from the meeting",
+    ],
+    "department_roster": [
+        "department roster",
+        "who works in the engineering department",
+        "list the employees in the sales department",
+        "show the team roster",
+        "who is in the marketing team",
+        "members of the department",
+        "list everyone in hr",
+        "staff list for the department",
+    ],
+    "meeting_participants": [
+        "meeting participants",
+        "who attended the meeting",
+        "who was in meeting 3",
+        "list the participants of the meeting",
+        "who joined the last meeting",
+        "attendees of the meeting",
+        "which people were present in the meeting",
+    ],
+    "general": [
+        "how is the team doing",
+        "how is this employee performing overall",
+        "summarize the meeting",
+        "what were the key decisions in the meeting",
+        "give me an overview of employee engagement",
+        "how can i improve my communication",
+        "what is the average performance in the company",
+        "who is the best performer",
+        "explain the trends in performance",
+        "what did i do well",
+        "hello",
+        "thanks",
+        "what can you do",
+        "compare departments by performance",
+        "any concerns about the team",
+    ],
+}
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "to", "in", "on", "me", "my", "is", "are", "was", "were",
+    "please", "can", "you", "i", "this", "that", "and", "or", "do", "does", "show", "give",
+    "tell", "list", "what", "what's", "s",
+}
+
+MEETING_ID_PATTERN = re.compile(r"\bmeeting\s*(?:id|no\.?|number|#)?\s*#?(\d+)\b", re.IGNORECASE)
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(text: str) -> list:
+    """Lowercased, lightly stemmed word unigrams and bigrams; numbers become '<num>'."""
+    words = []
+    for word in re.findall(r"[a-z0-9']+", text.lower()):
+        if word.isdigit():
+            words.append("<num>")
+        elif word not in STOPWORDS:
+            words.append(_stem(word))
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def _normalize(vector: dict) -> dict:
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {k: v / norm for k, v in vector.items()} if norm else vector
+
+class IntentClassifier:
+    """
+    TF-IDF nearest-centroid classifier over the example utterances. Training and prediction
+    are pure Python; classifying a query costs a few dictionary lookups per token.
+    """
+
+    def __init__(self, examples: dict = None, threshold: float = CONFIDENCE_THRESHOLD, margin: float = MIN_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self.fit(examples or TRAINING_EXAMPLES)
+
+    def fit(self, examples: dict) -> None:
+        documents = [(label, Counter(tokenize(text))) for label, texts in examples.items() for text in texts]
+        document_frequency = Counter(term for _, counts in documents for term in counts)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        centroids = {}
+        for label, counts in documents:
+            centroid = centroids.setdefault(label, Counter())
+            for term, weight in self._vector(counts).items():
+                centroid[term] += weight
+        self.centroids = {label: _normalize(dict(c)) for label, c in centroids.items()}
+
+    def _vector(self, counts: Counter) -> dict:
+        return _normalize({t: (1 + math.log(n)) * self.idf[t] for t, n in counts.items() if t in self.idf})
+
+    def scores(self, query: str) -> dict:
+        vector = self._vector(Counter(tokenize(query)))
+        return {label: sum(w * centroid.get(t, 0.0) for t, w in vector.items())
+                for label, centroid in self.centroids.items()}
+
+    def predict(self, query: str):
+        """Return (intent name or None, confidence)."""
+        ranked = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)
+        (best, confidence), runner_up = ranked[0], ranked[1][1] if len(ranked) > 1 else 0.0
+        if best == "general" or confidence < self.threshold or confidence - runner_up < self.margin:
+            return None, confidence
+        return best, confidence
+
+def extract_meeting_id(query: str):
+    match = MEETING_ID_PATTERN.search(query)
+    return int(match.group(1)) if match else None
+
+def extract_department(query: str, departments) -> str:
+    """Return the known department named in the query (case-insensitive whole word), or None."""
+    query_lower = query.lower()
+    for department in sorted(departments, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(department.lower())}\b", query_lower):
+            return department
+    return None
+
+classifier = IntentClassifier()
+
+def classify(query: str, user_index=None) -> Intent:
+    """
+    Classify a chat query and extract the tool parameters it mentions: meeting_id,
+    department and user (a ResolvedUser named in the query, found via user_index).
+    """
+    name, confidence = classifier.predict(query)
+    params = {}
+    if name is not None:
+        params["meeting_id"] = extract_meeting_id(query)
+        if user_index is not None:
+            params["department"] = extract_department(query, user_index.departments())
+            params["user"] = user_index.find_in_text(query)
+    logger.info(f"Intent for query: {name} (confidence {confidence:.2f})")
+    return Intent(name, confidence, params)
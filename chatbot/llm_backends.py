@@ -0,0 +1,450 @@
+# llm_backends.py
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+# This module loads LangChain, so it is imported when the chain is first built (chatbot_llm.get_chain).
+from langchain_core.runnables import Runnable
+from telemetry import Gauge, Histogram, METRICS
+
+logger = logging.getLogger(__name__)
+
+backend_requests = Gauge("chatbot_llm_backend_requests_total", "LLM backend attempts by outcome.",
+                         ("backend", "outcome"), kind="counter")
+backend_first_token = Histogram("chatbot_llm_first_token_seconds",
+                                "Time from starting an LLM backend attempt to its first output.", ("backend",))
+hedged_requests = Gauge("chatbot_llm_hedged_requests_total",
+                        "LLM requests that started a second backend because the first was slow.", kind="counter")
+breaker_open = Gauge("chatbot_llm_breaker_open", "1 while a backend's circuit breaker is open.", ("backend",))
+METRICS.extend([backend_requests, backend_first_token, hedged_requests, breaker_open])
+
+def _groq_llm(model: str = None, timeout: float = None):
+    from langchain_groq import ChatGroq
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        raise ValueError("GROQ_API_KEY environment variable is not set. Please check your .env file.")
+    return ChatGroq(
+        temperature=0.7,
+        model_name=model or os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"),  # Use a supported model.
+        groq_api_key=groq_api_key,
+        # One attempt per call, bounded by the router's timeout: the router does the retrying
+        # (fallback and hedging), and an abandoned call must not hold a thread for longer.
+        request_timeout=timeout,
+        max_retries=0,
+    )
+
+def _stub_llm(model: str = None, timeout: float = None):
+    """
+    Local stand-in for testing: "stub" answers at once, "stub:<ms>" after that many milliseconds
+    and "stub:fail" always raises. Like a real client, it gives up after `timeout` seconds.
+    """
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    if model == "fail":
+        def fail(prompt):
+            raise RuntimeError("stub backend failure")
+        return RunnableLambda(fail)
+    delay = float(model or 0) / 1000
+
+    def answer(prompt):
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub backend timed out after {timeout:g}s")
+        time.sleep(delay)
+        return AIMessage(content="This is a stub answer.")
+
+    async def aanswer(prompt):
+        await asyncio.sleep(delay)
+        return AIMessage(content="This is a stub answer.")
+    return RunnableLambda(answer, afunc=aanswer)
+
+# LLM factories by provider name. Each takes an optional model name and per-call timeout in
+# seconds, and imports its client library when called.
+LLM_PROVIDERS = {"groq": _groq_llm, "stub": _stub_llm}
+
+class BackendUnavailable(Exception):
+    """Raised when every backend's circuit breaker is open, or every backend thread is busy."""
+
+class LLMTimeout(Exception):
+    """Raised when no backend produced output within the request timeout."""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout`
+    seconds. After that, one trial call is let through (half-open). Its success closes the
+    breaker and its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"LLM backend '{self.name}' recovered; closing its circuit breaker")
+                breaker_open.inc(-1, self.name)
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release(self) -> None:
+        """End a trial call that neither succeeded nor failed (e.g. it lost a hedged race)."""
+        with self._lock:
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logger.warning(f"Opening circuit breaker for LLM backend '{self.name}' "
+                                   f"after {self.failures} failures")
+                    breaker_open.inc(1, self.name)
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+class LLMBackend:
+    """
+    One provider and model (spec "provider[:model]"). Its client is built on first use, with
+    `timeout` as its per-call timeout, and the latency to the first output of recent calls is
+    kept for the hedging threshold.
+    """
+
+    def __init__(self, spec: str, failure_threshold: int, reset_timeout: float, timeout: float = None):
+        provider, _, model = spec.partition(":")
+        provider = provider.strip().lower()
+        if provider not in LLM_PROVIDERS:
+            raise ValueError(f"Unknown LLM provider '{provider}'. Choose from: {', '.join(LLM_PROVIDERS)}")
+        self.name = spec
+        self.provider = provider
+        self.model = model or None
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(spec, failure_threshold, reset_timeout)
+        self.latencies = deque(maxlen=200)  # seconds to first output
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = LLM_PROVIDERS[self.provider](self.model, self.timeout)
+        return self._llm
+
+    def record_first_token(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        backend_first_token.observe(seconds, self.name)
+
+    def p95(self):
+        """p95 latency to first output over recent calls, or None with too few samples."""
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {"name": self.name, "breaker": self.breaker.state, "consecutive_failures": self.breaker.failures,
+                "p95_first_token_ms": round(p95 * 1000, 1) if p95 is not None else None}
+
+class LLMRouter(Runnable):
+    """
+    Runnable that sends each prompt to a list of backends in order of preference:
+    - Backends whose circuit breaker is open are skipped.
+    - If the first attempt produces no output within its backend's recent p95 latency (or
+      `hedge_after` seconds until enough calls have been seen), the next backend is started
+      as well, and whichever answers first wins. The other attempt is abandoned.
+    - An attempt that fails before producing output falls back to the next backend.
+    - No output within `timeout` seconds (between chunks, when streaming) raises LLMTimeout.
+    Once a streamed answer has started, it is not switched to another backend.
+
+    Sync attempts run on a pool of `threads` threads. An abandoned attempt keeps its thread
+    until the backend client's own timeout (LLM_TIMEOUT) ends it, so when every thread is
+    taken, new requests fail at once with BackendUnavailable (and hedges are skipped) rather
+    than queueing behind abandoned work.
+    """
+
+    def __init__(self, backends: list, timeout: float, hedge_after: float, hedging: bool = True,
+                 threads: int = None):
+        self.backends = backends
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.hedging = hedging and len(backends) > 1
+        self.hedges = 0
+        self.busy_rejections = 0
+        self.threads = threads or int(os.getenv("LLM_BACKEND_THREADS", "32"))
+        # Sync attempts run here so a slow one can be abandoned; cancellation is best effort.
+        # Each running attempt holds one slot, so submitted attempts never wait for a thread.
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="llm-backend")
+        self._slots = threading.BoundedSemaphore(self.threads)
+
+    def _hedge_delay(self, backend: LLMBackend) -> float:
+        return backend.p95() or self.hedge_after
+
+    def _candidates(self) -> list:
+        candidates = [backend for backend in self.backends if backend.breaker.state != "open"]
+        if not candidates:
+            raise BackendUnavailable("All LLM backends are unavailable (circuit breakers open)")
+        return candidates
+
+    @staticmethod
+    def _next_backend(candidates: list):
+        while candidates:
+            backend = candidates.pop(0)
+            if backend.breaker.allow():
+                return backend
+        return None
+
+    def _attempt_failed(self, backend: LLMBackend, outcome: str, error=None) -> None:
+        backend.breaker.record_failure()
+        backend_requests.inc(1, backend.name, outcome)
+        logger.warning(f"LLM backend '{backend.name}' {outcome}" + (f": {error}" if error else ""))
+
+    def _pump(self, backend: LLMBackend, prompt, streaming: bool, index: int, events, cancel) -> None:
+        try:
+            self._pump_attempt(backend, prompt, streaming, index, events, cancel)
+        finally:
+            self._slots.release()
+
+    def _pump_attempt(self, backend: LLMBackend, prompt, streaming: bool, index: int, events, cancel) -> None:
+        try:
+            if streaming:
+                for chunk in backend.llm.stream(prompt):
+                    if cancel.is_set():
+                        return
+                    events.put((index, "chunk", chunk))
+            else:
+                events.put((index, "chunk", backend.llm.invoke(prompt)))
+            events.put((index, "done", None))
+        except Exception as e:
+            events.put((index, "error", e))
+
+    def _run(self, prompt, streaming: bool):
+        candidates = self._candidates()
+        events = queue.Queue()
+        attempts = []  # (backend, cancel event, start time)
+        running = set()
+        winner = None
+
+        def launch():
+            # Start the next available backend; returns when to hedge it, or None.
+            if not self._slots.acquire(blocking=False):
+                self.busy_rejections += 1
+                logger.warning("All LLM backend threads are busy; not starting another attempt")
+                return None
+            backend = self._next_backend(candidates)
+            if backend is None:
+                self._slots.release()
+                return None
+            attempts.append((backend, threading.Event(), time.monotonic()))
+            running.add(len(attempts) - 1)
+            self._executor.submit(self._pump, backend, prompt, streaming, len(attempts) - 1, events, attempts[-1][1])
+            return time.monotonic() + self._hedge_delay(backend) if self.hedging and candidates else None
+
+        hedge_at = launch()
+        if not running:
+            if not candidates:
+                raise BackendUnavailable("All LLM backends are unavailable (circuit breakers open)")
+            raise BackendUnavailable("All LLM backend threads are busy")
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                now = time.monotonic()
+                wake = min(deadline, hedge_at) if hedge_at and winner is None else deadline
+                try:
+                    index, kind, value = events.get(timeout=max(0, wake - now))
+                except queue.Empty:
+                    if hedge_at and winner is None and time.monotonic() < deadline:
+                        self.hedges += 1
+                        hedged_requests.inc()
+                        hedge_at = launch()
+                        continue
+                    for i in running:
+                        self._attempt_failed(attempts[i][0], "timeout")
+                    running.clear()
+                    raise LLMTimeout(f"No LLM output within {self.timeout:g}s")
+                if winner is not None and index != winner:
+                    continue
+                backend, _, started = attempts[index]
+                if kind == "chunk":
+                    if winner is None:
+                        winner = index
+                        backend.record_first_token(time.monotonic() - started)
+                        for i in running - {index}:
+                            attempts[i][1].set()
+                            attempts[i][0].breaker.release()
+                            backend_requests.inc(1, attempts[i][0].name, "abandoned")
+                        running.intersection_update({index})
+                    deadline = time.monotonic() + self.timeout
+                    yield value
+                elif kind == "done":
+                    running.discard(index)
+                    backend.breaker.record_success()
+                    backend_requests.inc(1, backend.name, "success")
+                    return
+                else:
+                    running.discard(index)
+                    self._attempt_failed(backend, "error", value)
+                    if index == winner:
+                        raise value
+                    if not running:
+                        hedge_at = launch()
+                        if not running:
+                            raise value
+        finally:
+            # Reached early if the caller stops reading the stream.
+            for i in running:
+                attempts[i][0].breaker.release()
+            for _, cancel, _ in attempts:
+                cancel.set()
+
+    def invoke(self, input, config=None, **kwargs):
+        # Run to the end so the outcome is recorded; a non-streamed attempt yields one output.
+        return list(self._run(input, streaming=False))[0]
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self._run(input, streaming=True)
+
+    async def _apump(self, backend: LLMBackend, prompt, streaming: bool, index: int, events) -> None:
+        try:
+            if streaming:
+                async for chunk in backend.llm.astream(prompt):
+                    events.put_nowait((index, "chunk", chunk))
+            else:
+                events.put_nowait((index, "chunk", await backend.llm.ainvoke(prompt)))
+            events.put_nowait((index, "done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            events.put_nowait((index, "error", e))
+
+    async def _arun(self, prompt, streaming: bool):
+        """Async counterpart of _run; abandoned attempts are cancelled."""
+        candidates = self._candidates()
+        events = asyncio.Queue()
+        attempts = []  # (backend, task, start time)
+        running = set()
+        winner = None
+
+        def launch():
+            backend = self._next_backend(candidates)
+            if backend is None:
+                return None
+            task = asyncio.ensure_future(self._apump(backend, prompt, streaming, len(attempts), events))
+            attempts.append((backend, task, time.monotonic()))
+            running.add(len(attempts) - 1)
+            return time.monotonic() + self._hedge_delay(backend) if self.hedging and candidates else None
+
+        hedge_at = launch()
+        if not running:
+            raise BackendUnavailable("All LLM backends are unavailable (circuit breakers open)")
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                now = time.monotonic()
+                wake = min(deadline, hedge_at) if hedge_at and winner is None else deadline
+                try:
+                    index, kind, value = await asyncio.wait_for(events.get(), max(0, wake - now))
+                except asyncio.TimeoutError:
+                    if hedge_at and winner is None and time.monotonic() < deadline:
+                        self.hedges += 1
+                        hedged_requests.inc()
+                        hedge_at = launch()
+                        continue
+                    for i in running:
+                        self._attempt_failed(attempts[i][0], "timeout")
+                    running.clear()
+                    raise LLMTimeout(f"No LLM output within {self.timeout:g}s")
+                if winner is not None and index != winner:
+                    continue
+                backend, _, started = attempts[index]
+                if kind == "chunk":
+                    if winner is None:
+                        winner = index
+                        backend.record_first_token(time.monotonic() - started)
+                        for i in running - {index}:
+                            attempts[i][1].cancel()
+                            attempts[i][0].breaker.release()
+                            backend_requests.inc(1, attempts[i][0].name, "abandoned")
+                        running.intersection_update({index})
+                    deadline = time.monotonic() + self.timeout
+                    yield value
+                elif kind == "done":
+                    running.discard(index)
+                    backend.breaker.record_success()
+                    backend_requests.inc(1, backend.name, "success")
+                    return
+                else:
+                    running.discard(index)
+                    self._attempt_failed(backend, "error", value)
+                    if index == winner:
+                        raise value
+                    if not running:
+                        hedge_at = launch()
+                        if not running:
+                            raise value
+        finally:
+            for i in running:
+                attempts[i][0].breaker.release()
+            for _, task, _ in attempts:
+                task.cancel()
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return [output async for output in self._arun(input, streaming=False)][0]
+
+    async def astream(self, input, config=None, **kwargs):
+        async for chunk in self._arun(input, streaming=True):
+            yield chunk
+
+    def build_clients(self) -> None:
+        """Construct every backend's client now instead of on its first call."""
+        for backend in self.backends:
+            backend.llm
+
+    def stats(self) -> dict:
+        return {"timeout": self.timeout, "hedging": self.hedging, "hedge_after_ms": self.hedge_after * 1000,
+                "hedges": self.hedges, "threads": self.threads, "busy_rejections": self.busy_rejections,
+                "backends": [backend.stats() for backend in self.backends]}
+
+def build_router() -> LLMRouter:
+    """
+    Build the router from LLM_BACKENDS, a comma-separated list of "provider[:model]" in order of
+    preference (e.g. "groq:llama-3.3-70b-versatile,groq:llama-3.1-8b-instant"). It defaults to
+    LLM_PROVIDER alone.
+    """
+    specs = [spec.strip() for spec in os.getenv("LLM_BACKENDS", os.getenv("LLM_PROVIDER", "groq")).split(",") if spec.strip()]
+    failure_threshold = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    reset_timeout = float(os.getenv("LLM_BREAKER_RESET", "30"))
+    timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+    backends = [LLMBackend(spec, failure_threshold, reset_timeout, timeout) for spec in specs]
+    return LLMRouter(backends,
+                     timeout=timeout,
+                     hedge_after=float(os.getenv("LLM_HEDGE_AFTER_MS", "2000")) / 1000,
+                     hedging=os.getenv("LLM_HEDGE", "1").lower() not in ("0", "false", "no"))
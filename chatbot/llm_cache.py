@@ -0,0 +1,167 @@
+# llm_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.orm import sessionmaker
+from models import get_engine, LLMCacheEntry
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Number of previous (user, bot) turns that make two identical questions "the same".
+HISTORY_TURNS = int(os.getenv("LLM_CACHE_HISTORY_TURNS", "1"))
+
+# Queries about the asker themselves are never cached.
+PERSONAL_PATTERN = re.compile(r"\b(i|me|my|mine|myself|i'm|i've)\b")
+
+# Queries that refer back to the conversation; only these make chat history part of the key.
+FOLLOW_UP_PATTERN = re.compile(r"\b(it|its|that|this|those|these|they|them|their|he|she|him|her|his|"
+                               r"also|else|more)\b|^(and|what about|how about)\b")
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key."""
+    query = re.sub(r"[^\w\s']", " ", query.lower())
+    return " ".join(query.split())
+
+def is_cacheable(query: str, role: str) -> bool:
+    """
+    Bypass rules: employee chats and first-person questions are personalised and always go to the LLM.
+    """
+    if os.getenv("LLM_CACHE", "1").lower() in ("0", "false", "no"):
+        return False
+    if role.lower() == "employee":
+        return False
+    return not PERSONAL_PATTERN.search(normalize_query(query))
+
+def make_cache_key(query: str, role: str, context: str, history_messages=()) -> str:
+    """
+    Hash of (normalized query, role, context fingerprint, relevant chat history).
+    Chat history (the last HISTORY_TURNS turns) is only relevant to follow-up questions;
+    standalone questions share a key regardless of what was asked before.
+    """
+    normalized = normalize_query(query)
+    recent = []
+    if HISTORY_TURNS and FOLLOW_UP_PATTERN.search(normalized):
+        recent = [m.content for m in list(history_messages)[-2 * HISTORY_TURNS:]]
+    payload = json.dumps([
+        normalized,
+        role.lower(),
+        hashlib.sha256(context.encode("utf-8")).hexdigest(),
+        recent,
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    Two-tier response cache: an in-process LRU (always on) in front of an optional shared
+    SQL table (llm_response_cache) so several workers can reuse each other's answers.
+    The shared tier uses LLM_CACHE_URL, or DATABASE_URL when LLM_CACHE_SHARED=1.
+    """
+
+    def __init__(self, maxsize: int = None, ttl: float = None, shared_url: str = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("LLM_CACHE_TTL", "3600"))
+        self.local = TTLCache(maxsize=maxsize or int(os.getenv("LLM_CACHE_SIZE", "512")), ttl=self.ttl)
+        if shared_url is None:
+            shared_url = os.getenv("LLM_CACHE_URL")
+            if not shared_url and os.getenv("LLM_CACHE_SHARED", "0").lower() in ("1", "true", "yes"):
+                shared_url = os.getenv("DATABASE_URL")
+        self.shared_url = shared_url
+        self._shared_session = None
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def _shared(self):
+        if not self.shared_url:
+            return None
+        if self._shared_session is None:
+            engine = get_engine(self.shared_url)
+            LLMCacheEntry.__table__.create(engine, checkfirst=True)
+            self._shared_session = sessionmaker(bind=engine)
+        return self._shared_session()
+
+    def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            session = self._shared()
+        except Exception as e:
+            self.shared_errors += 1
+            logger.error(f"LLM cache shared tier unavailable: {e}")
+            return None
+        if session is None:
+            return None
+        try:
+            entry = session.get(LLMCacheEntry, key)
+            if entry is not None and entry.expires_at > datetime.utcnow():
+                self.shared_hits += 1
+                remaining = (entry.expires_at - datetime.utcnow()).total_seconds()
+                self.local.set(key, entry.response, ttl=remaining)
+                return entry.response
+        except Exception as e:
+            self.shared_errors += 1
+            logger.error(f"LLM cache shared lookup failed: {e}")
+        finally:
+            session.close()
+        return None
+
+    def set(self, key: str, response: str) -> None:
+        self.local.set(key, response)
+        try:
+            session = self._shared()
+        except Exception as e:
+            self.shared_errors += 1
+            logger.error(f"LLM cache shared tier unavailable: {e}")
+            return
+        if session is None:
+            return
+        try:
+            now = datetime.utcnow()
+            session.merge(LLMCacheEntry(key=key, response=response, created_at=now,
+                                        expires_at=now + timedelta(seconds=self.ttl)))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.shared_errors += 1
+            logger.error(f"LLM cache shared write failed: {e}")
+        finally:
+            session.close()
+
+    async def aget(self, key: str):
+        """get() for the event loop: a lookup that reaches the shared tier runs on a worker thread."""
+        value = self.local.get(key)
+        if value is not None or not self.shared_url:
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, response: str) -> None:
+        """set() for the event loop: the shared tier write runs on a worker thread."""
+        if not self.shared_url:
+            self.local.set(key, response)
+            return
+        await asyncio.to_thread(self.set, key, response)
+
+    def purge_expired(self) -> int:
+        """Delete expired rows from the shared tier. Returns the number of rows removed."""
+        session = self._shared()
+        if session is None:
+            return 0
+        try:
+            result = session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= datetime.utcnow()))
+            session.commit()
+            return result.rowcount
+        finally:
+            session.close()
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        stats.update({"shared_tier": bool(self.shared_url), "shared_hits": self.shared_hits,
+                      "shared_errors": self.shared_errors})
+        return stats
+
+llm_cache = LLMResponseCache()
@@ -0,0 +1,331 @@
+"""
+Load test for the chatbot's /chat endpoint.
+
+Seeds a database (SQLite by default) with synthetic users, meetings, transcripts and
+performance rows, replaces the Groq LLM with a local stub of configurable latency, then
+sends a mix of chat queries from concurrent workers. Reports throughput, p50/p95/p99
+latency and SQL statements per request, and exits non-zero if --max-p95-ms is exceeded.
+Usage:
+    python load_test.py [--users 500] [--requests 2000] [--concurrency 16] [--llm-latency-ms 200]
+    python load_test.py --url http://127.0.0.1:5000 --no-seed   # against a running server
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import statistics
+import threading
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+DEPARTMENTS = ["Engineering", "Sales", "Marketing", "Finance", "Support", "Operations"]
+FIRST_NAMES = ["Alice", "Bob", "Carol", "David", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy",
+               "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil", "Trent", "Victor", "Walter", "Yvonne"]
+TOPICS = ["roadmap", "hiring", "budget", "deployment", "customer churn", "onboarding", "security review",
+          "quarterly targets", "incident follow-up", "cloud costs", "training plan", "release schedule"]
+
+# Query kinds and their default share of the traffic.
+DEFAULT_MIX = "tool=0.3,manager=0.3,hr=0.2,employee=0.2"
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed by the current thread inside the block."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    thread_id = threading.get_ident()
+    counter = {"count": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread_id:
+            counter["count"] += 1
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def user_name(i):
+    return f"{FIRST_NAMES[i % len(FIRST_NAMES)]} Tester{i}"
+
+
+def is_test_database(database_url):
+    """True for SQLite and for databases with "test" in their name, which seeding may wipe."""
+    from sqlalchemy.engine import make_url
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" or "test" in (url.database or "").lower()
+
+
+def seed_database(database_url, users, meetings, transcripts_per_meeting, performance_per_user, seed=0):
+    """
+    Drop and recreate the chatbot tables in database_url and fill them with deterministic
+    synthetic data. Everything already in that database is lost.
+    """
+    from sqlalchemy import insert
+    from models import (Base, get_engine, UserInfo, UserPerformance, LearningMeeting, MeetingParticipant,
+                        LearningTranscript, Skills, UserSkillRecommendation)
+    rng = random.Random(seed)
+    engine = get_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(UserInfo), [
+            {"id": i + 1, "name": user_name(i), "email": f"user{i}@example.com",
+             "role": "Manager" if i % 10 == 0 else "Employee", "department": DEPARTMENTS[i % len(DEPARTMENTS)],
+             "created_at": now}
+            for i in range(users)])
+        connection.execute(insert(UserPerformance), [
+            {"user_id": u + 1, "performance_score": round(rng.uniform(50, 100), 1),
+             "performance_date": now - timedelta(days=30 * p)}
+            for u in range(users) for p in range(performance_per_user)])
+        connection.execute(insert(LearningMeeting), [
+            {"id": m + 1, "title": f"{TOPICS[m % len(TOPICS)].title()} sync", "scheduled_at": now - timedelta(days=m),
+             "created_by": 1, "created_at": now}
+            for m in range(meetings)])
+        participants, transcripts = [], []
+        for m in range(meetings):
+            attendees = rng.sample(range(users), min(users, 8))
+            participants += [{"meeting_id": m + 1, "user_id": u + 1, "joined_at": now} for u in attendees]
+            for t in range(transcripts_per_meeting):
+                speaker = attendees[t % len(attendees)]
+                topic = rng.choice(TOPICS)
+                transcripts.append({
+                    "meeting_id": m + 1, "speaker_label": f"Employee - {user_name(speaker)}",
+                    "transcript": f"On {topic}, we agreed the next step is {rng.choice(TOPICS)}. "
+                                  f"I will share an update on {topic} by Friday.",
+                    "start_time": t * 15.0, "end_time": t * 15.0 + 12.0,
+                    "created_at": now - timedelta(days=m, seconds=-t)})
+        connection.execute(insert(MeetingParticipant), participants)
+        connection.execute(insert(LearningTranscript), transcripts)
+        connection.execute(insert(Skills), [{"id": i + 1, "skill_name": name} for i, name in enumerate(TOPICS)])
+        connection.execute(insert(UserSkillRecommendation), [
+            {"user_id": u + 1, "skill_id": rng.randrange(len(TOPICS)) + 1, "recommendation_date": now}
+            for u in range(users) for _ in range(2)])
+    print(f"Seeded {users} users, {meetings} meetings, {len(transcripts)} transcripts "
+          f"and {users * performance_per_user} performance rows.")
+    # Bulk inserts bypass the ORM events that maintain the optional precomputed tables.
+    from hr_summary import summary_table_enabled, rebuild_department_summary
+    from employee_digest import digest_table_enabled, rebuild_employee_digests
+    if summary_table_enabled():
+        rebuild_department_summary(database_url)
+    if digest_table_enabled():
+        rebuild_employee_digests(database_url)
+
+
+def install_stub_llm(latency_ms, jitter_ms, seed=0):
+    """
+    Replace the Groq model in chatbot_llm with a deterministic local stub that waits
+    latency_ms (+/- jitter_ms) and answers with a short text derived from the prompt.
+    """
+    import asyncio
+    import zlib
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    import chatbot_llm
+
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def delay():
+        with rng_lock:
+            return max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000.0
+
+    def answer(prompt):
+        digest = zlib.crc32(prompt.to_string().encode("utf-8"))
+        return AIMessage(content=f"Based on the database, the answer is {digest % 100}. Nothing else is recorded.")
+
+    def stub(prompt):
+        time.sleep(delay())
+        return answer(prompt)
+
+    async def astub(prompt):
+        await asyncio.sleep(delay())
+        return answer(prompt)
+
+    chatbot_llm.set_chain(chatbot_llm.get_chat_prompt() | RunnableLambda(stub, afunc=astub))
+
+
+def build_query_mix(users, meetings, mix):
+    """Return {kind: (weight, generator)}; each generator returns the form fields of one request."""
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = float(weight)
+
+    def tool(rng):
+        name = user_name(rng.randrange(users))
+        query = rng.choice([f"What is the employee id of {name}?", "show the department roster for Sales",
+                            f"who attended meeting {rng.randrange(meetings) + 1}",
+                            f"list the recommended skills for {name}", "show performance details"])
+        return {"role": "hr", "name": name, "query": query}
+
+    def manager(rng):
+        return {"role": "manager", "query": f"What did the team say about {rng.choice(TOPICS)} recently?"}
+
+    def hr(rng):
+        return {"role": "hr", "query": rng.choice(["How are departments performing overall?",
+                                                   "Which teams need support?",
+                                                   f"Any concerns about {rng.choice(TOPICS)}?"])}
+
+    def employee(rng):
+        return {"role": "employee", "name": user_name(rng.randrange(users)),
+                "query": f"How can I improve on {rng.choice(TOPICS)}?"}
+
+    generators = {"tool": tool, "manager": manager, "hr": hr, "employee": employee}
+    unknown = set(weights) - set(generators)
+    if unknown:
+        raise SystemExit(f"Unknown query kinds in --mix: {', '.join(sorted(unknown))}")
+    return {kind: (weight, generators[kind]) for kind, weight in weights.items() if weight > 0}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank percentile.
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Driver:
+    """Sends requests either in-process (Flask test client, with SQL counts) or over HTTP."""
+
+    def __init__(self, url=None):
+        self.url = url
+        self._local = threading.local()
+        if url is None:
+            from app import app
+            self.app = app
+
+    def post(self, fields):
+        if self.url:
+            data = urllib.parse.urlencode(fields).encode("utf-8")
+            with urllib.request.urlopen(self.url.rstrip("/") + "/chat", data=data, timeout=60) as response:
+                response.read()
+                return response.status, None
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        with count_queries() as queries:
+            response = client.post("/chat", data=fields)
+        return response.status_code, queries["count"]
+
+
+def run_load(driver, mix, total_requests, concurrency, seed=0):
+    kinds = list(mix)
+    weights = [mix[k][0] for k in kinds]
+    results = []
+    results_lock = threading.Lock()
+    counter = iter(range(total_requests))
+    counter_lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        session_id = f"load-{worker_id}"
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    return
+            kind = rng.choices(kinds, weights)[0]
+            fields = dict(mix[kind][1](rng), session_id=session_id)
+            start = time.perf_counter()
+            try:
+                status, queries = driver.post(fields)
+            except Exception as e:
+                status, queries = str(e), None
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with results_lock:
+                results.append((kind, status, elapsed_ms, queries))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed):
+    by_kind = defaultdict(list)
+    for row in results:
+        by_kind[row[0]].append(row)
+    errors = sum(1 for _, status, _, _ in results if status != 200)
+    print(f"\n{len(results)} requests in {elapsed:.2f}s: {len(results) / elapsed:.1f} req/s, {errors} errors")
+    print(f"{'kind':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries/req':>12} {'max q':>6}")
+    for kind in sorted(by_kind) + ["all"]:
+        rows = results if kind == "all" else by_kind[kind]
+        latencies = [r[2] for r in rows]
+        queries = [r[3] for r in rows if r[3] is not None]
+        avg_queries = f"{statistics.mean(queries):.1f}" if queries else "-"
+        max_queries = str(max(queries)) if queries else "-"
+        print(f"{kind:<10} {len(rows):>6} {percentile(latencies, 50):>9.1f} {percentile(latencies, 95):>9.1f} "
+              f"{percentile(latencies, 99):>9.1f} {avg_queries:>12} {max_queries:>6}")
+    return percentile([r[2] for r in results], 95), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chatbot /chat endpoint")
+    parser.add_argument("--database-url", default="sqlite:///load_test.db", help="Database to seed and use")
+    parser.add_argument("--no-seed", action="store_true", help="Use the database as it is")
+    parser.add_argument("--reset", action="store_true",
+                        help="Allow seeding to drop all tables in a database that is not SQLite "
+                             "and has no 'test' in its name")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--meetings", type=int, default=100)
+    parser.add_argument("--transcripts-per-meeting", type=int, default=20)
+    parser.add_argument("--performance-per-user", type=int, default=6)
+    parser.add_argument("--requests", type=int, default=2000, help="Total number of /chat requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Query mix as kind=weight pairs (tool, manager, hr, employee)")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Stub LLM latency")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0, help="Stub LLM latency jitter")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Disable the LLM response cache")
+    parser.add_argument("--url", help="Base URL of a running server instead of the in-process app")
+    parser.add_argument("--max-p95-ms", type=float, help="Exit non-zero if p95 latency exceeds this")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The chatbot modules read these at import time.
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("GROQ_API_KEY", "load-test")
+    if args.no_llm_cache:
+        os.environ["LLM_CACHE"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if not args.no_seed and not args.url:
+        if not args.reset and not is_test_database(args.database_url):
+            from sqlalchemy.engine import make_url
+            shown = make_url(args.database_url).render_as_string(hide_password=True)
+            print(f"Refusing to seed {shown}: seeding drops every chatbot table. Use a SQLite "
+                  "or test database, pass --reset to wipe this one, or --no-seed to use it as it is.")
+            sys.exit(2)
+        seed_database(args.database_url, args.users, args.meetings, args.transcripts_per_meeting,
+                      args.performance_per_user, args.seed)
+    if not args.url:
+        install_stub_llm(args.llm_latency_ms, args.llm_jitter_ms, args.seed)
+
+    driver = Driver(args.url)
+    mix = build_query_mix(args.users, args.meetings, args.mix)
+    if args.warmup:
+        run_load(driver, mix, args.warmup, min(args.concurrency, args.warmup), seed=args.seed + 1)
+    results, elapsed = run_load(driver, mix, args.requests, args.concurrency, seed=args.seed)
+    p95, errors = report(results, elapsed)
+
+    if errors:
+        print(f"FAIL: {errors} requests failed")
+        sys.exit(1)
+    if args.max_p95_ms is not None and p95 > args.max_p95_ms:
+        print(f"FAIL: p95 latency {p95:.1f} ms exceeds the {args.max_p95_ms:.1f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
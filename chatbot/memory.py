@@ -0,0 +1,192 @@
+# memory.py
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from sqlalchemy.exc import SQLAlchemyError
+from models import get_session, has_column, ChatHistory
+
+logger = logging.getLogger(__name__)
+
+# message_type matches ChatHistory.message_type: 'user' or 'bot'.
+ChatMessage = namedtuple("ChatMessage", ["message_type", "content"])
+
+MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "20"))
+TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1000"))
+SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "200"))
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+def extractive_summarizer(previous_summary: str, evicted_messages: list) -> str:
+    """
+    Fold evicted messages into the running summary by keeping the first sentence of each
+    user question, trimmed to SUMMARY_TOKENS. No LLM call is made.
+    """
+    points = [previous_summary] if previous_summary else []
+    for message in evicted_messages:
+        if message.message_type == "user":
+            first_sentence = message.content.strip().split("\n")[0].split(". ")[0]
+            points.append(f"Earlier the user asked: {first_sentence[:120]}")
+    summary = " ".join(points)
+    max_chars = SUMMARY_TOKENS * 4
+    return summary[-max_chars:] if len(summary) > max_chars else summary
+
+class ConversationMemory:
+    """
+    Bounded memory for one chat session: a ring buffer of the last `max_messages` messages,
+    trimmed further to `token_budget` when rendered into the prompt. Messages that fall out
+    are folded into a rolling summary when a summarizer is configured.
+    """
+
+    def __init__(self, max_messages: int = MAX_MESSAGES, token_budget: int = TOKEN_BUDGET, summarizer=None):
+        self._messages = deque(maxlen=max_messages)
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.summary = ""
+        self._lock = threading.Lock()
+
+    @property
+    def messages(self) -> list:
+        return list(self._messages)
+
+    def _append(self, message: ChatMessage) -> None:
+        with self._lock:
+            if len(self._messages) == self._messages.maxlen:
+                evicted = self._messages[0]
+                if self.summarizer:
+                    self.summary = self.summarizer(self.summary, [evicted])
+            self._messages.append(message)
+
+    def add_user_message(self, message: str) -> None:
+        self._append(ChatMessage("user", message))
+
+    def add_ai_message(self, message: str) -> None:
+        self._append(ChatMessage("bot", message))
+
+    def load(self, messages: list) -> None:
+        """Replace the buffer with previously stored messages (oldest first)."""
+        with self._lock:
+            self._messages.clear()
+            self._messages.extend(messages)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._messages.clear()
+            self.summary = ""
+
+    def history_text(self) -> str:
+        """
+        Render the newest messages that fit in the token budget (plus the summary, if any),
+        oldest first, for the prompt's chat history slot.
+        """
+        with self._lock:
+            lines = []
+            used = estimate_tokens(self.summary) if self.summary else 0
+            for message in reversed(self._messages):
+                cost = estimate_tokens(message.content)
+                if used + cost > self.token_budget:
+                    break
+                lines.append(message.content)
+                used += cost
+            lines.reverse()
+            if self.summary:
+                lines.insert(0, f"Summary of earlier conversation: {self.summary}")
+            return "\n".join(lines)
+
+class InMemoryMemoryStore:
+    """
+    Per-session memories kept in process. At most `max_sessions` are kept (least recently
+    used dropped first) and sessions idle for `idle_ttl` seconds are discarded.
+    """
+
+    def __init__(self, max_sessions: int = None, idle_ttl: float = None, summarizer=None):
+        self.max_sessions = max_sessions or int(os.getenv("MEMORY_MAX_SESSIONS", "1000"))
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.getenv("MEMORY_IDLE_TTL", "3600"))
+        self.summarizer = summarizer
+        self._sessions = OrderedDict()  # session id -> (last used, ConversationMemory)
+        self._lock = threading.Lock()
+
+    def _new_memory(self, session_id: str) -> ConversationMemory:
+        return ConversationMemory(summarizer=self.summarizer)
+
+    def get(self, session_id: str) -> ConversationMemory:
+        """Return the memory for session_id; without a session id, a fresh throwaway memory."""
+        if not session_id:
+            return ConversationMemory(summarizer=self.summarizer)
+        now = time.monotonic()
+        with self._lock:
+            memory = self._touch(session_id, now)
+        if memory is not None:
+            return memory
+        # Built outside the lock: DbMemoryStore loads history from the database here, which
+        # must not hold up every other session. If another request for the same session got
+        # there first, its memory wins.
+        new_memory = self._new_memory(session_id)
+        with self._lock:
+            memory = self._touch(session_id, now) or new_memory
+            self._sessions[session_id] = (now, memory)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return memory
+
+    def _touch(self, session_id: str, now: float):
+        # The live memory for session_id, marked as used, or None. Called with the lock held.
+        entry = self._sessions.get(session_id)
+        if entry is None or now - entry[0] > self.idle_ttl:
+            return None
+        self._sessions[session_id] = (now, entry[1])
+        self._sessions.move_to_end(session_id)
+        return entry[1]
+
+    def append(self, session_id: str, memory: ConversationMemory, query: str, response: str) -> None:
+        """Record one chat turn."""
+        memory.add_user_message(query)
+        memory.add_ai_message(response)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+class DbMemoryStore(InMemoryMemoryStore):
+    """
+    Memory store backed by the chat_history table: a session's recent messages are loaded
+    from the database the first time it is seen in this process. Turns are written to the
+    table by chat_writer.py. If the history cannot be read (e.g. chat_history predates the
+    session_id column and init-db has not been run), the session starts with an empty memory.
+    """
+
+    def _new_memory(self, session_id: str) -> ConversationMemory:
+        memory = super()._new_memory(session_id)
+        session = get_session()
+        try:
+            if not has_column("chat_history", "session_id"):
+                return memory
+            rows = session.query(ChatHistory.message_type, ChatHistory.message)\
+                          .filter(ChatHistory.session_id == session_id)\
+                          .order_by(ChatHistory.id.desc()).limit(MAX_MESSAGES).all()
+        except SQLAlchemyError as e:
+            logger.error(f"Error loading chat history for session {session_id}: {e}")
+            session.rollback()
+            return memory
+        finally:
+            session.close()
+        memory.load([ChatMessage(r.message_type, r.message) for r in reversed(rows)])
+        return memory
+
+def create_memory_store():
+    """
+    Build the memory store selected by MEMORY_BACKEND ('memory' or 'db').
+    MEMORY_SUMMARY=1 enables rolling summaries of messages that fall out of the buffer.
+    """
+    summarizer = extractive_summarizer if os.getenv("MEMORY_SUMMARY", "0").lower() in ("1", "true", "yes") else None
+    if os.getenv("MEMORY_BACKEND", "memory").lower() == "db":
+        return DbMemoryStore(summarizer=summarizer)
+    return InMemoryMemoryStore(summarizer=summarizer)
+
+memory_store = create_memory_store()
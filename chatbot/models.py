@@ -1,19 +1,161 @@
 # models.py
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, ForeignKey
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, func, inspect, literal_column, text, Column, Index, Integer, String, Text, Float, DateTime, ForeignKey
+from sqlalchemy.dialects import postgresql  # registers the full-text search functions used below
+from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base, relationship
 from datetime import datetime
 
 Base = declarative_base()
 
-def get_session(database_url=None):
+# One engine (and connection pool) per database URL per process, created on first use.
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Thread-local sessions; the Flask app removes the current session when each request ends.
+Session = scoped_session(sessionmaker())
+
+def _pool_options(database_url):
+    if database_url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+def get_engine(database_url=None):
+    """
+    Return the process-wide engine for database_url (DATABASE_URL by default), creating it lazily.
+    """
     if not database_url:
         database_url = os.getenv("DATABASE_URL")
-    engine = create_engine(database_url)
+    engine = _engines.get(database_url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(database_url)
+            if engine is None:
+                engine = create_engine(database_url, **_pool_options(database_url))
+                _engines[database_url] = engine
+    return engine
+
+_async_engines = {}
+
+def async_database_url(database_url=None):
+    """
+    Map a sync database URL to its asyncio driver (asyncpg for PostgreSQL, aiosqlite for SQLite).
+    ASYNC_DATABASE_URL overrides the mapping for the default database.
+    """
+    if not database_url:
+        database_url = os.getenv("ASYNC_DATABASE_URL") or os.getenv("DATABASE_URL")
+    scheme, sep, rest = database_url.partition("://")
+    dialect = scheme.split("+")[0]
+    drivers = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+    if "+" in scheme and scheme.split("+")[1] in ("asyncpg", "aiosqlite", "psycopg", "aiomysql"):
+        return database_url
+    return drivers.get(dialect, scheme) + sep + rest
+
+def get_async_engine(database_url=None):
+    """
+    Return the process-wide asyncio engine for database_url, creating it lazily.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    url = async_database_url(database_url)
+    engine = _async_engines.get(url)
+    if engine is None:
+        with _engines_lock:
+            engine = _async_engines.get(url)
+            if engine is None:
+                engine = create_async_engine(url, **_pool_options(url))
+                _async_engines[url] = engine
+    return engine
+
+def init_db(database_url=None):
+    """
+    Create any missing tables and upgrade existing ones. Run once at startup instead of on
+    every session.
+    """
+    engine = get_engine(database_url)
     Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
+    upgrade_schema(engine)
+
+def upgrade_schema(engine) -> None:
+    """
+    Add the columns and indexes that create_all does not add to tables that already exist.
+    Each step checks first, so this is safe to run repeatedly.
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns("chat_history")}
+    with engine.begin() as connection:
+        if "session_id" not in columns:
+            connection.execute(text("ALTER TABLE chat_history ADD COLUMN session_id VARCHAR(64)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_history_session_id ON chat_history (session_id)"))
+        if engine.dialect.name == "postgresql":
+            # Full-text search index for transcript_search.py (see LearningTranscript).
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_meeting_transcripts_fts ON meeting_transcripts "
+                                    "USING gin (to_tsvector('english'::regconfig, transcript))"))
+    _column_checks.clear()
+
+_column_checks = {}  # (database url, table, column) -> bool
+
+def has_column(table: str, column: str, database_url=None) -> bool:
+    """
+    Whether the database has table.column; checked once per process (init_db resets it).
+    Errors while inspecting (e.g. the database is unreachable) are raised and not remembered,
+    so the next call checks again.
+    """
+    engine = get_engine(database_url)
+    key = (str(engine.url), table, column)
+    if key not in _column_checks:
+        _column_checks[key] = column in {c["name"] for c in inspect(engine).get_columns(table)}
+    return _column_checks[key]
+
+def get_session(database_url=None):
+    """
+    Return the session for the current thread/request, bound to the pooled engine.
+    Callers may close() it; the Flask app also removes it at the end of each request.
+    A database_url other than DATABASE_URL gets a plain (unscoped) session from that URL's pool.
+    """
+    if database_url and database_url != os.getenv("DATABASE_URL"):
+        return sessionmaker(bind=get_engine(database_url))()
+    if not Session.registry.has():
+        return Session(bind=get_engine())
     return Session()
 
+@contextmanager
+def session_scope(session=None):
+    """
+    Yield `session` if one is given (the caller owns it), otherwise the current request's
+    session, which is closed on exit.
+    """
+    if session is not None:
+        yield session
+        return
+    session = get_session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def remove_session(exception=None):
+    """Release the current thread's session back to the pool."""
+    Session.remove()
+
+def pool_stats():
+    """Return connection pool statistics for every engine in this process."""
+    stats = {}
+    engines = list(_engines.values()) + [e.sync_engine for e in _async_engines.values()]
+    for engine in engines:
+        pool = engine.pool
+        entry = {"status": pool.status()}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                entry[name] = getattr(pool, name)()
+        stats[engine.url.render_as_string(hide_password=True)] = entry
+    return stats
+
 # Users table: includes id, name, email, role, department, created_at.
 class UserInfo(Base):
     __tablename__ = 'users'
@@ -62,6 +204,12 @@ class LearningTranscript(Base):
     end_time = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Full-text search index for transcript_search.py (PostgreSQL only).
+    __table_args__ = (
+        Index("ix_meeting_transcripts_fts", func.to_tsvector(literal_column("'english'::regconfig"), transcript),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
 # Skills table.
 class Skills(Base):
     __tablename__ = 'skills'
@@ -76,11 +224,45 @@ class UserSkillRecommendation(Base):
     skill_id = Column(Integer, ForeignKey('skills.id'), nullable=False)
     recommendation_date = Column(DateTime, default=datetime.utcnow)
 
+# Per-department HR rollup (optional, enabled with HR_SUMMARY_TABLE=1), kept up to date by hr_summary.py.
+class DepartmentSummary(Base):
+    __tablename__ = 'department_summary'
+    department = Column(String(100), primary_key=True)  # "Unassigned" for users without a department
+    headcount = Column(Integer, nullable=False, default=0)
+    performance_count = Column(Integer, nullable=False, default=0)
+    performance_sum = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# Precomputed per-employee context (optional, enabled with EMPLOYEE_DIGEST_TABLE=1), kept up to date
+# by employee_digest.py. No foreign key, so users can be deleted before their digest is.
+class EmployeeDigest(Base):
+    __tablename__ = 'employee_digest'
+    user_id = Column(Integer, primary_key=True)
+    performance_count = Column(Integer, nullable=False, default=0)
+    score_min = Column(Float)
+    score_max = Column(Float)
+    score_avg = Column(Float)
+    score_trend = Column(Float)  # latest score minus the one before it
+    recent_scores = Column(Text, nullable=False, default="[]")  # JSON [[score, date], ...], oldest first
+    excerpts = Column(Text, nullable=False, default="[]")  # JSON list of the latest transcript excerpts
+    skills = Column(Text, nullable=False, default="[]")  # JSON list of recommended skill names
+    meeting_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# Shared LLM response cache tier (optional), used by llm_cache.py.
+class LLMCacheEntry(Base):
+    __tablename__ = 'llm_response_cache'
+    key = Column(String(64), primary_key=True)  # sha256 of query, role, context and history
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 # Chat history table (optional).
 class ChatHistory(Base):
     __tablename__ = 'chat_history'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
+    session_id = Column(String(64), index=True)  # chat session the message belongs to
     message_type = Column(String(10), nullable=False)  # 'user' or 'bot'
     message = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,483 @@
+# semantic_index.py
+# Semantic (embedding) search over transcript passages, used alongside the keyword search in
+# transcript_search.py when SEMANTIC_SEARCH=1. Embeddings come from a local hashing vectorizer
+# projected to a small dense space, and are stored in a memory-mapped float32 matrix on disk.
+#
+# Rebuild the index from scratch (refitting the projection with SVD) with:
+#   python semantic_index.py --rebuild
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from models import session_scope, LearningTranscript
+from transcript_search import Passage, split_passages, tokenize
+from user_index import label_names
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, so run a single worker there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "semantic_index")
+HASH_DIM = 2 ** 14
+DIM = int(os.getenv("SEMANTIC_DIM", "128"))
+IVF_MIN_ROWS = int(os.getenv("SEMANTIC_IVF_MIN_ROWS", "100000"))
+NPROBE = int(os.getenv("SEMANTIC_NPROBE", "16"))
+SYNC_BATCH = 1000
+INITIAL_CAPACITY = 4096
+
+def _features(text: str):
+    """Hashed unigram and bigram features with sublinear term frequencies: (indices, weights)."""
+    words = tokenize(text)
+    counts = {}
+    for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(term.encode("utf-8"))
+        counts[h % HASH_DIM] = counts.get(h % HASH_DIM, 0) + 1
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    weights = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, weights
+
+class HashingEmbedder:
+    """
+    Hashing vectorizer followed by a linear projection to `dim` dimensions. The projection is
+    a fixed random one until fit() replaces it with the top singular vectors of a sample
+    (randomized SVD computed from the sparse rows, so no dense term matrix is built).
+    """
+
+    def __init__(self, dim: int = DIM, components=None):
+        self.dim = components.shape[0] if components is not None else dim
+        if components is None:
+            rng = np.random.default_rng(0)
+            components = rng.standard_normal((dim, HASH_DIM), dtype=np.float32) / np.sqrt(dim)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+
+    def embed(self, text: str) -> np.ndarray:
+        indices, weights = _features(text)
+        vector = self.components[:, indices] @ weights
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
+
+    def embed_many(self, texts) -> np.ndarray:
+        return np.vstack([self.embed(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+    def fit(self, texts, oversample: int = 10, iterations: int = 2) -> None:
+        rows = [_features(t) for t in texts]
+        rows = [(i, w / np.linalg.norm(w)) for i, w in rows if len(i)]
+        if len(rows) <= self.dim:
+            logger.warning("Too few passages to fit the projection; keeping the random one")
+            return
+        rng = np.random.default_rng(0)
+        k = self.dim + oversample
+
+        def times(matrix):   # X @ matrix, with matrix of shape (HASH_DIM, k)
+            return np.vstack([w @ matrix[i] for i, w in rows])
+
+        def transpose_times(matrix):   # X.T @ matrix, with matrix of shape (n, k)
+            out = np.zeros((HASH_DIM, matrix.shape[1]), dtype=np.float32)
+            for (i, w), m in zip(rows, matrix):
+                out[i] += np.outer(w, m)
+            return out
+
+        q, _ = np.linalg.qr(times(rng.standard_normal((HASH_DIM, k), dtype=np.float32)))
+        for _ in range(iterations):
+            q, _ = np.linalg.qr(times(transpose_times(q)))
+        _, _, vt = np.linalg.svd(transpose_times(q).T, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.dim], dtype=np.float32)
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """
+    Exclusive lock on `path`/write.lock, held by whichever process is writing the index files.
+    Yields False, without waiting, when blocking is False and another process holds it.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "write.lock"), "a") as lock_file:
+        acquired = True
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                acquired = False
+        yield acquired  # closing the file releases the lock
+
+def _write_meta(path: str, meta: dict) -> None:
+    with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+def _kmeans(data: np.ndarray, clusters: int, iterations: int = 10) -> np.ndarray:
+    """Spherical k-means returning unit-norm centroids."""
+    rng = np.random.default_rng(0)
+    centroids = data[rng.choice(len(data), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1, norms))
+    return centroids.astype(np.float32)
+
+class SemanticIndex:
+    """
+    Append-only vector index over transcript passages, persisted in `path`:
+
+      vectors.f32  float32 matrix (capacity x dim), memory-mapped
+      rows.i64     (transcript id, passage number, meeting id) per vector, memory-mapped
+      lists.i32    IVF list of each vector, once the index has IVF_MIN_ROWS vectors
+      centroids.npy, components.npy, meta.json
+
+    New transcripts are embedded and appended as they are synced (by id watermark); the vectors
+    of edited or deleted transcripts are zeroed and edited ones appended again, so the index
+    is never rebuilt. Below IVF_MIN_ROWS the search is brute force; above it, only the
+    NPROBE nearest IVF lists are scanned. The IVF lists are trained once, on a background
+    thread (or by --rebuild), never while a request waits.
+
+    Several worker processes can share one index directory: writes happen under an exclusive
+    lock on write.lock, and each writer first catches up with what the others appended.
+    Searches never write: they scan the vectors indexed so far and, when the index is behind,
+    start a sync on a background thread (as do commits that change transcripts).
+    """
+
+    def __init__(self, path: str = INDEX_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pending = set()     # transcript ids to (re)index on the next sync
+        self._new_rows = True
+        self._synced_at = 0.0
+        self._trainer = None
+        self._syncer = None
+        self._syncer_lock = threading.Lock()
+        self.sync_interval = float(os.getenv("SEMANTIC_SYNC_INTERVAL", "5"))
+        self._load()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> dict:
+        if os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        return {}
+
+    def _load_centroids(self):
+        return np.load(self._file("centroids.npy")) if os.path.exists(self._file("centroids.npy")) else None
+
+    def _load(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        meta = self._read_meta()
+        self.generation = meta.get("generation")
+        self.count = meta.get("count", 0)
+        self.watermark = meta.get("watermark", 0)
+        components = np.load(self._file("components.npy")) if os.path.exists(self._file("components.npy")) else None
+        self.embedder = HashingEmbedder(components=components)
+        self.dim = self.embedder.dim
+        self._open(max(meta.get("capacity", 0), INITIAL_CAPACITY))
+        self.centroids = self._load_centroids()
+        self.inverted = self._build_lists(self.centroids)
+
+    def _refresh(self) -> None:
+        """Catch up with what other processes wrote. Called holding the write lock."""
+        meta = self._read_meta()
+        if meta.get("generation") != self.generation:
+            self._load()  # rebuilt with a new projection
+            return
+        ivf_lists = len(self.centroids) if self.centroids is not None else 0
+        if (meta.get("count", 0), meta.get("watermark", 0), meta.get("ivf_lists", 0)) == \
+                (self.count, self.watermark, ivf_lists):
+            return
+        with self._lock:
+            if meta.get("capacity", 0) > self.capacity:
+                self._open(meta["capacity"])
+            self.count, self.watermark = meta.get("count", 0), meta.get("watermark", 0)
+            centroids = self._load_centroids() if meta.get("ivf_lists", 0) != ivf_lists else self.centroids
+            self.inverted = self._build_lists(centroids)
+            self.centroids = centroids
+
+    def _open(self, capacity: int) -> None:
+        for name, width, dtype in (("vectors.f32", self.dim, np.float32), ("rows.i64", 3, np.int64),
+                                   ("lists.i32", 1, np.int32)):
+            size = capacity * width * np.dtype(dtype).itemsize
+            with open(self._file(name), "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self.capacity = capacity
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.rows = np.memmap(self._file("rows.i64"), dtype=np.int64, mode="r+", shape=(capacity, 3))
+        self.lists = np.memmap(self._file("lists.i32"), dtype=np.int32, mode="r+", shape=(capacity,))
+
+    def _build_lists(self, centroids):
+        """In-memory IVF inverted lists: for each centroid, the vector rows assigned to it."""
+        if centroids is None:
+            return None
+        labels = np.asarray(self.lists[:self.count])
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        return [[order[bounds[c]:bounds[c + 1]]] for c in range(len(centroids))]
+
+    def _save_meta(self) -> None:
+        self.vectors.flush()
+        self.rows.flush()
+        self.lists.flush()
+        _write_meta(self.path, {"count": self.count, "capacity": self.capacity, "watermark": self.watermark,
+                                "dim": self.dim, "generation": self.generation,
+                                "ivf_lists": len(self.centroids) if self.centroids is not None else 0})
+
+    @contextmanager
+    def _writer(self, blocking: bool = True):
+        """The in-process sync lock plus the cross-process file lock; yields whether both were acquired."""
+        if not self._sync_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            with _file_lock(self.path, blocking) as acquired:
+                if acquired:
+                    self._refresh()
+                yield acquired
+        finally:
+            self._sync_lock.release()
+
+    def train_ivf(self) -> None:
+        """Cluster the vectors into IVF lists. Runs on a background thread or from --rebuild."""
+        with self._writer():
+            if self.centroids is not None or not self.count:
+                return
+            started = time.perf_counter()
+            sample_size = min(self.count, 200000)
+            sample = np.asarray(self.vectors[np.sort(np.random.default_rng(0).choice(self.count, sample_size, replace=False))])
+            centroids = _kmeans(sample, min(4096, int(4 * np.sqrt(self.count))))
+            for start in range(0, self.count, 65536):
+                block = np.asarray(self.vectors[start:start + 65536])
+                self.lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            np.save(self._file("centroids.npy"), centroids)
+            # Searches use IVF only once both are set (see nearest()).
+            self.inverted = self._build_lists(centroids)
+            self.centroids = centroids
+            self._save_meta()
+        logger.info(f"Semantic index: trained {len(centroids)} IVF lists over {self.count} vectors "
+                    f"in {time.perf_counter() - started:.1f}s")
+
+    def _start_training(self) -> None:
+        if self._trainer is None or not self._trainer.is_alive():
+            self._trainer = threading.Thread(target=self.train_ivf, name="semantic-index-ivf", daemon=True)
+            self._trainer.start()
+
+    def add(self, rows) -> None:
+        """Embed and append passages for transcript rows (id, meeting_id, transcript)."""
+        passages = [(row[0], n, row[1], text) for row in rows for n, text in enumerate(split_passages(row[2]))]
+        if not passages:
+            return
+        vectors = self.embedder.embed_many([p[3] for p in passages])
+        with self._lock:
+            start, end = self.count, self.count + len(passages)
+            if end > self.capacity:
+                capacity = self.capacity
+                while capacity < end:
+                    capacity *= 2
+                self._open(capacity)
+            self.vectors[start:end] = vectors
+            self.rows[start:end] = [p[:3] for p in passages]
+            if self.centroids is not None:
+                labels = np.argmax(vectors @ self.centroids.T, axis=1)
+                self.lists[start:end] = labels
+                for offset, label in enumerate(labels):
+                    parts = self.inverted[label]
+                    parts.append(np.array([start + offset]))
+                    if len(parts) > 32:
+                        self.inverted[label] = [np.concatenate(parts)]
+            self.count = end
+
+    def mark_changed(self, new: bool = False, transcript_ids=()) -> None:
+        """Called after commits that add, edit or delete transcripts; indexes them in the background."""
+        self._new_rows = self._new_rows or new
+        self._pending.update(transcript_ids)
+        self._start_sync()
+
+    def _background_sync(self) -> None:
+        try:
+            with session_scope() as session:
+                self.sync(session)
+        except Exception as e:
+            logger.error(f"Semantic index sync failed: {e}")
+
+    def _start_sync(self) -> None:
+        with self._syncer_lock:
+            if self._syncer is None or not self._syncer.is_alive():
+                self._syncer = threading.Thread(target=self._background_sync, name="semantic-index-sync", daemon=True)
+                self._syncer.start()
+
+    def sync(self, session, blocking: bool = True) -> int:
+        """
+        Index transcripts added since the last sync and re-index edited or deleted ones. With
+        blocking=False, returns 0 straight away if another thread or process is writing.
+        Embedding a large backlog takes a while, so requests leave this to a background thread.
+        """
+        with self._writer(blocking) as acquired:
+            if not acquired:
+                return 0
+            changed, self._pending = self._pending, set()
+            self._new_rows = False
+            if changed:
+                # Zeroed vectors never match; edited transcripts are appended again below.
+                ids = np.asarray(self.rows[:self.count, 0])
+                self.vectors[np.flatnonzero(np.isin(ids, list(changed)))] = 0
+                self.add(session.query(LearningTranscript.id, LearningTranscript.meeting_id, LearningTranscript.transcript)
+                                .filter(LearningTranscript.id.in_(changed), LearningTranscript.id <= self.watermark).all())
+            added = 0
+            while True:
+                rows = session.query(LearningTranscript.id, LearningTranscript.meeting_id, LearningTranscript.transcript)\
+                              .filter(LearningTranscript.id > self.watermark)\
+                              .order_by(LearningTranscript.id).limit(SYNC_BATCH).all()
+                if not rows:
+                    break
+                self.add(rows)
+                self.watermark = rows[-1].id
+                added += len(rows)
+                if len(rows) < SYNC_BATCH:
+                    break
+            if added or changed:
+                self._save_meta()
+                logger.info(f"Semantic index: {added} transcripts added, {len(changed)} re-indexed, {self.count} vectors")
+            self._synced_at = time.monotonic()
+        if self.centroids is None and self.count >= IVF_MIN_ROWS:
+            self._start_training()
+        return added
+
+    def _needs_sync(self) -> bool:
+        return self._new_rows or self._pending or time.monotonic() - self._synced_at > self.sync_interval
+
+    def nearest(self, query: str, k: int) -> list:
+        """Return [(transcript id, passage number, score)] for the k nearest passages."""
+        q = self.embedder.embed(query)
+        if not q.any():
+            return []
+        count, inverted, centroids = self.count, self.inverted, self.centroids
+        if centroids is None or inverted is None:
+            candidates = None
+            scores = self.vectors[:count] @ q
+        else:
+            probe = np.argpartition(centroids @ q, -min(NPROBE, len(centroids)))[-NPROBE:]
+            candidates = np.sort(np.concatenate([part for c in probe for part in inverted[c]]))
+            candidates = candidates[candidates < count]
+            scores = self.vectors[candidates] @ q
+        top = min(k, len(scores))
+        if not top:
+            return []
+        best = np.argpartition(scores, -top)[-top:]
+        best = best[np.argsort(scores[best])[::-1]]
+        positions = candidates[best] if candidates is not None else best
+        return [(int(self.rows[p, 0]), int(self.rows[p, 1]), float(scores[b]))
+                for p, b in zip(positions, best) if scores[b] > 0]
+
+    def search(self, query: str, k: int = 3, meeting_id: int = None, speaker: str = None, session=None) -> list:
+        """
+        Top-k Passages for the query among the passages indexed so far, loading passage text
+        and filtering from the database.
+        """
+        if self._needs_sync():
+            self._start_sync()
+        with session_scope(session) as session:
+            hits = self.nearest(query, k * 10 if (meeting_id is not None or speaker) else k)
+            if not hits:
+                return []
+            q = session.query(LearningTranscript.id, LearningTranscript.meeting_id,
+                              LearningTranscript.speaker_label, LearningTranscript.transcript)\
+                       .filter(LearningTranscript.id.in_({h[0] for h in hits}))
+            if meeting_id is not None:
+                q = q.filter(LearningTranscript.meeting_id == meeting_id)
+            if speaker:
+                q = q.filter(LearningTranscript.speaker_label.ilike(f"%{speaker}%"))
+            rows = {r.id: r for r in q.all()}
+        results = []
+        for transcript_id, passage_no, score in hits:
+            row = rows.get(transcript_id)
+            if row is None or speaker and not label_names(row.speaker_label, speaker):
+                continue
+            passages = split_passages(row.transcript)
+            if passage_no < len(passages):
+                results.append(Passage(row.id, row.meeting_id, row.speaker_label, passages[passage_no], score))
+            if len(results) == k:
+                break
+        return results
+
+    def stats(self) -> dict:
+        return {"vectors": self.count, "capacity": self.capacity, "watermark": self.watermark,
+                "ivf_lists": len(self.centroids) if self.centroids is not None else 0}
+
+def rebuild(path: str = INDEX_DIR, sample_size: int = 20000) -> SemanticIndex:
+    """
+    Refit the projection on a sample of passages, replace the index in `path` and re-embed
+    everything, then train the IVF lists if there are enough vectors. Running servers switch
+    to the new index on their next sync.
+    """
+    with session_scope() as session:
+        texts = [p for (t,) in session.query(LearningTranscript.transcript).order_by(LearningTranscript.id.desc())
+                 .limit(sample_size).all() for p in split_passages(t)]
+        embedder = HashingEmbedder()
+        embedder.fit(texts[:sample_size])
+        with _file_lock(path):
+            for name in ("vectors.f32", "rows.i64", "lists.i32", "centroids.npy", "components.npy", "meta.json"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+            np.save(os.path.join(path, "components.npy"), embedder.components)
+            _write_meta(path, {"generation": time.time()})
+        index = SemanticIndex(path)
+        index.sync(session)
+    if index.count >= IVF_MIN_ROWS:
+        index.train_ivf()
+    return index
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_semantic_index() -> SemanticIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SemanticIndex()
+    return _index
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_transcript_writes(session, flush_context):
+    changes = session.info.setdefault("semantic_index", {"new": False, "ids": set()})
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, LearningTranscript) and obj.id is not None:
+            changes["ids"].add(obj.id)
+    if any(isinstance(obj, LearningTranscript) for obj in session.new):
+        changes["new"] = True
+
+@event.listens_for(OrmSession, "after_commit")
+def _sync_semantic_index(session):
+    changes = session.info.pop("semantic_index", None)
+    if changes and _index is not None and (changes["new"] or changes["ids"]):
+        _index.mark_changed(changes["new"], changes["ids"])
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_transcript_writes(session):
+    session.info.pop("semantic_index", None)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build or update the semantic transcript index.")
+    parser.add_argument("--rebuild", action="store_true", help="Refit the projection and re-embed all transcripts")
+    args = parser.parse_args()
+    index = rebuild() if args.rebuild else get_semantic_index()
+    if not args.rebuild:
+        with session_scope() as session:
+            index.sync(session)
+        if index.count >= IVF_MIN_ROWS:
+            index.train_ivf()
+    print(json.dumps(index.stats()))
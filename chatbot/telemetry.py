@@ -0,0 +1,206 @@
+# telemetry.py
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 disables slow-request logging
+# Latency buckets in seconds, from 1 ms to 30 s.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label set."""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple, buckets: tuple = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in items:
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+class Gauge:
+    """Prometheus gauge (or, with inc() only, a counter) with one value per label set."""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.kind = kind
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount: float = 1, *label_values) -> None:
+        self.inc(-amount, *label_values)
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+request_duration = Histogram("chatbot_request_duration_seconds", "Duration of HTTP requests.",
+                             ("endpoint", "method", "status"))
+span_duration = Histogram("chatbot_span_duration_seconds", "Duration of traced operations within requests.",
+                          ("span",))
+sql_duration = Histogram("chatbot_sql_duration_seconds", "Duration of SQL statements.", ("operation",))
+# Everything rendered by /metrics; other modules append their own gauges and counters.
+METRICS = [request_duration, span_duration, sql_duration]
+
+class Span:
+    __slots__ = ("name", "attributes", "start", "end", "children")
+
+    def __init__(self, name: str, attributes: dict = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def tree(self, depth: int = 0) -> str:
+        """Indented text rendering of this span and its children."""
+        attributes = " ".join(f"{k}={v}" for k, v in self.attributes.items())
+        lines = [f"{'  ' * depth}{self.name} {self.duration * 1000:.1f}ms {attributes}".rstrip()]
+        lines += [child.tree(depth + 1) for child in self.children]
+        return "\n".join(lines)
+
+_current_span = ContextVar("chatbot_current_span", default=None)
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block as a child of the current span and record it in chatbot_span_duration_seconds.
+    Outside a traced request the block is only timed into the histogram.
+    """
+    parent = _current_span.get()
+    current = Span(name, attributes)
+    if parent is not None:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        span_duration.observe(current.end - current.start, name)
+
+def traced(name: str = None):
+    """Decorator running a function (sync or async) inside span(name or the function's name)."""
+    def decorator(fn):
+        span_name = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_request(name: str):
+    """Begin the root span for a request; returns a token for finish_request."""
+    root = Span(name)
+    return root, _current_span.set(root)
+
+def finish_request(started, endpoint: str, method: str, status: int) -> None:
+    """End a request's root span, record its duration and log its span tree if it was slow."""
+    root, token = started
+    root.end = time.perf_counter()
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Finished in a different context than it started (e.g. after a streamed response).
+        _current_span.set(None)
+    request_duration.observe(root.duration, endpoint, method, status)
+    if SLOW_REQUEST_MS and root.duration * 1000 >= SLOW_REQUEST_MS:
+        logger.warning(f"Slow request {method} {endpoint} ({status}):\n{root.tree()}")
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("telemetry_query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_end(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("telemetry_query_start")
+    if not starts:
+        return
+    start = starts.pop()
+    end = time.perf_counter()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    sql_duration.observe(end - start, operation)
+    parent = _current_span.get()
+    if parent is not None:
+        child = Span("sql", {"statement": " ".join(statement.split())[:80]})
+        child.start, child.end = start, end
+        parent.children.append(child)
+
+@event.listens_for(Engine, "handle_error")
+def _sql_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("telemetry_query_start"):
+        connection.info["telemetry_query_start"].pop()
@@ -0,0 +1,21 @@
+# conftest.py
+import os
+import sys
+import pytest
+
+# The chatbot modules import each other as top-level modules (they are run from chatbot/).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def database_url(tmp_path, monkeypatch):
+    """An empty SQLite database with the chatbot tables, set as DATABASE_URL."""
+    import models
+    from user_index import user_index
+    url = f"sqlite:///{tmp_path / 'chatbot.db'}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.setenv("CHAT_HISTORY_PERSIST", "0")
+    models.init_db()
+    user_index.invalidate()
+    yield url
+    models.remove_session()
+    models.get_engine(url).dispose()
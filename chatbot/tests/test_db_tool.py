@@ -0,0 +1,37 @@
+# test_db_tool.py
+from datetime import datetime
+import pytest
+from models import get_session, remove_session, LearningMeeting, MeetingParticipant, Skills, UserInfo, UserSkillRecommendation
+from db_tool import get_meeting_participants, get_skill_recommendations_by_name
+from load_test import count_queries
+from user_index import user_index
+
+PARTICIPANTS = 200
+
+@pytest.fixture
+def database(database_url):
+    session = get_session()
+    session.add_all([UserInfo(name=f"Participant {i}", email=f"p{i}@example.com", role="Employee")
+                     for i in range(PARTICIPANTS)])
+    session.add(LearningMeeting(title="All hands", scheduled_at=datetime(2024, 1, 1)))
+    session.add_all([Skills(skill_name=f"Skill {i}") for i in range(5)])
+    session.flush()
+    session.add_all([MeetingParticipant(meeting_id=1, user_id=i + 1) for i in range(PARTICIPANTS)])
+    session.add_all([UserSkillRecommendation(user_id=1, skill_id=i + 1) for i in range(5)])
+    session.commit()
+    remove_session()
+    user_index.invalidate()
+
+def test_meeting_participants_is_one_query(database):
+    with count_queries() as queries:
+        answer = get_meeting_participants(1)
+    assert queries["count"] == 1
+    assert answer.startswith("Participants in meeting 1: Participant 0, Participant 1,")
+    assert answer.count("Participant ") == PARTICIPANTS
+
+def test_skill_recommendations_by_name_is_one_query(database):
+    user_index.ensure_fresh()  # the name index is built once per process, not per request
+    with count_queries() as queries:
+        answer = get_skill_recommendations_by_name("Participant 0")
+    assert queries["count"] == 1
+    assert answer == "Recommended skills for Participant 0: Skill 0, Skill 1, Skill 2, Skill 3, Skill 4"
@@ -0,0 +1,42 @@
+# test_streaming.py
+import random
+import pytest
+from langchain_core.language_models import FakeListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage
+import chatbot_llm
+from chatbot_llm import SentenceTrimmer, truncate_to_last_sentence
+
+ANSWERS = [
+    "Alice scored 82 on average. Thanks.",
+    "The score is 3.5",
+    "The team shipped the release on time. Deployment went smoothly! Next steps are",
+    "  Is the roadmap on track? Yes. ",
+    "No sentence end here",
+    "Scores: 3.5, 4.0 and 4.5. Overall trend is up.\n",
+]
+
+def stream(text: str, rng: random.Random) -> str:
+    trimmer = SentenceTrimmer()
+    out, i = "", 0
+    while i < len(text):
+        size = rng.randint(1, 6)
+        out += trimmer.feed(text[i:i + size])
+        i += size
+    return out + trimmer.finish()
+
+def test_trimmer_matches_truncate_to_last_sentence():
+    rng = random.Random(0)
+    pieces = ["a", "b", "3", "5", ".", "!", "?", " ", "\n", "  ", "Thanks", ". "]
+    for text in ANSWERS + ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 30))) for _ in range(5000)]:
+        assert stream(text, rng) == truncate_to_last_sentence(text), repr(text)
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_stream_matches_blocking_response(database_url, monkeypatch, answer):
+    # Both calls must reach the LLM, so leave the response cache out.
+    monkeypatch.setattr(chatbot_llm, "_cache_key", lambda *args: None)
+    monkeypatch.setattr(chatbot_llm, "chain", chatbot_llm.get_chat_prompt() | FakeListChatModel(responses=[answer]))
+    query = "Summarize how the team is doing"
+    blocking = chatbot_llm.generate_response(query, "manager")
+    fake_llm = GenericFakeChatModel(messages=iter([AIMessage(content=answer)]))
+    streamed = "".join(chatbot_llm.generate_response_stream(query, "manager", llm_chain=chatbot_llm.get_chat_prompt() | fake_llm))
+    assert streamed == blocking == truncate_to_last_sentence(answer)
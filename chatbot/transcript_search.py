@@ -0,0 +1,288 @@
+# transcript_search.py
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, func, literal_column, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session as OrmSession
+from models import get_engine, session_scope, LearningTranscript
+from intent import extract_meeting_id
+from user_index import label_names
+from telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+# One retrievable chunk of a transcript.
+Passage = namedtuple("Passage", ["transcript_id", "meeting_id", "speaker_label", "text", "score"])
+
+TOP_K = int(os.getenv("TRANSCRIPT_SEARCH_TOP_K", "3"))
+BUDGET_MS = float(os.getenv("TRANSCRIPT_SEARCH_BUDGET_MS", "50"))
+PASSAGE_WORDS = int(os.getenv("TRANSCRIPT_PASSAGE_WORDS", "50"))
+SYNC_BATCH = 1000
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "to", "in", "on", "at", "by", "with", "about", "from", "me",
+    "my", "we", "our", "you", "your", "i", "it", "is", "are", "was", "were", "be", "been", "do",
+    "did", "does", "what", "which", "who", "how", "when", "where", "why", "and", "or", "but",
+    "that", "this", "these", "those", "there", "any", "so", "please", "tell", "show", "give",
+}
+
+def tokenize(text: str) -> list:
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+def split_passages(transcript: str, max_words: int = PASSAGE_WORDS) -> list:
+    """Split a transcript into passages of whole sentences, about max_words words each."""
+    passages, current, count = [], [], 0
+    for sentence in re.split(r"(?<=[.!?])\s+", transcript.strip()):
+        words = len(sentence.split())
+        if current and count + words > max_words:
+            passages.append(" ".join(current))
+            current, count = [], 0
+        current.append(sentence)
+        count += words
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+class BM25TranscriptSearch:
+    """
+    In-process BM25 inverted index over meeting_transcripts passages.
+
+    New transcripts are picked up incrementally (rows with an id above the last indexed id);
+    an update or delete of an indexed transcript triggers a full rebuild on the next search.
+    Scoring walks the query terms rarest first and stops when the latency budget is spent.
+    """
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, sync_interval: float = None):
+        self.sync_interval = sync_interval if sync_interval is not None else float(os.getenv("TRANSCRIPT_SYNC_INTERVAL", "5"))
+        self._lock = threading.Lock()
+        self._reset()
+        self._needs_rebuild = False
+        self._new_rows = True
+
+    def _reset(self) -> None:
+        self.passages = []   # (transcript id, meeting id, speaker label, text)
+        self.lengths = []
+        self.total_length = 0
+        self.postings = {}   # term -> [(passage index, term frequency)]
+        self.watermark = 0   # highest transcript id indexed
+        self._synced_at = 0.0
+
+    def mark_new_rows(self) -> None:
+        self._new_rows = True
+
+    def mark_rebuild(self) -> None:
+        self._needs_rebuild = True
+
+    def add(self, transcript_id: int, meeting_id: int, speaker_label: str, transcript: str) -> None:
+        for passage in split_passages(transcript):
+            terms = tokenize(passage)
+            index = len(self.passages)
+            self.passages.append((transcript_id, meeting_id, speaker_label, passage))
+            self.lengths.append(len(terms))
+            self.total_length += len(terms)
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, tf in frequencies.items():
+                self.postings.setdefault(term, []).append((index, tf))
+        self.watermark = max(self.watermark, transcript_id)
+
+    def sync(self, session) -> int:
+        """Index transcripts added since the last sync. Returns the number of new rows."""
+        with self._lock:
+            if self._needs_rebuild:
+                self._reset()
+                self._needs_rebuild = False
+            self._new_rows = False
+            added = 0
+            while True:
+                rows = session.query(LearningTranscript.id, LearningTranscript.meeting_id,
+                                     LearningTranscript.speaker_label, LearningTranscript.transcript)\
+                              .filter(LearningTranscript.id > self.watermark)\
+                              .order_by(LearningTranscript.id).limit(SYNC_BATCH).all()
+                for row in rows:
+                    self.add(row.id, row.meeting_id, row.speaker_label, row.transcript)
+                added += len(rows)
+                if len(rows) < SYNC_BATCH:
+                    break
+            self._synced_at = time.monotonic()
+            if added:
+                logger.info(f"Transcript index: {added} transcripts added, {len(self.passages)} passages")
+            return added
+
+    def _needs_sync(self) -> bool:
+        return (self._needs_rebuild or self._new_rows
+                or time.monotonic() - self._synced_at > self.sync_interval)
+
+    def search(self, query: str, k: int = TOP_K, meeting_id: int = None, speaker: str = None,
+               session=None, budget_ms: float = BUDGET_MS) -> list:
+        if self._needs_sync():
+            with session_scope(session) as session:
+                self.sync(session)
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        passages, lengths, postings_by_term = self.passages, self.lengths, self.postings
+        count = len(passages)
+        if not count:
+            return []
+        average_length = self.total_length / count or 1.0
+        speaker_labels = {}  # label -> whether it names the speaker
+
+        terms = [(t, postings_by_term[t]) for t in set(tokenize(query)) if t in postings_by_term]
+        terms.sort(key=lambda item: len(item[1]))  # rarest (highest idf) first
+        scores = {}
+        for term, postings in terms:
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, tf in postings:
+                _, passage_meeting, passage_speaker, _ = passages[index]
+                if meeting_id is not None and passage_meeting != meeting_id:
+                    continue
+                if speaker:
+                    if passage_speaker not in speaker_labels:
+                        speaker_labels[passage_speaker] = label_names(passage_speaker, speaker)
+                    if not speaker_labels[passage_speaker]:
+                        continue
+                norm = tf + self.k1 * (1 - self.b + self.b * lengths[index] / average_length)
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self.k1 + 1) / norm
+            if time.perf_counter() > deadline:
+                logger.warning(f"Transcript search hit its {budget_ms}ms budget; returning partial results")
+                break
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [Passage(*passages[index], score) for index, score in best]
+
+    def stats(self) -> dict:
+        return {"backend": "bm25", "passages": len(self.passages), "terms": len(self.postings),
+                "watermark": self.watermark}
+
+class PostgresTranscriptSearch:
+    """
+    Full-text search in PostgreSQL using the GIN index on to_tsvector('english', transcript)
+    (ix_meeting_transcripts_fts). The latency budget is enforced with statement_timeout, set
+    inside a savepoint that is rolled back afterwards, so the caller's transaction is left as
+    it was.
+    """
+    _config = literal_column("'english'::regconfig")
+
+    def search(self, query: str, k: int = TOP_K, meeting_id: int = None, speaker: str = None,
+               session=None, budget_ms: float = BUDGET_MS) -> list:
+        terms = tokenize(query)
+        if not terms:
+            return []
+        ts_query = func.to_tsquery(self._config, " | ".join(terms))
+        document = func.to_tsvector(self._config, LearningTranscript.transcript)
+        rank = func.ts_rank(document, ts_query).label("score")
+        headline = func.ts_headline(self._config, LearningTranscript.transcript, ts_query,
+                                    f"MaxWords={PASSAGE_WORDS}, MinWords=15, StartSel=\"\", StopSel=\"\"")
+        with session_scope(session) as session:
+            savepoint = session.begin_nested()
+            try:
+                session.execute(text(f"SET LOCAL statement_timeout = {max(1, int(budget_ms))}"))
+                q = session.query(LearningTranscript.id, LearningTranscript.meeting_id,
+                                  LearningTranscript.speaker_label, headline, rank)\
+                           .filter(document.op("@@")(ts_query))
+                if meeting_id is not None:
+                    q = q.filter(LearningTranscript.meeting_id == meeting_id)
+                if speaker:
+                    q = q.filter(LearningTranscript.speaker_label.op("~*")(self._speaker_pattern(speaker)))
+                rows = q.order_by(rank.desc()).limit(k).all()
+            except DBAPIError as e:
+                logger.warning(f"Transcript search failed or exceeded its {budget_ms}ms budget: {e}")
+                return []
+            finally:
+                savepoint.rollback()  # also undoes SET LOCAL
+        return [Passage(*row) for row in rows if not speaker or label_names(row.speaker_label, speaker)]
+
+    @staticmethod
+    def _speaker_pattern(speaker: str) -> str:
+        # The name as whole words, case-insensitively; label_names() then checks the rows.
+        words = [re.sub(r"(\W)", r"\\\1", word) for word in speaker.split()]
+        return r"(^|\W)" + r"\s+".join(words) + r"(\W|$)"
+
+    def stats(self) -> dict:
+        return {"backend": "postgres"}
+
+_search_backend = None
+_backend_lock = threading.Lock()
+
+def get_transcript_search():
+    """
+    The process-wide search backend chosen by TRANSCRIPT_SEARCH: 'postgres', 'bm25' or
+    'auto' (PostgreSQL full-text search on PostgreSQL databases, BM25 otherwise).
+    """
+    global _search_backend
+    if _search_backend is None:
+        with _backend_lock:
+            if _search_backend is None:
+                choice = os.getenv("TRANSCRIPT_SEARCH", "auto").lower()
+                if choice == "auto":
+                    choice = "postgres" if get_engine().dialect.name == "postgresql" else "bm25"
+                _search_backend = PostgresTranscriptSearch() if choice == "postgres" else BM25TranscriptSearch()
+    return _search_backend
+
+def semantic_search_enabled() -> bool:
+    return os.getenv("SEMANTIC_SEARCH", "0").lower() in ("1", "true", "yes")
+
+def _fuse(result_lists, k: int) -> list:
+    """Reciprocal rank fusion of several ranked Passage lists."""
+    scores, passages = {}, {}
+    for results in result_lists:
+        for rank, passage in enumerate(results):
+            key = (passage.transcript_id, passage.text)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (60 + rank)
+            passages.setdefault(key, passage)
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [passages[key]._replace(score=score) for key, score in best]
+
+@traced("search_transcripts")
+def search_transcripts(query: str, k: int = TOP_K, meeting_id: int = None, speaker: str = None, session=None) -> list:
+    """
+    Return up to k transcript passages relevant to the query, best first. With
+    SEMANTIC_SEARCH=1, keyword and semantic (semantic_index.py) results are fused.
+    """
+    results = get_transcript_search().search(query, k, meeting_id=meeting_id, speaker=speaker, session=session)
+    if not semantic_search_enabled():
+        return results
+    # Imported here so numpy is only loaded when semantic search is used.
+    from semantic_index import get_semantic_index
+    semantic = get_semantic_index().search(query, k, meeting_id=meeting_id, speaker=speaker, session=session)
+    return _fuse([results, semantic], k)
+
+def relevant_transcript_context(query: str, speaker: str = None, session=None) -> str:
+    """
+    Context section with the transcript passages most relevant to the query. A meeting named
+    in the query ("meeting 3") restricts the search to that meeting; `speaker` restricts it
+    to one speaker's lines.
+    """
+    passages = search_transcripts(query, meeting_id=extract_meeting_id(query), speaker=speaker, session=session)
+    if not passages:
+        return ""
+    lines = [f"- [Meeting {p.meeting_id}, {p.speaker_label}] {p.text}" for p in passages]
+    return "Relevant Transcript Passages:\n" + "\n".join(lines) + "\n"
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_transcript_writes(session, flush_context):
+    """Record transcript writes; the BM25 index picks them up after the commit."""
+    if any(isinstance(obj, LearningTranscript) for obj in list(session.dirty) + list(session.deleted)):
+        session.info["transcript_index"] = "rebuild"
+    elif any(isinstance(obj, LearningTranscript) for obj in session.new):
+        session.info.setdefault("transcript_index", "new")
+
+@event.listens_for(OrmSession, "after_commit")
+def _sync_transcript_index(session):
+    change = session.info.pop("transcript_index", None)
+    if change and isinstance(_search_backend, BM25TranscriptSearch):
+        if change == "rebuild":
+            _search_backend.mark_rebuild()
+        else:
+            _search_backend.mark_new_rows()
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_transcript_writes(session):
+    session.info.pop("transcript_index", None)
@@ -0,0 +1,167 @@
+# user_index.py
+import bisect
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as OrmSession
+from models import get_engine, UserInfo
+
+logger = logging.getLogger(__name__)
+
+# The user a chat request is about, resolved once and passed to every context/tool call.
+ResolvedUser = namedtuple("ResolvedUser", ["id", "name", "email", "role", "department"])
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and collapse whitespace."""
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.lower().split())
+
+def label_words(label: str) -> list:
+    """The normalized words of a speaker label ("Employee - Alice Johnson")."""
+    return normalize_name(label.replace("-", " ").replace(":", " ")).split()
+
+def label_name_windows(label: str) -> set:
+    """Every run of up to four words in a speaker label, to look names up in."""
+    words = label_words(label)
+    return {" ".join(words[start:start + size])
+            for size in range(1, 5) for start in range(len(words) - size + 1)}
+
+def label_names(label: str, name: str) -> bool:
+    """Whether the speaker label contains `name` as whole words ("Bob Tester1" is not in "Bob Tester12")."""
+    words, target = label_words(label), label_words(name)
+    return bool(target) and any(words[start:start + len(target)] == target
+                                for start in range(len(words) - len(target) + 1))
+
+class UserNameIndex:
+    """
+    In-memory index of user names supporting exact, prefix and token matches.
+
+    The index is rebuilt lazily on the next lookup after a UserInfo row is inserted, updated
+    or deleted through SQLAlchemy in this process, and at least every `ttl` seconds to pick
+    up changes made by other processes.
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("USER_INDEX_TTL", "300"))
+        self._lock = threading.Lock()
+        self._stale = True
+        self._built_at = 0.0
+        self._users = {}          # id -> ResolvedUser
+        self._exact = {}          # normalized name -> [ids]
+        self._sorted_names = []   # sorted (normalized name, id) pairs for prefix search
+        self._tokens = {}         # name token -> set of ids
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def _needs_refresh(self) -> bool:
+        return self._stale or (time.monotonic() - self._built_at) > self.ttl
+
+    def refresh(self) -> None:
+        # A connection of its own rather than the request's session, so the index can also be
+        # used from session event listeners.
+        with get_engine().connect() as connection:
+            rows = connection.execute(select(UserInfo.id, UserInfo.name, UserInfo.email,
+                                             UserInfo.role, UserInfo.department)).all()
+        users, exact, sorted_names, tokens = {}, {}, [], {}
+        for row in rows:
+            user = ResolvedUser(row.id, row.name, row.email, row.role, row.department)
+            users[user.id] = user
+            key = normalize_name(user.name)
+            exact.setdefault(key, []).append(user.id)
+            sorted_names.append((key, user.id))
+            for token in key.split():
+                tokens.setdefault(token, set()).add(user.id)
+        sorted_names.sort()
+        self._users, self._exact, self._sorted_names, self._tokens = users, exact, sorted_names, tokens
+        self._built_at = time.monotonic()
+        self._stale = False
+        logger.info(f"User name index built with {len(users)} users")
+
+    def ensure_fresh(self) -> None:
+        """Rebuild the index now if it is stale (a blocking query; see async_context.aresolve_user)."""
+        if self._needs_refresh():
+            with self._lock:
+                if self._needs_refresh():
+                    self.refresh()
+
+    def get(self, user_id: int):
+        self.ensure_fresh()
+        return self._users.get(user_id)
+
+    def lookup(self, name: str):
+        """
+        Resolve a name to a ResolvedUser, or None.
+        Tries an exact match, then a name prefix, then users matching every query token,
+        then a substring match; ties go to the lowest user id.
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+        self.ensure_fresh()
+
+        ids = self._exact.get(key)
+        if ids:
+            return self._users[min(ids)]
+
+        start = bisect.bisect_left(self._sorted_names, (key,))
+        prefix_ids = []
+        for candidate, user_id in self._sorted_names[start:]:
+            if not candidate.startswith(key):
+                break
+            prefix_ids.append(user_id)
+        if prefix_ids:
+            return self._users[min(prefix_ids)]
+
+        token_sets = [self._tokens.get(token, set()) for token in key.split()]
+        if token_sets:
+            common = set.intersection(*token_sets)
+            if common:
+                return self._users[min(common)]
+
+        substring_ids = [user_id for candidate, user_id in self._sorted_names if key in candidate]
+        if substring_ids:
+            return self._users[min(substring_ids)]
+        return None
+
+    def find_in_text(self, text: str):
+        """
+        Find a user mentioned by full name in free text (e.g. a chat query), or None.
+        Unlike lookup(), only whole-name matches count, so ordinary words never match.
+        """
+        words = normalize_name(text.replace("'s", " ").replace("?", " ").replace(",", " ")).split()
+        self.ensure_fresh()
+        for size in (3, 2):
+            for start in range(len(words) - size + 1):
+                ids = self._exact.get(" ".join(words[start:start + size]))
+                if ids:
+                    return self._users[min(ids)]
+        return None
+
+    def ids_named(self, names) -> set:
+        """Ids of the users whose full name, normalized, is one of `names` (normalized names)."""
+        self.ensure_fresh()
+        return {user_id for name in names for user_id in self._exact.get(name, ())}
+
+    def departments(self) -> set:
+        """Distinct department names of the indexed users."""
+        self.ensure_fresh()
+        return {user.department for user in self._users.values() if user.department}
+
+user_index = UserNameIndex()
+
+def resolve_user(user_name: str):
+    """Resolve a user name to a ResolvedUser (or None) using the shared in-memory index."""
+    return user_index.lookup(user_name) if user_name else None
+
+@event.listens_for(OrmSession, "after_flush")
+def _invalidate_on_user_change(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, UserInfo):
+            user_index.invalidate()
+            return
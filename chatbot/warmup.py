@@ -0,0 +1,75 @@
+# warmup.py
+import logging
+import os
+import time
+from sqlalchemy import text
+from models import get_engine
+
+logger = logging.getLogger(__name__)
+
+def warm_up_enabled() -> bool:
+    return os.getenv("CHATBOT_WARM_UP", "0").lower() in ("1", "true", "yes")
+
+def _open_pool(connections: int) -> None:
+    # Check out several connections at once so the pool holds that many open ones afterwards.
+    engine = get_engine()
+    opened = []
+    try:
+        for _ in range(connections if engine.dialect.name != "sqlite" else 1):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            opened.append(connection)
+    finally:
+        for connection in opened:
+            connection.close()
+
+def warm_up(prime_caches: bool = True) -> dict:
+    """
+    Do the work a worker would otherwise do on its first requests: open database connections,
+    build the user name index and transcript search indexes, construct the LLM client and
+    (optionally) prime the context cache for the role-wide contexts.
+    Returns the time spent on each step in milliseconds. A failing step is logged and skipped.
+    """
+    if not os.getenv("DATABASE_URL"):
+        raise ValueError("DATABASE_URL environment variable is not set.")
+    # Imported here so that importing this module (e.g. from app.py) stays cheap.
+    import chatbot_llm
+    from user_index import user_index
+    from transcript_search import get_transcript_search, semantic_search_enabled, BM25TranscriptSearch
+    from db_context import retrieve_db_context
+    from models import session_scope
+
+    def sync_transcript_index():
+        search = get_transcript_search()
+        if isinstance(search, BM25TranscriptSearch):
+            with session_scope() as session:
+                search.sync(session)
+
+    def sync_semantic_index():
+        # Imported here so numpy is only loaded when semantic search is used.
+        from semantic_index import get_semantic_index
+        with session_scope() as session:
+            get_semantic_index().sync(session)
+
+    steps = [
+        ("db_pool", lambda: _open_pool(int(os.getenv("DB_POOL_SIZE", "5")))),
+        ("user_index", user_index.refresh),
+        ("transcript_index", sync_transcript_index),
+    ]
+    if semantic_search_enabled():
+        steps.append(("semantic_index", sync_semantic_index))
+    steps.append(("llm_chain", chatbot_llm.warm_up_llm))
+    if prime_caches:
+        steps += [("context_manager", lambda: retrieve_db_context("manager")),
+                  ("context_hr", lambda: retrieve_db_context("hr"))]
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"Warm-up step '{name}' failed: {e}")
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"Warm-up finished: {timings}")
+    return timings
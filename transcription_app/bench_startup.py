@@ -0,0 +1,88 @@
+"""
+Startup-time benchmark for the transcription CLI.
+
+Runs `python -X importtime main.py --help` a few times, reports wall time and the slowest
+imports, and exits non-zero if startup pulls in a heavy module or exceeds the time budget.
+Usage:
+    python bench_startup.py [--runs 5] [--budget-ms 250] [--top 10]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+# Modules that must never be imported just to print --help or validate arguments.
+FORBIDDEN_MODULES = ("whisper", "torch", "sklearn", "sqlalchemy", "pyarrow", "pydub", "numpy")
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output into a list of (module, self_us, cumulative_us).
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            fields = line[len("import time:"):].split("|")
+            self_us = int(fields[0].strip())
+            cumulative_us = int(fields[1].strip())
+            name = fields[2].strip()
+        except (ValueError, IndexError):
+            continue
+        imports.append((name, self_us, cumulative_us))
+    return imports
+
+
+def run_once(args):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", MAIN_PATH] + args,
+                          capture_output=True, text=True)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        sys.exit(f"FAIL: CLI exited with code {proc.returncode}")
+    return elapsed_ms, parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcription CLI startup time")
+    parser.add_argument("--runs", type=int, default=5, help="Number of CLI launches to time")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Maximum allowed median startup time")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to report")
+    args = parser.parse_args()
+
+    timings = []
+    imports = []
+    for _ in range(args.runs):
+        elapsed_ms, imports = run_once(["--help"])
+        timings.append(elapsed_ms)
+    timings.sort()
+    median_ms = timings[len(timings) // 2]
+
+    print(f"Startup time over {args.runs} runs: median {median_ms:.1f} ms, "
+          f"min {timings[0]:.1f} ms, max {timings[-1]:.1f} ms")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for name, self_us, cumulative_us in sorted(imports, key=lambda i: i[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:16.2f} {self_us / 1000:10.2f}  {name}")
+
+    failures = []
+    imported = {name for name, _, _ in imports}
+    heavy = sorted(m for m in imported if m.split(".")[0] in FORBIDDEN_MODULES)
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if median_ms > args.budget_ms:
+        failures.append(f"median startup {median_ms:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: startup is within budget.")
+
+
+if __name__ == "__main__":
+    main()
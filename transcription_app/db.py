@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
+from sqlalchemy import create_engine, update, Column, Integer, String, Text, DateTime, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -52,3 +53,107 @@ def insert_transcript_lines_sqlalchemy(db_url = DB_URL, transcript_lines=[]):
         print(f"Error inserting transcript lines: {e}")
     finally:
         session.close()
+
+
+class IncrementalTranscriptWriter:
+    """
+    Persist Whisper segments while transcription is still running.
+
+    Segments are appended in small batches (one transaction per batch) with a provisional
+    speaker label, so a crash loses at most one batch. Once diarization and role assignment
+    finish, update_speakers() rewrites every row's speaker label in one bulk UPDATE.
+    A batch that still cannot be written after `retries` retries raises, so at most one
+    batch is ever pending.
+    """
+
+    def __init__(self, db_url=DB_URL, meeting_id=None, batch_size=20, provisional_label="Unassigned", retries=3):
+        self.engine = create_engine(db_url)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.meeting_id = meeting_id
+        self.batch_size = batch_size
+        self.provisional_label = provisional_label
+        self.retries = retries
+        self.row_ids = {}  # Whisper segment id -> transcripts.id
+        self._pending = []
+
+    def add_segments(self, segments):
+        """Queue newly decoded segments; a batch is written once batch_size segments are pending."""
+        for seg in segments:
+            if seg.get('text', '').strip():
+                self._pending.append(seg)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert all pending segments in a single transaction, retrying with backoff before raising."""
+        for attempt in range(self.retries + 1):
+            try:
+                self._insert_pending()
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Error persisting transcript segments; giving up after {attempt + 1} attempts: {e}")
+                    raise
+                print(f"Error persisting transcript segments (attempt {attempt + 1}), retrying: {e}")
+                time.sleep(2 ** attempt)
+
+    def _insert_pending(self):
+        if not self._pending:
+            return
+        session = self.Session()
+        try:
+            entries = []
+            for seg in self._pending:
+                entry = Transcript(
+                    meeting_id=self.meeting_id,
+                    speaker_label=self.provisional_label,
+                    transcript=seg.get('text', '').strip(),
+                    start_time=seg.get('start'),
+                    end_time=seg.get('end')
+                )
+                entries.append((seg.get('id'), entry))
+            session.add_all([entry for _, entry in entries])
+            session.commit()
+            for segment_id, entry in entries:
+                self.row_ids[segment_id] = entry.id
+            print(f"Persisted {len(entries)} transcript segments.")
+            self._pending = []
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def update_speakers(self, segments):
+        """
+        Replace the provisional speaker labels with "<role> - <speaker>" in one bulk UPDATE.
+        """
+        self.flush()
+        updates = []
+        for seg in segments:
+            row_id = self.row_ids.get(seg.get('id'))
+            if row_id is None:
+                continue
+            updates.append({
+                "id": row_id,
+                "speaker_label": f"{seg.get('role', 'Unknown')} - {seg.get('speaker', 'Unknown')}"
+            })
+        if not updates:
+            return
+        session = self.Session()
+        try:
+            session.execute(update(Transcript), updates)
+            session.commit()
+            print(f"Updated speaker labels for {len(updates)} transcript segments.")
+        except Exception as e:
+            session.rollback()
+            print(f"Error updating speaker labels: {e}")
+        finally:
+            session.close()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.engine.dispose()
@@ -0,0 +1,374 @@
+"""
+Diarization speed/accuracy evaluation harness.
+
+Runs the diarization pipeline (get_speech_embeddings -> cluster_speakers ->
+assign_transcript_to_speakers) under every combination of feature backend, clustering
+strategy and VAD gating, and prints diarization error rate (DER) next to wall time, the
+process's peak resident memory during the run (sampled, Linux only) and the peak of the
+allocations tracemalloc sees (Python and NumPy, not torch), so performance changes can be
+judged against accuracy.
+
+Reference speakers come from an RTTM file for a real recording, or from a synthetic meeting:
+    python diarization_eval.py --synthetic --speakers 3 --turns 40
+    python diarization_eval.py --audio meeting.wav --rttm meeting.rttm --segments whisper.json
+"""
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+import argparse
+import itertools
+
+import numpy as np
+
+from vad_processor import get_speech_embeddings, cluster_speakers, assign_transcript_to_speakers
+
+SAMPLE_RATE = 16000
+FRAME_STEP = 0.01  # DER is scored on 10 ms frames.
+
+
+# --- Reference annotations ---
+
+def read_rttm(path):
+    """
+    Read speaker turns from an RTTM file.
+    Returns a list of dictionaries with 'start', 'end' and 'speaker'.
+    """
+    turns = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 8 or fields[0] != "SPEAKER":
+                continue
+            start = float(fields[3])
+            duration = float(fields[4])
+            turns.append({'start': start, 'end': start + duration, 'speaker': fields[7]})
+    return turns
+
+
+def generate_synthetic_meeting(n_speakers=2, n_turns=20, seed=0):
+    """
+    Build a synthetic meeting: each speaker is a harmonic voice with its own pitch and
+    brightness, turns are separated by silence. Returns (waveform, reference turns).
+    """
+    rng = np.random.default_rng(seed)
+    voices = [(110.0 + 45.0 * i, 0.4 + 0.5 * i / max(1, n_speakers - 1)) for i in range(n_speakers)]
+    chunks = []
+    turns = []
+    cursor = 0.0
+    previous = None
+    for _ in range(n_turns):
+        speaker = int(rng.integers(n_speakers))
+        if speaker == previous and n_speakers > 1:
+            speaker = (speaker + 1) % n_speakers
+        previous = speaker
+        duration = float(rng.uniform(1.5, 4.0))
+        gap = float(rng.uniform(0.7, 1.2))
+        pitch, brightness = voices[speaker]
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        voice = sum((brightness ** k) * np.sin(2 * np.pi * pitch * (k + 1) * t) for k in range(8))
+        voice = voice * (0.6 + 0.4 * np.sin(2 * np.pi * 3.0 * t) ** 2)
+        voice = voice + 0.05 * rng.standard_normal(len(t))
+        chunks.append(np.zeros(int(gap * SAMPLE_RATE)))
+        chunks.append(0.3 * voice / np.max(np.abs(voice)))
+        start = cursor + gap
+        turns.append({'start': start, 'end': start + duration, 'speaker': f"ref{speaker + 1}"})
+        cursor = start + duration
+    chunks.append(np.zeros(int(SAMPLE_RATE)))
+    return np.concatenate(chunks).astype(np.float32), turns
+
+
+# --- VAD gating strategies (same interface as Silero's get_speech_timestamps) ---
+
+def energy_speech_timestamps(wav, model=None, sampling_rate=SAMPLE_RATE, min_speech_duration_ms=500,
+                             min_silence_duration_ms=500, threshold=0.02, **kwargs):
+    """
+    Frame-energy VAD: 30 ms frames above `threshold` RMS are speech; short gaps are merged.
+    """
+    wav = np.asarray(wav, dtype=np.float32)
+    frame = int(0.03 * sampling_rate)
+    n_frames = len(wav) // frame
+    if n_frames == 0:
+        return []
+    rms = np.sqrt(np.mean(wav[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    active = rms > threshold
+    timestamps = []
+    start = None
+    for i, is_speech in enumerate(np.append(active, False)):
+        if is_speech and start is None:
+            start = i * frame
+        elif not is_speech and start is not None:
+            timestamps.append({'start': start, 'end': i * frame})
+            start = None
+    merged = []
+    for ts in timestamps:
+        if merged and ts['start'] - merged[-1]['end'] < min_silence_duration_ms * sampling_rate / 1000:
+            merged[-1]['end'] = ts['end']
+        else:
+            merged.append(ts)
+    min_samples = min_speech_duration_ms * sampling_rate / 1000
+    return [ts for ts in merged if ts['end'] - ts['start'] >= min_samples]
+
+
+def oracle_speech_timestamps(reference):
+    """VAD gating from the reference turns (upper bound for the other strategies)."""
+    def get_speech_timestamps(wav, model=None, sampling_rate=SAMPLE_RATE, **kwargs):
+        return [{'start': int(t['start'] * sampling_rate), 'end': int(t['end'] * sampling_rate)}
+                for t in reference]
+    return get_speech_timestamps
+
+
+def silero_speech_timestamps():
+    from vad_processor import load_silero_vad
+    vad_model, get_speech_timestamps, _ = load_silero_vad()
+    if vad_model is None:
+        raise RuntimeError("Silero VAD failed to load")
+    return vad_model, get_speech_timestamps
+
+
+# --- Feature backends ---
+
+def numpy_speech_embeddings(audio_path, vad_model, get_speech_timestamps, read_audio):
+    """
+    NumPy port of get_speech_embeddings (same band energies, zero-crossing rate and energy),
+    using a framed rFFT instead of torch.stft.
+    """
+    wav = np.asarray(read_audio(audio_path, sampling_rate=SAMPLE_RATE), dtype=np.float32)
+    speech_timestamps = get_speech_timestamps(wav, vad_model, sampling_rate=SAMPLE_RATE,
+                                              min_speech_duration_ms=500,
+                                              max_speech_duration_s=float('inf'),
+                                              min_silence_duration_ms=500)
+    window = np.hanning(400).astype(np.float32)
+    embeddings = []
+    segments = []
+    for ts in speech_timestamps:
+        segment = wav[ts['start']:ts['end']]
+        if len(segment) < 1600:
+            continue
+        padded = np.pad(segment, 256, mode='reflect')
+        n_frames = 1 + (len(padded) - 512) // 160
+        idx = np.arange(512)[None, :] + 160 * np.arange(n_frames)[:, None]
+        frames = padded[idx]
+        frames[:, 56:456] *= window
+        frames[:, :56] = 0
+        frames[:, 456:] = 0
+        spec = np.abs(np.fft.rfft(frames, axis=1)).T
+        feature_vector = [float(np.mean(spec[low:high, :]))
+                          for low, high in [(0, 10), (10, 20), (20, 50), (50, 100), (100, 256)]]
+        signs = np.sign(segment)
+        feature_vector.append(float(np.sum(np.abs(signs[1:] - signs[:-1])) / 2 / len(segment)))
+        feature_vector.append(float(np.mean(np.abs(segment))))
+        embeddings.append(feature_vector)
+        segments.append({'start': ts['start'] / SAMPLE_RATE, 'end': ts['end'] / SAMPLE_RATE,
+                         'length': (ts['end'] - ts['start']) / SAMPLE_RATE})
+    return np.array(embeddings), segments
+
+
+FEATURE_BACKENDS = {
+    "torch": get_speech_embeddings,
+    "numpy": numpy_speech_embeddings,
+}
+
+
+# --- Scoring ---
+
+def _frame_matrix(turns, labels, n_frames):
+    matrix = np.zeros((n_frames, len(labels)), dtype=bool)
+    index = {label: i for i, label in enumerate(labels)}
+    for t in turns:
+        if t.get('speaker') not in index:
+            continue
+        start = int(round(t['start'] / FRAME_STEP))
+        end = int(round(t['end'] / FRAME_STEP))
+        matrix[start:end, index[t['speaker']]] = True
+    return matrix
+
+
+def diarization_error_rate(reference, hypothesis):
+    """
+    Frame-level DER = (missed speech + false alarm + speaker confusion) / reference speech,
+    using the speaker mapping that maximises overlap. Hypothesis segments labelled "Unknown"
+    count as non-speech.
+    """
+    hypothesis = [h for h in hypothesis if h.get('speaker', 'Unknown') != 'Unknown']
+    ref_labels = sorted({t['speaker'] for t in reference})
+    hyp_labels = sorted({h['speaker'] for h in hypothesis})
+    end = max([t['end'] for t in reference] + [h['end'] for h in hypothesis] + [0.0])
+    n_frames = int(round(end / FRAME_STEP)) + 1
+    ref = _frame_matrix(reference, ref_labels, n_frames)
+    hyp = _frame_matrix(hypothesis, hyp_labels, n_frames)
+    total = ref.sum()
+    if total == 0:
+        return 0.0
+    overlap = ref.T.astype(np.int64) @ hyp.astype(np.int64)
+    try:
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(-overlap)
+        pairs = list(zip(rows, cols))
+    except ImportError:
+        # Greedy mapping is exact for the small speaker counts used here in practice.
+        pairs = []
+        used_r, used_c = set(), set()
+        for r, c in sorted(np.ndindex(overlap.shape), key=lambda rc: -overlap[rc]):
+            if r not in used_r and c not in used_c:
+                pairs.append((r, c))
+                used_r.add(r)
+                used_c.add(c)
+    correct = np.zeros(n_frames, dtype=np.int64)
+    for r, c in pairs:
+        correct += ref[:, r] & hyp[:, c]
+    errors = np.maximum(ref.sum(axis=1), hyp.sum(axis=1)) - correct
+    return float(errors.sum() / total)
+
+
+# --- Harness ---
+
+class PeakRSS:
+    """
+    Samples the process's resident set size on a background thread while the block runs;
+    `peak_mb` is the highest value seen, or None where /proc/self/statm is unavailable.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _rss_mb():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _sample(self):
+        while True:
+            rss = self._rss_mb()
+            if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+                self.peak_mb = rss
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        rss = self._rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+
+def run_configuration(wav, reference, transcript_segments, backend, clustering, vad,
+                      min_speakers, max_speakers):
+    """Run the pipeline once and return a result row."""
+    read_audio = lambda path, sampling_rate=SAMPLE_RATE: wav
+    if vad == "energy":
+        vad_model, get_speech_timestamps = None, energy_speech_timestamps
+    elif vad == "oracle":
+        vad_model, get_speech_timestamps = None, oracle_speech_timestamps(reference)
+    elif vad == "silero":
+        vad_model, get_speech_timestamps = silero_speech_timestamps()
+    else:
+        raise ValueError(f"Unknown VAD gating: {vad}")
+    if clustering == "fixed":
+        n_ref = len({t['speaker'] for t in reference})
+        min_speakers = max_speakers = n_ref
+
+    segments = [dict(s) for s in transcript_segments]
+    tracemalloc.start()
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        embeddings, vad_segments = FEATURE_BACKENDS[backend](None, vad_model, get_speech_timestamps, read_audio)
+        if embeddings is not None and len(embeddings) > 1:
+            # cluster_speakers labels everything "Speaker 1" when it cannot form two or more
+            # clusters (a single reference speaker, or fewer segments than clusters).
+            vad_segments = cluster_speakers(embeddings, vad_segments, min_speakers=min_speakers,
+                                            max_speakers=max_speakers)
+            segments = assign_transcript_to_speakers(segments, vad_segments)
+        else:
+            for seg in segments:
+                seg['speaker'] = "Unknown"
+        wall_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "backend": backend,
+        "clustering": clustering,
+        "vad": vad,
+        "der": diarization_error_rate(reference, segments),
+        "wall_time": wall_time,
+        "peak_rss_mb": rss.peak_mb,
+        "traced_peak_mb": peak / (1024 * 1024),
+        "n_vad_segments": len(vad_segments or []),
+    }
+
+
+def print_table(rows):
+    header = (f"{'backend':<8} {'clustering':<11} {'vad':<7} {'DER %':>7} {'time [s]':>9} {'peak RSS [MB]':>14} "
+              f"{'traced peak [MB]':>17} {'VAD segs':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in sorted(rows, key=lambda r: (r['der'], r['wall_time'])):
+        rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else "n/a"
+        print(f"{r['backend']:<8} {r['clustering']:<11} {r['vad']:<7} {100 * r['der']:7.2f} "
+              f"{r['wall_time']:9.3f} {rss:>14} {r['traced_peak_mb']:17.1f} {r['n_vad_segments']:9d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate diarization speed vs. accuracy across configurations")
+    parser.add_argument("--audio", help="16 kHz mono WAV file to diarize")
+    parser.add_argument("--rttm", help="Reference RTTM annotations for --audio")
+    parser.add_argument("--segments", help="Whisper result JSON whose segments are labelled (default: reference turns)")
+    parser.add_argument("--synthetic", action="store_true", help="Use a generated meeting with known speakers")
+    parser.add_argument("--speakers", type=int, default=2, help="Speakers in the synthetic meeting")
+    parser.add_argument("--turns", type=int, default=20, help="Turns in the synthetic meeting")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic meeting")
+    parser.add_argument("--backends", default="torch,numpy", help="Comma-separated feature backends")
+    parser.add_argument("--clustering", default="silhouette,fixed",
+                        help="Comma-separated clustering strategies: silhouette (search min..max) or fixed (reference count)")
+    parser.add_argument("--vad", default="energy,oracle", help="Comma-separated VAD gating: energy, oracle, silero")
+    parser.add_argument("--min-speakers", type=int, default=2, help="Minimum speakers for silhouette search")
+    parser.add_argument("--max-speakers", type=int, default=5, help="Maximum speakers for silhouette search")
+    parser.add_argument("--json", help="Also write the result rows to this JSON file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        wav, reference = generate_synthetic_meeting(args.speakers, args.turns, args.seed)
+    elif args.audio and args.rttm:
+        import torchaudio
+        waveform, sample_rate = torchaudio.load(args.audio)
+        if sample_rate != SAMPLE_RATE:
+            waveform = torchaudio.functional.resample(waveform, sample_rate, SAMPLE_RATE)
+        wav = waveform.mean(dim=0).numpy()
+        reference = read_rttm(args.rttm)
+    else:
+        parser.error("Provide --synthetic or both --audio and --rttm")
+
+    if args.segments:
+        with open(args.segments, 'r', encoding='utf-8') as f:
+            transcript_segments = json.load(f)["segments"]
+    else:
+        transcript_segments = [{'start': t['start'], 'end': t['end'], 'text': ""} for t in reference]
+
+    rows = []
+    for backend, clustering, vad in itertools.product(args.backends.split(","), args.clustering.split(","),
+                                                      args.vad.split(",")):
+        print(f"Running backend={backend}, clustering={clustering}, vad={vad}", file=sys.stderr)
+        rows.append(run_configuration(wav, reference, transcript_segments, backend, clustering, vad,
+                                      args.min_speakers, args.max_speakers))
+    print_table(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import json
+import math
+
+# Column order shared by every export format.
+SEGMENT_FIELDS = ("meeting_id", "segment_id", "start_time", "end_time", "speaker", "role", "transcript", "confidence")
+
+
+def segment_to_record(seg, meeting_id=None):
+    """
+    Convert a Whisper segment (with 'speaker' and 'role' assigned) into a flat export record.
+    Confidence is derived from Whisper's average log probability when it is available.
+    """
+    avg_logprob = seg.get('avg_logprob')
+    confidence = math.exp(avg_logprob) if avg_logprob is not None else None
+    return {
+        "meeting_id": meeting_id,
+        "segment_id": seg.get('id'),
+        "start_time": seg.get('start'),
+        "end_time": seg.get('end'),
+        "speaker": seg.get('speaker', 'Unknown'),
+        "role": seg.get('role', 'Unknown'),
+        "transcript": seg.get('text', '').strip(),
+        "confidence": confidence,
+    }
+
+
+class JsonlSegmentWriter:
+    """
+    Append segment records to a JSONL file, one JSON object per line.
+    Each write is flushed so readers can tail the file while segments are produced.
+    """
+
+    def __init__(self, path, meeting_id=None):
+        self.path = path
+        self.meeting_id = meeting_id
+        self.count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, seg):
+        record = segment_to_record(seg, self.meeting_id)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetSegmentWriter:
+    """
+    Write segment records to a compressed, columnar Parquet file.
+    Records are buffered and written out as one row group every `row_group_size` segments,
+    so memory stays bounded no matter how long the meeting is.
+    Requires pyarrow.
+    """
+
+    def __init__(self, path, meeting_id=None, row_group_size=1000, compression="zstd"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow. Install it with 'pip install pyarrow'.") from e
+        self._pa = pa
+        self.path = path
+        self.meeting_id = meeting_id
+        self.row_group_size = row_group_size
+        self.count = 0
+        self.schema = pa.schema([
+            ("meeting_id", pa.string()),
+            ("segment_id", pa.int64()),
+            ("start_time", pa.float64()),
+            ("end_time", pa.float64()),
+            ("speaker", pa.string()),
+            ("role", pa.string()),
+            ("transcript", pa.string()),
+            ("confidence", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+        self._buffer = {name: [] for name in SEGMENT_FIELDS}
+
+    def write(self, seg):
+        record = segment_to_record(seg, self.meeting_id)
+        if record["meeting_id"] is not None:
+            record["meeting_id"] = str(record["meeting_id"])
+        for name in SEGMENT_FIELDS:
+            self._buffer[name].append(record[name])
+        self.count += 1
+        if len(self._buffer["segment_id"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer["segment_id"]:
+            return
+        table = self._pa.Table.from_pydict(self._buffer, schema=self.schema)
+        self._writer.write_table(table)
+        self._buffer = {name: [] for name in SEGMENT_FIELDS}
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_segment_writers(jsonl_path=None, parquet_path=None, meeting_id=None):
+    """
+    Open the requested export writers. Returns a (possibly empty) list of writers.
+    """
+    writers = []
+    if jsonl_path:
+        writers.append(JsonlSegmentWriter(jsonl_path, meeting_id))
+    if parquet_path:
+        writers.append(ParquetSegmentWriter(parquet_path, meeting_id))
+    return writers
+
+
+def export_segments(segments, jsonl_path=None, parquet_path=None, meeting_id=None):
+    """
+    Export segments to JSONL and/or Parquet. Returns the number of segments written.
+    """
+    writers = open_segment_writers(jsonl_path, parquet_path, meeting_id)
+    count = 0
+    try:
+        for seg in segments:
+            if not seg.get('text', '').strip():
+                continue
+            for writer in writers:
+                writer.write(seg)
+            count += 1
+    finally:
+        for writer in writers:
+            writer.close()
+    for path in (jsonl_path, parquet_path):
+        if path:
+            print(f"Exported {count} segments to {path}")
+    return count
@@ -1,23 +1,119 @@
-def assign_roles(segments):
+class SpeakerStats:
     """
-    Assign roles to speakers using a simple heuristic.
-    In this example, the speaker with the highest number of question marks is designated as "Interviewer".
+    Running per-speaker statistics, updated in O(1) for every segment.
+    """
+    __slots__ = ("speaker", "question_count", "talk_time", "turn_count", "segment_count",
+                 "word_count", "interruption_count")
+
+    def __init__(self, speaker):
+        self.speaker = speaker
+        self.question_count = 0
+        self.talk_time = 0.0
+        self.turn_count = 0
+        self.segment_count = 0
+        self.word_count = 0
+        self.interruption_count = 0
+
+    @property
+    def average_turn_length(self):
+        """Average talk time (seconds) per turn."""
+        return self.talk_time / self.turn_count if self.turn_count else 0.0
+
+    def as_dict(self):
+        return {
+            "speaker": self.speaker,
+            "question_count": self.question_count,
+            "talk_time": self.talk_time,
+            "turn_count": self.turn_count,
+            "segment_count": self.segment_count,
+            "word_count": self.word_count,
+            "interruption_count": self.interruption_count,
+            "average_turn_length": self.average_turn_length,
+        }
+
+
+def question_count_rule(stats):
     """
-    speaker_texts = {}
-    for seg in segments:
+    Default role rule: the speaker with the highest number of question marks is the "Interviewer",
+    everyone else is an "Interviewee". Ties go to the speaker seen first.
+    Takes a dictionary mapping speaker -> SpeakerStats and returns a dictionary mapping speaker -> role.
+    """
+    interviewer = max(stats, key=lambda s: stats[s].question_count) if stats else None
+    roles = {}
+    for speaker, speaker_stats in stats.items():
+        if speaker == interviewer and speaker_stats.question_count > 0:
+            roles[speaker] = "Interviewer"
+        else:
+            roles[speaker] = "Interviewee"
+    return roles
+
+
+class RoleEngine:
+    """
+    Single-pass role feature engine.
+    Feed segments one at a time with update() (streaming) or all at once with assign() (batch);
+    both paths keep the same running statistics, so they produce the same roles.
+    The role rule is any callable taking {speaker: SpeakerStats} and returning {speaker: role}.
+    """
+
+    def __init__(self, rule=question_count_rule):
+        self.rule = rule
+        self.stats = {}
+        self._last_speaker = None
+        self._last_end = None
+
+    def update(self, seg):
+        """Update the running statistics with one segment."""
         speaker = seg.get('speaker', 'Unknown')
         text = seg.get('text', '')
-        speaker_texts[speaker] = speaker_texts.get(speaker, "") + " " + text
-    question_counts = {speaker: text.count('?') for speaker, text in speaker_texts.items()}
-    interviewer = max(question_counts, key=question_counts.get) if question_counts else None
-    
-    for seg in segments:
-        speaker = seg.get('speaker', 'Unknown')
-        if speaker == interviewer and question_counts.get(interviewer, 0) > 0:
-            seg['role'] = "Interviewer"
-        else:
-            seg['role'] = "Interviewee"
-    return segments
+        start = seg.get('start')
+        end = seg.get('end')
+
+        speaker_stats = self.stats.get(speaker)
+        if speaker_stats is None:
+            speaker_stats = self.stats[speaker] = SpeakerStats(speaker)
+
+        speaker_stats.segment_count += 1
+        speaker_stats.question_count += text.count('?')
+        speaker_stats.word_count += len(text.split())
+        if start is not None and end is not None:
+            speaker_stats.talk_time += max(0.0, end - start)
+
+        if speaker != self._last_speaker:
+            speaker_stats.turn_count += 1
+            # Starting before the previous speaker finished counts as an interruption.
+            if (self._last_speaker is not None and start is not None
+                    and self._last_end is not None and start < self._last_end):
+                speaker_stats.interruption_count += 1
+        self._last_speaker = speaker
+        if end is not None:
+            self._last_end = end if self._last_end is None else max(self._last_end, end)
+
+    def roles(self):
+        """Return the current {speaker: role} assignment."""
+        return self.rule(self.stats)
+
+    def role_of(self, speaker):
+        """Return the current role for a single speaker."""
+        return self.roles().get(speaker, "Unknown")
+
+    def assign(self, segments):
+        """Batch mode: update with every segment, then label each segment with its speaker's role."""
+        for seg in segments:
+            self.update(seg)
+        roles = self.roles()
+        for seg in segments:
+            seg['role'] = roles.get(seg.get('speaker', 'Unknown'), "Unknown")
+        return segments
+
+
+def assign_roles(segments, rule=question_count_rule):
+    """
+    Assign roles to speakers using a simple heuristic.
+    By default, the speaker with the highest number of question marks is designated as "Interviewer".
+    Pass a different rule to RoleEngine to use other per-speaker statistics.
+    """
+    return RoleEngine(rule).assign(segments)
 
 def save_formatted_transcript(segments, output_file):
     """
@@ -106,7 +106,14 @@ def cluster_speakers(embeddings, segments, min_speakers=2, max_speakers=5):
             best_score = score
             best_labels = labels
             best_n_clusters = n_clusters
-    
+
+    if best_labels is None:
+        # No clustering into two or more speakers was possible (min_speakers of 1, or fewer
+        # segments than clusters): treat the recording as a single speaker.
+        print("Could not split the speech into two or more speakers; labelling all segments Speaker 1")
+        best_labels = np.zeros(len(segments), dtype=int)
+        best_n_clusters = 1
+
     for i, segment in enumerate(segments):
         if i < len(best_labels):
             segment['speaker'] = f"Speaker {best_labels[i] + 1}"
@@ -20,15 +20,51 @@ def convert_video_to_audio(video_path, audio_path):
         print(f"Error converting video to audio: {e}")
         return False
 
-def transcribe_audio(audio_path, model_name="base"):
+# Length of the pieces the audio is transcribed in when segments are wanted while Whisper runs.
+SEGMENT_CHUNK_SECONDS = int(os.getenv("WHISPER_SEGMENT_CHUNK_SECONDS", "300"))
+
+def _transcribe_with_segment_callback(model, audio_path, on_segments, chunk_seconds=SEGMENT_CHUNK_SECONDS):
+    """
+    Run Whisper over the audio in chunk_seconds pieces and call on_segments(new_segments)
+    after each one. Whisper has no public per-segment callback, so the pieces are separate
+    model.transcribe() calls; each is prompted with the end of the text before it, and their
+    segments are shifted to the position of the piece and numbered as one transcription.
+    Returns a result dictionary like model.transcribe()'s.
+    """
+    audio = whisper.load_audio(audio_path)
+    chunk_samples = chunk_seconds * whisper.audio.SAMPLE_RATE
+    segments, texts, language = [], [], None
+    for start in range(0, len(audio), chunk_samples):
+        offset = start / whisper.audio.SAMPLE_RATE
+        prompt = " ".join(texts)[-200:] or None
+        result = model.transcribe(audio[start:start + chunk_samples], verbose=True, initial_prompt=prompt,
+                                  language=language)
+        language = language or result.get("language")
+        new_segments = []
+        for seg in result.get("segments", []):
+            seg = dict(seg, id=len(segments) + len(new_segments),
+                       seek=seg.get("seek", 0) + start // whisper.audio.HOP_LENGTH,
+                       start=seg["start"] + offset, end=seg["end"] + offset)
+            new_segments.append(seg)
+        segments.extend(new_segments)
+        texts.append(result.get("text", "").strip())
+        if new_segments:
+            on_segments(new_segments)
+    return {"text": " ".join(t for t in texts if t), "segments": segments, "language": language}
+
+def transcribe_audio(audio_path, model_name="base", on_segments=None):
     """
     Transcribe the audio using Whisper.
+    If on_segments is given, the audio is transcribed in pieces and on_segments is called with
+    the segments of each piece as soon as it is decoded.
     Returns the transcription result dictionary.
     """
     try:
         print(f"Loading Whisper model: {model_name}")
         model = whisper.load_model(model_name)
         print("Transcribing audio...")
+        if on_segments is not None:
+            return _transcribe_with_segment_callback(model, audio_path, on_segments)
         result = model.transcribe(audio_path, verbose=True)
         return result
     except Exception as e: